@@ -10,7 +10,8 @@ function Model() {
     this.outgoingMessages = new ParseSubscriber(CHANNEL_NAME_FROM_BOOKSCANNER);
     this.outgoingMessages.subscribe(new ConsoleMessageLoggingSubscriber(CHANNEL_NAME_FROM_BOOKSCANNER));
     this.outgoingMessages.subscribe(new ReloadWhenBookscannerRestarts());
-    this.incomingMessages = new ParsePublisher(CHANNEL_NAME_TO_BOOKSCANNER);
+    subscribeToPushedMessages(this.outgoingMessages);
+    this.incomingMessages = new ParseLogPublisher(CHANNEL_NAME_TO_BOOKSCANNER);
     this.modelClass = Parse.Object.extend(PUBLIC_MODEL_CLASS_NAME);
     this.relations = relationsToStateMachineViews;
     this.createdRelationObjectIdsToStates = {};
@@ -48,6 +49,7 @@ Model.prototype.retrieveModel = function() {
 // It queries the relations of the bookscanner object and updates listeners.
 Model.prototype.modelUpdated = function() {
     var me = this;
+    setCompactSchemas(me.model.get("codec_schemas"));
     forAttr(this.relations, function(attr) {
         me.updateModelRelation(attr);
     });
@@ -42,12 +42,122 @@ function fetchAll() {
     })
 }
 var fetchAllInterval;
+const MILLISECONDS_BETWEEN_FETCHES = 300;
+// While the push server is connected, we only fetch to catch up.
+const MILLISECONDS_BETWEEN_FETCHES_WHILE_PUSHING = 10000;
+// Pushed messages which do not arrive by fetching are forgotten after some time.
+const MILLISECONDS_TO_REMEMBER_PUSHED_MESSAGES = 60000;
+const MAXIMUM_REMEMBERED_PUSHED_MESSAGES = 1000;
+
+function fetchAllEvery(milliseconds) {
+    window.clearInterval(fetchAllInterval);
+    fetchAllInterval = window.setInterval(fetchAll, milliseconds);
+}
 
 function initializeParse() {
-    fetchAllInterval = window.setInterval(fetchAll, 300);
+    fetchAllEvery(MILLISECONDS_BETWEEN_FETCHES);
     Parse.initialize("OpenBookScanner");
     Parse.serverURL = getParseServerURL();
     console.log("Parse server URL is " + Parse.serverURL);
+    connectToPushServer();
+}
+
+/* Decode the messages of the channels, see codec.py.
+ * The book scanner stores the schemas of the compact messages in the model.
+ */
+const COMPACT_MARKER = "~1";
+var compactSchemas = {};
+var waitingForCompactSchemas = []; // functions to call when the schemas change
+
+function setCompactSchemas(schemas) {
+    compactSchemas = schemas || {};
+    var waiting = waitingForCompactSchemas;
+    waitingForCompactSchemas = [];
+    waiting.forEach(function(callback) {
+        callback();
+    });
+}
+
+/* Return the message or null if its schema is not known, yet. */
+function decodeMessage(string) {
+    if (!string.startsWith(COMPACT_MARKER)) {
+        return JSON.parse(string);
+    }
+    var data = JSON.parse(string.substring(COMPACT_MARKER.length));
+    var name = data[0];
+    var payload = data[1];
+    var message = {};
+    if (Array.isArray(payload)) {
+        var schema = compactSchemas[name];
+        if (!schema) {
+            return null;
+        }
+        schema.forEach(function(key, index) {
+            message[key] = payload[index];
+        });
+    } else {
+        forAttr(payload, function(key, value) {
+            message[key] = value;
+        });
+    }
+    message.name = name;
+    message.type = data.length > 2 ? data[2] : "message";
+    return message;
+}
+
+/* The push server sends the messages and updates as they happen.
+ * See push_server.py.
+ */
+const PUSH_SERVER_PORT = 8002;
+var pushIsConnected = false;
+var pushedMessageSubscribers = [];
+
+function getPushServerURL() {
+    return "http://" + (document.location.hostname || "localhost") + ":" + PUSH_SERVER_PORT + "/events";
+}
+
+function connectToPushServer() {
+    if (!window.EventSource) {
+        console.log("No push server support, polling.");
+        return;
+    }
+    var events = new EventSource(getPushServerURL());
+    events.onopen = function() {
+        console.log("Connected to the push server.");
+        pushIsConnected = true;
+        fetchAllEvery(MILLISECONDS_BETWEEN_FETCHES_WHILE_PUSHING);
+        fetchAll(); // catch up with what happened before we connected
+    };
+    events.onerror = function() {
+        if (pushIsConnected) {
+            console.log("Lost the connection to the push server, polling.");
+            pushIsConnected = false;
+            fetchAllEvery(MILLISECONDS_BETWEEN_FETCHES);
+        }
+    };
+    events.addEventListener("update", function(event) {
+        var update = JSON.parse(event.data);
+        fetchObjects.forEach(function(spec) {
+            if (spec.parseObject.id == update.objectId) {
+                forAttr(update.attributes, function(name, value) {
+                    spec.parseObject.set(name, value);
+                });
+                if (spec.onSuccess) {
+                    spec.onSuccess(spec.parseObject);
+                }
+            }
+        });
+    });
+    events.addEventListener("message", function(event) {
+        pushedMessageSubscribers.forEach(function(subscriber) {
+            subscriber.receivePushedMessage(event.data);
+        });
+    });
+}
+
+/* receive the messages pushed by the push server */
+function subscribeToPushedMessages(subscriber) {
+    pushedMessageSubscribers.push(subscriber);
 }
 
 function getParseServerURL() {
@@ -68,6 +178,7 @@ function ParseSubscriber(channelName) {
     this.channel.set("messages", []);
     this.channelName = this.channelClass.className;
     this.subscribers = [];
+    this.pushedMessages = []; // {"message": string, "time": milliseconds} in the order they were pushed
     var me = this;
     this.channel.save(null,{
         "success": function(channel) {
@@ -89,19 +200,62 @@ ParseSubscriber.prototype.delete = function(){
 ParseSubscriber.prototype.changed = function(){
     var me = this;
     var messages = this.channel.get("messages");
+    this.forgetOldPushedMessages();
     try {
         messages.forEach(function(message){
             me.channel.remove("messages", message);
-            me.subscribers.forEach(function(subscriber){
-                var data = JSON.parse(message);
-                subscriber.receiveMessage(data);
-            });
+            if (me.forgetPushedMessage(message)) {
+                // We received this message from the push server already.
+                return;
+            }
+            me.deliverMessage(message);
         });
     } finally {
         me.channel.save();
     }
 }
 
+ParseSubscriber.prototype.receivePushedMessage = function(message){
+    this.pushedMessages.push({"message": message, "time": Date.now()});
+    this.forgetOldPushedMessages();
+    this.deliverMessage(message);
+}
+
+/* Return whether the message was pushed and forget it. */
+ParseSubscriber.prototype.forgetPushedMessage = function(message){
+    var index = this.pushedMessages.findIndex(function(pushed){
+        return pushed.message == message;
+    });
+    if (index == -1) {
+        return false;
+    }
+    this.pushedMessages.splice(index, 1);
+    return true;
+}
+
+ParseSubscriber.prototype.forgetOldPushedMessages = function(){
+    var oldest = Date.now() - MILLISECONDS_TO_REMEMBER_PUSHED_MESSAGES;
+    while (this.pushedMessages.length > MAXIMUM_REMEMBERED_PUSHED_MESSAGES ||
+           (this.pushedMessages.length && this.pushedMessages[0].time < oldest)) {
+        this.pushedMessages.shift();
+    }
+}
+
+ParseSubscriber.prototype.deliverMessage = function(message){
+    var me = this;
+    var data = decodeMessage(message);
+    if (data === null) {
+        console.log("Waiting for the schema of " + message);
+        waitingForCompactSchemas.push(function() {
+            me.deliverMessage(message);
+        });
+        return;
+    }
+    this.subscribers.forEach(function(subscriber){
+        subscriber.receiveMessage(data);
+    });
+}
+
 ParseSubscriber.prototype.subscribe = function(subscriber){
     this.subscribers.push(subscriber);
 }
@@ -150,6 +304,63 @@ ParsePublisher.prototype.deliverMessage = function(message) {
 };
 
 
+const LOG_CLASS_PREFIX = "Log";
+const LOG_COUNTER_CLASS_PREFIX = "LogCounter";
+
+// append messages to the message log of a channel
+function ParseLogPublisher(channelName) {
+    this.channelName = channelName;
+    this.logClass = Parse.Object.extend(LOG_CLASS_PREFIX + channelName);
+    this.counterClass = Parse.Object.extend(LOG_COUNTER_CLASS_PREFIX + channelName);
+    this.counter = null;
+};
+
+// private: get the counter which numbers the messages
+ParseLogPublisher.prototype.getCounter = function(onSuccess) {
+    var me = this;
+    if (this.counter) {
+        onSuccess(this.counter);
+        return;
+    }
+    var query = new Parse.Query(this.counterClass);
+    query.ascending("createdAt");
+    query.first({
+        "success": function(counter) {
+            if (counter) {
+                me.counter = counter;
+                onSuccess(counter);
+                return;
+            }
+            counter = new me.counterClass();
+            counter.set("sequence", 0);
+            counter.save(null, {"success": function(counter) {
+                me.counter = counter;
+                onSuccess(counter);
+            }});
+        }
+    });
+};
+
+ParseLogPublisher.prototype.deliverMessage = function(message) {
+    var me = this;
+    var messageString = JSON.stringify(message);
+    this.getCounter(function(counter) {
+        counter.increment("sequence");
+        counter.save(null, {
+            "success": function(counter) {
+                var entry = new me.logClass();
+                entry.set("sequence", counter.get("sequence"));
+                entry.set("message", messageString);
+                entry.save();
+            },
+            "error": function(counter, error) {
+                console.log("ERROR: could not number the message " + messageString + ": " + error.message);
+            }
+        });
+    });
+};
+
+
 const MESSAGE_TEMPLATES = {
     "test": {"description": "This is a test message not used in production code."},
     "scan": {"description": "Tell a scanner to scan."}
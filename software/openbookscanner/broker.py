@@ -8,27 +8,79 @@ A broker has two responsibilities, as publisher and as subscriber
 
 """
 from parse_rest.datatypes import Object
-import json
-from .update_strategy import OnChangeStrategy
+from parse_rest.query import QueryResourceDoesNotExist
+from .update_strategy import OnChangeStrategy, is_object_not_found, is_transient_error
 from pprint import pprint
-from .message import MessageDispatcher
+from .message import Message, encode_message
+from .codec import default_codec, decode_message
+from collections import deque
+import datetime
+import functools
+import itertools
+import threading
+import time
+
+
+def accepts_message(subscriber, message):
+    """Whether the subscriber needs to receive the message.
+    
+    Subscribers can define accepts_message(message_name) to reject messages.
+    """
+    accepts_message = getattr(subscriber, "accepts_message", None)
+    return accepts_message is None or accepts_message(message["name"])
 
 
 class LocalSubscriber:
-    """This is a local broker which just forwards the messages."""
+    """This is a local broker which just forwards the messages.
+
+    Subscribers can name the messages they want to receive.
+    Then, they are not called for other messages.
+    A subscriber receives each message once even if it subscribed several times.
+
+        broker.subscribe(storage, names=["new_image"])
+    """
 
     def __init__(self):
         """Create a new broker object."""
-        self.subscribers = []
+        # The subscriptions are replaced and not changed so we can deliver
+        # messages while somebody subscribes.
+        self.subscribers = ()
+        self._subscribers_of_all_messages = ()
+        self._subscribers_by_name = {} # message name -> subscribers in order of subscription
+        self._subscription_lock = threading.Lock()
     
-    def subscribe(self, subscriber):
-        """Subscribe to all messages sent over the broker."""
-        self.subscribers.append(subscriber)
+    def subscribe(self, subscriber, names=None):
+        """Subscribe to the messages sent over the broker.
+
+        If names is None, the subscriber receives all messages.
+        Otherwise, it only receives the messages with these names.
+        """
+        with self._subscription_lock:
+            subscribers_by_name = dict(self._subscribers_by_name)
+            if names is None:
+                self._subscribers_of_all_messages += (subscriber,)
+                # The subscriber receives the named messages with all others now.
+                for name, subscribers in subscribers_by_name.items():
+                    subscribers_by_name[name] = tuple(other for other in subscribers if other is not subscriber) + (subscriber,)
+            else:
+                for name in names:
+                    subscribers = subscribers_by_name.get(name, self._subscribers_of_all_messages)
+                    if subscriber not in subscribers:
+                        subscribers_by_name[name] = subscribers + (subscriber,)
+            self._subscribers_by_name = subscribers_by_name
+            self.subscribers += (subscriber,)
+
+    def get_subscribers(self, message_name):
+        """Return the subscribers of the messages with this name."""
+        return self._subscribers_by_name.get(message_name, self._subscribers_of_all_messages)
     
     def deliver_message(self, message):
-        """Send a message to all the subscribers."""
-        for subscriber in list(self.subscribers):
-            subscriber.receive_message(message)
+        """Send a message to the subscribers."""
+        received = set() # ids of the subscribers
+        for subscriber in self.get_subscribers(message["name"]):
+            if id(subscriber) not in received and accepts_message(subscriber, message):
+                received.add(id(subscriber))
+                subscriber.receive_message(message)
     
 
 class LocalBroker(LocalSubscriber):
@@ -38,24 +90,177 @@ class LocalBroker(LocalSubscriber):
         self.deliver_message(message)
 
 
+# What a BufferingBroker does when it is full and a new message arrives
+BLOCK = "block" # wait until the messages are flushed, then remove the oldest message
+DROP_OLDEST = "drop-oldest" # remove the oldest message
+COALESCE = "coalesce" # replace an equal message which waits, else remove the oldest
+
+
+def get_state_machine_key(message):
+    """Return what identifies the state machine of a state_changed message."""
+    state_machine = message["state_machine"]
+    return ("state_changed", state_machine.get("type"), state_machine.get("id"))
+
+
+def add_transition_trail(previous_message, message):
+    """Return the state_changed message with the states of the previous message.
+
+    The "transitions" are the types of the states which the state machine
+    went through before it reached its current state.
+    """
+    trail = list(previous_message.get("transitions", ()))
+    trail.append(previous_message["state_machine"]["state"]["type"])
+    return Message.fromJSON(dict(message, transitions=trail))
+
+
 class BufferingBroker(LocalBroker):
-    """This is a local broker which sends delivers the messages later."""
-    
-    def __init__(self):
+    """This is a local broker which delivers the messages later.
+
+    The messages are delivered in the order in which they arrived.
+    If the messages are not flushed, the buffer fills up to maximum_size
+    and then the overflow_policy decides what happens.
+    With BLOCK, the thread which delivers the message waits at most
+    seconds_to_block for the buffer to be flushed. The thread which flushes
+    the buffer does not wait because it would wait for itself.
+
+    Observers are notified with high_water_mark_reached(broker) when the
+    number of waiting messages reaches the high_water_mark.
+
+    If coalesce_state_changes is set, only the latest state_changed message
+    of each state machine is delivered per flush. With keep_transition_trail,
+    it lists the states which were skipped.
+    """
+
+    maximum_size = 10000
+    overflow_policy = DROP_OLDEST
+    seconds_to_block = 1
+    high_water_mark = 8000
+    coalesce_state_changes = False
+    keep_transition_trail = False
+
+    def __init__(self, maximum_size=None, overflow_policy=None, high_water_mark=None,
+                 coalesce_state_changes=None, keep_transition_trail=None):
         """Create a new broker which saves messages."""
         super().__init__()
-        self.messages = []
-    
+        if coalesce_state_changes is not None:
+            self.coalesce_state_changes = coalesce_state_changes
+        if keep_transition_trail is not None:
+            self.keep_transition_trail = keep_transition_trail
+        if maximum_size is not None:
+            self.maximum_size = maximum_size
+        if overflow_policy is not None:
+            self.overflow_policy = overflow_policy
+        if overflow_policy not in (None, BLOCK, DROP_OLDEST, COALESCE):
+            raise ValueError("Unknown overflow policy {}.".format(repr(overflow_policy)))
+        if high_water_mark is not None:
+            self.high_water_mark = high_water_mark
+        self.messages = deque() # [time, key, message]
+        self._waiting = {} # key -> entry in self.messages
+        self._condition = threading.Condition()
+        self._flushing_thread = None # the thread which flushed last
+        self._high_water_mark_reached = False
+        self.observers = []
+        self.dropped_messages = 0
+        self.coalesced_messages = 0
+        self.delivered_messages = 0
+        self.maximum_depth = 0
+        self.total_latency = 0.0
+        self.maximum_latency = 0.0
+
+    def register_observer(self, observer):
+        """Notify the observer when the buffer fills up."""
+        self.observers.append(observer)
+
+    def get_coalescing_key(self, message):
+        """Return what makes two messages replaceable by each other."""
+        if self.is_coalesced_state_change(message):
+            return get_state_machine_key(message)
+        return encode_message(message)
+
+    def is_coalesced_state_change(self, message):
+        """Whether the message replaces the state_changed message of the same state machine."""
+        return self.coalesce_state_changes and message["name"] == "state_changed"
+
+    def get_depth(self):
+        """Return the number of messages which wait to be delivered."""
+        return len(self.messages)
+
     def deliver_message(self, message):
         """Save the message for receiving later."""
-        self.messages.append(message)
-    
+        with self._condition:
+            is_state_change = self.is_coalesced_state_change(message)
+            key = self.get_coalescing_key(message) if is_state_change or self.overflow_policy == COALESCE else None
+            if is_state_change and key in self._waiting:
+                entry = self._waiting[key]
+                if self.keep_transition_trail:
+                    message = add_transition_trail(entry[2], message)
+                entry[2] = message
+                self.coalesced_messages += 1
+                return
+            block_until = time.time() + self.seconds_to_block
+            while len(self.messages) >= self.maximum_size:
+                if self.overflow_policy == COALESCE and key in self._waiting:
+                    self._waiting[key][2] = message
+                    self.coalesced_messages += 1
+                    return
+                seconds_to_block = block_until - time.time()
+                if self.overflow_policy == BLOCK and self._flushing_thread != threading.current_thread() and \
+                        seconds_to_block > 0:
+                    self._condition.wait(seconds_to_block)
+                    continue
+                self._remove_oldest()
+                self.dropped_messages += 1
+            entry = [time.time(), key, message]
+            self.messages.append(entry)
+            if key is not None:
+                self._waiting[key] = entry
+            depth = len(self.messages)
+            self.maximum_depth = max(self.maximum_depth, depth)
+            notify = depth >= self.high_water_mark and not self._high_water_mark_reached
+            if notify:
+                self._high_water_mark_reached = True
+        if notify:
+            for observer in list(self.observers):
+                observer.high_water_mark_reached(self)
+
+    def _remove_oldest(self):
+        """Remove the oldest message and return its entry. The lock must be held."""
+        entry = self.messages.popleft()
+        key = entry[1]
+        if key is not None and self._waiting.get(key) is entry:
+            del self._waiting[key]
+        self._condition.notify_all()
+        return entry
+
     def flush(self):
-        """Receive all saved messages."""
-        while self.messages:
-            message = self.messages.pop()
+        """Receive all saved messages in the order they arrived."""
+        with self._condition:
+            self._flushing_thread = threading.current_thread()
+        while True:
+            with self._condition:
+                if not self.messages:
+                    self._high_water_mark_reached = False
+                    return
+                enqueued_at, key, message = self._remove_oldest()
+                latency = time.time() - enqueued_at
+                self.delivered_messages += 1
+                self.total_latency += latency
+                self.maximum_latency = max(self.maximum_latency, latency)
             super().deliver_message(message)
 
+    def get_statistics(self):
+        """Return the counters of the buffer."""
+        with self._condition:
+            return {
+                "depth": len(self.messages),
+                "maximum_depth": self.maximum_depth,
+                "maximum_size": self.maximum_size,
+                "dropped": self.dropped_messages,
+                "coalesced": self.coalesced_messages,
+                "delivered": self.delivered_messages,
+                "mean_latency": self.total_latency / self.delivered_messages if self.delivered_messages else None,
+                "maximum_latency": self.maximum_latency}
+
 
 CHANNEL_CLASS_PREFIX = "Channel"
 
@@ -63,20 +268,62 @@ def get_channel_class(channel_name):
     return Object.factory(CHANNEL_CLASS_PREFIX + channel_name)
 
 
+# When a subscriber of this process joins or leaves a channel,
+# the publishers know that their cached subscribers changed.
+_channel_versions = {} # channel name -> version
+_versions = itertools.count(1)
+
+def channel_subscribers_changed(channel_name):
+    """The subscribers of the channel changed."""
+    _channel_versions[channel_name] = next(_versions)
+
+def get_channel_version(channel_name):
+    """Return a number which changes when the subscribers of the channel change."""
+    return _channel_versions.get(channel_name, 0)
+
+
 class ParseSubscriber:
     """A ParseBroker subscribes to all messages sent under ist name."""
 
 
-    def __init__(self, channel_name, update_strategy=OnChangeStrategy()):
-        """Create a parse message subscriber which is subscribed to all messages of a channel."""
+    def __init__(self, channel_name, update_strategy=OnChangeStrategy(), message_holder_id=None):
+        """Create a parse message subscriber which is subscribed to all messages of a channel.
+        
+        If message_holder_id is given, the existing message holder is used,
+        see verify().
+        """
         self.channel_name = channel_name
         self.channel_class = get_channel_class(channel_name)
+        self.subscribers = []
+        self.update_strategy = update_strategy
+        if message_holder_id is None:
+            self._create_message_holder()
+        else:
+            self.message_holder_id = message_holder_id
+
+    def _create_message_holder(self):
+        """Create the object on the parse server which receives the messages."""
         message_holder = self.channel_class()
         message_holder.messages = []
         message_holder.save()
         self.message_holder_id = message_holder.objectId
-        self.subscribers = []
-        self.update_strategy = update_strategy
+        channel_subscribers_changed(self.channel_name)
+
+    def verify(self):
+        """Create a new message holder if it does not exist any more.
+        
+        Return whether the message holder had to be created.
+        """
+        try:
+            self._get_message_holder()
+        except QueryResourceDoesNotExist:
+            self._create_message_holder()
+            return True
+        return False
+
+    def snapshot(self):
+        """Return the id of the message holder to restore after a restart."""
+        return {"message_holder_id": self.message_holder_id}
         
     @property
     def channel(self):
@@ -96,41 +343,362 @@ class ParseSubscriber:
         messages = list(message_holder.messages)
         self.update_strategy.removeFromArray(message_holder, "messages", messages)
         for message in messages:
+            message = decode_message(message)
             for subscriber in self.subscribers:
-                subscriber.receive_message(json.loads(message))
+                if accepts_message(subscriber, message):
+                    subscriber.receive_message(message)
 
     def delete(self):
         """Delete the own objects on the parse server."""
-        self.update_strategy.delete(self._get_message_holder())
+        self.update_strategy.delete(self._get_message_holder(), lambda: channel_subscribers_changed(self.channel_name))
 
 
 class ParsePublisher:
-    """This class publishes messages on a specific channel."""
+    """This class publishes messages on a specific channel.
+    
+    The message holders of the subscribers are cached.
+    They are queried again after seconds_between_refreshes
+    or when a subscriber of this process joins or leaves the channel.
+    Message holders which were deleted are removed from the cache
+    when the messages can not be added to them.
+    If the Parse server can not be reached, the cached message holders
+    are used until the next query succeeds.
+    """
+    
+    seconds_between_refreshes = 2
+    codec = default_codec
 
-    def __init__(self, channel_name, update_strategy=OnChangeStrategy()):
-        """Create a new publisher and publish messages on a channel."""
-        self.message_holder_class = Object.factory(CHANNEL_CLASS_PREFIX + channel_name)
+    def __init__(self, channel_name, update_strategy=OnChangeStrategy(), codec=None):
+        """Create a new publisher and publish messages on a channel.
+        
+        The codec encodes the messages, see the codec module.
+        """
+        self.channel_name = channel_name
+        if codec is not None:
+            self.codec = codec
+        self.message_holder_class = get_channel_class(channel_name)
         self.update_strategy = update_strategy
+        self.invalidate_subscribers()
+    
+    def invalidate_subscribers(self):
+        """Query the subscribers again before the next message is delivered."""
+        self._subscribers = None
+        self._subscribers_version = None
+        self._subscribers_refreshed_at = None
+    
+    def get_subscribers(self):
+        """Return the message holders of the subscribers on the channel."""
+        version = get_channel_version(self.channel_name)
+        now = time.time()
+        if self._subscribers is None or version != self._subscribers_version or \
+                now - self._subscribers_refreshed_at >= self.seconds_between_refreshes:
+            try:
+                subscribers = list(self.message_holder_class.Query.all())
+            except Exception as error:
+                if not is_transient_error(error):
+                    raise
+                print("Could not query the subscribers of {}: {}".format(self.channel_name, error))
+                return self._subscribers or []
+            self._subscribers = subscribers
+            self._subscribers_version = version
+            self._subscribers_refreshed_at = now
+        return self._subscribers
     
     def deliver_message(self, message):
         """Deliver a message to all Subscribers on a channel."""
-        message = json.dumps(message)
-        for subscriber in self.message_holder_class.Query.all():
+        message = self.codec.encode_cached(message)
+        for subscriber in self.get_subscribers():
 #            print("deliver", message, "to", subscriber)
-            self.update_strategy.addToArray(subscriber, "messages", [message])
+            self.update_strategy.addToArray(subscriber, "messages", [message],
+                                            error_callback=functools.partial(self.delivery_failed, subscriber))
+    
+    def delivery_failed(self, message_holder, error):
+        """The message could not be added to the message holder.
+        
+        If the message holder was deleted, it does not receive messages any more.
+        """
+        if is_object_not_found(error):
+            subscribers = self._subscribers
+            if subscribers is not None:
+                self._subscribers = [subscriber for subscriber in subscribers if subscriber is not message_holder]
+        else:
+            print("Could not deliver a message to {}: {}".format(message_holder, error))
+    
+    def receive_message(self, message):
+        """When a publisher receives the message, it delivers it."""
+        self.deliver_message(message)
+
+
+LOG_CLASS_PREFIX = "Log"
+LOG_COUNTER_CLASS_PREFIX = "LogCounter"
+LOG_CURSOR_CLASS_PREFIX = "LogCursor"
+
+def get_log_class(channel_name):
+    """Return the class of the entries in the message log of a channel."""
+    return Object.factory(LOG_CLASS_PREFIX + channel_name)
+
+def get_log_counter_class(channel_name):
+    """Return the class of the counter which numbers the messages of a channel."""
+    return Object.factory(LOG_COUNTER_CLASS_PREFIX + channel_name)
+
+def get_log_cursor_class(channel_name):
+    """Return the class of the cursors of the subscribers of a channel."""
+    return Object.factory(LOG_CURSOR_CLASS_PREFIX + channel_name)
+
+
+class MessageLog:
+    """The log of the messages on a channel.
+    
+    Each message is a parse object with a sequence number.
+    The sequence numbers are reserved by incrementing a counter object.
+    The subscribers save their cursors so that the entries which all of
+    them received can be deleted.
+    """
+    
+    def __init__(self, channel_name):
+        """Create the log for a channel."""
+        self.channel_name = channel_name
+        self.log_class = get_log_class(channel_name)
+        self.counter_class = get_log_counter_class(channel_name)
+        self.cursor_class = get_log_cursor_class(channel_name)
+        self._counter = None
+    
+    def get_counter(self):
+        """Return the counter of the channel and create it if needed."""
+        if self._counter is None:
+            counters = list(self.counter_class.Query.all().order_by("createdAt").limit(1))
+            if counters:
+                self._counter = counters[0]
+            else:
+                self._counter = self.counter_class(sequence=0)
+                self._counter.save()
+        return self._counter
+    
+    def get_last_sequence_number(self):
+        """Return the sequence number of the last message which was reserved."""
+        counter = self.counter_class.Query.get(objectId=self.get_counter().objectId)
+        return counter.sequence
+    
+    def reserve_sequence_number(self, update_strategy, callback):
+        """Call callback(sequence_number) with a number which no other message has.
+        
+        The numbers of a batch are reserved with one request.
+        """
+        update_strategy.increment(self.get_counter(), "sequence", 1, callback)
+    
+    def new_entry(self, sequence_number, encoded_message):
+        """Return a new unsaved entry with the message."""
+        return self.log_class(sequence=sequence_number, message=encoded_message)
+    
+    def get_entries_after(self, sequence_number, limit):
+        """Return the entries after the sequence number ordered by their sequence number."""
+        return list(self.log_class.Query.filter(sequence__gt=sequence_number).order_by("sequence").limit(limit))
+    
+    def get_entries_until(self, sequence_number, limit):
+        """Return entries up to the sequence number."""
+        return list(self.log_class.Query.filter(sequence__lte=sequence_number).limit(limit))
+    
+    def new_cursor(self, sequence_number):
+        """Return a new unsaved cursor at the sequence number."""
+        return self.cursor_class(sequence=sequence_number)
+    
+    def get_cursors(self):
+        """Return the saved cursors of the subscribers."""
+        return list(self.cursor_class.Query.all())
+
+
+class ParseLogPublisher:
+    """Publish messages to the message log of a channel."""
+    
+    codec = default_codec
+    
+    def __init__(self, channel_name, update_strategy=OnChangeStrategy(), codec=None):
+        """Create a new publisher which appends the messages to the log of the channel."""
+        self.channel_name = channel_name
+        if codec is not None:
+            self.codec = codec
+        self.log = MessageLog(channel_name)
+        self.update_strategy = update_strategy
+    
+    def deliver_message(self, message):
+        """Append the message to the log."""
+        encoded_message = self.codec.encode_cached(message)
+        self.log.reserve_sequence_number(self.update_strategy, functools.partial(self._save_entry, encoded_message))
+    
+    def _save_entry(self, encoded_message, sequence_number):
+        """Save the message under its sequence number."""
+        self.update_strategy.save(self.log.new_entry(sequence_number, encoded_message))
     
     def receive_message(self, message):
         """When a publisher receives the message, it delivers it."""
         self.deliver_message(message)
 
 
+class ParseLogSubscriber:
+    """Read the messages from the message log of a channel.
+    
+    The cursor is the sequence number of the last message we received.
+    A flush is one query for the messages after the cursor.
+    The cursor only advances over messages without gaps so each message
+    is received once and in order.
+    A gap is left by a publisher which reserved a sequence number
+    but did not save the message, yet.
+    If the gap is not filled after seconds_to_wait_for_a_gap, it is skipped.
+    
+    The cursor is saved in the log at least every seconds_between_cursor_saves.
+    After the cursor advanced by trim_after_messages, the entries up to the
+    lowest cursor are deleted. The cursors of subscribers which did not save
+    them for seconds_until_a_cursor_is_forgotten are deleted, too.
+    """
+    
+    page_size = 100
+    seconds_to_wait_for_a_gap = 5
+    seconds_between_cursor_saves = 60
+    trim_after_messages = 1000
+    seconds_until_a_cursor_is_forgotten = 24 * 60 * 60
+    
+    def __init__(self, channel_name, update_strategy=OnChangeStrategy(), cursor=None):
+        """Subscribe to the messages on a channel.
+        
+        If the cursor is None, we receive the messages sent from now on.
+        """
+        self.channel_name = channel_name
+        self.log = MessageLog(channel_name)
+        self.update_strategy = update_strategy
+        self.subscribers = []
+        self.cursor = self.log.get_last_sequence_number() if cursor is None else cursor
+        self._gap_since = None
+        self._cursor_object = None
+        self._cursor_saved_at = None
+        self._trimmed_at = self.cursor
+    
+    @property
+    def channel(self):
+        """The name of the channel we listen to."""
+        return self.channel_name
+    
+    def subscribe(self, subscriber):
+        """Subscribe to all messages sent over the broker."""
+        self.subscribers.append(subscriber)
+    
+    def flush(self):
+        """Receive the messages after the cursor and trim the log."""
+        self.receive_messages()
+        self.save_cursor()
+        if self.cursor - self._trimmed_at >= self.trim_after_messages:
+            self.trim()
+    
+    def receive_messages(self):
+        """Receive the messages after the cursor."""
+        while True:
+            entries = self.log.get_entries_after(self.cursor, self.page_size)
+            for entry in entries:
+                if entry.sequence != self.cursor + 1 and not self._skip_gap():
+                    return
+                self._gap_since = None
+                self.cursor = entry.sequence
+                self.receive_message(decode_message(entry.message))
+            if len(entries) < self.page_size:
+                return
+    
+    def save_cursor(self):
+        """Save the cursor in the log if it moved or was saved a while ago."""
+        now = time.time()
+        if self._cursor_object is None:
+            self._cursor_object = self.log.new_cursor(self.cursor)
+        elif self._cursor_object.sequence == self.cursor and \
+                now - self._cursor_saved_at < self.seconds_between_cursor_saves:
+            return
+        self._cursor_object.sequence = self.cursor
+        self._cursor_saved_at = now
+        self.update_strategy.saveAttributes(self._cursor_object, ["sequence"])
+    
+    def trim(self):
+        """Delete a page of the entries which all subscribers received."""
+        forget_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.seconds_until_a_cursor_is_forgotten)
+        lowest = self.cursor
+        for cursor in self.log.get_cursors():
+            if cursor.updatedAt < forget_before:
+                self.update_strategy.delete(cursor)
+            else:
+                lowest = min(lowest, cursor.sequence)
+        # The deletions may wait in a batch, the next flush deletes the next page.
+        entries = self.log.get_entries_until(lowest, self.page_size)
+        for entry in entries:
+            self.update_strategy.delete(entry)
+        if len(entries) < self.page_size:
+            self._trimmed_at = self.cursor
+    
+    def _skip_gap(self):
+        """Return whether we waited long enough for a missing message."""
+        now = time.time()
+        if self._gap_since is None:
+            self._gap_since = now
+        return now - self._gap_since >= self.seconds_to_wait_for_a_gap
+    
+    def receive_message(self, message):
+        """Send the message to the subscribers."""
+        for subscriber in self.subscribers:
+            if accepts_message(subscriber, message):
+                subscriber.receive_message(message)
+    
+    def verify(self):
+        """Start from the end of the log if it was reset.
+        
+        Return whether the cursor was moved.
+        """
+        last = self.log.get_last_sequence_number()
+        if self.cursor > last:
+            self.cursor = last
+            return True
+        return False
+    
+    def snapshot(self):
+        """Return the cursor to continue from after a restart."""
+        return {"cursor": self.cursor}
+    
+    def delete(self):
+        """Delete the saved cursor, the log is shared."""
+        if self._cursor_object is not None:
+            self.update_strategy.delete(self._cursor_object)
+            self._cursor_object = None
+
+
+class ParseTransport:
+    """Create publishers and subscribers which use the message log on the Parse server."""
+    
+    def __init__(self, update_strategy=OnChangeStrategy()):
+        """Create a new transport which saves with the update strategy."""
+        self.update_strategy = update_strategy
+    
+    def create_publisher(self, channel_name):
+        """Return a new publisher for the channel."""
+        return ParseLogPublisher(channel_name, self.update_strategy)
+    
+    def create_subscriber(self, channel_name):
+        """Return a new subscriber for the channel."""
+        return ParseLogSubscriber(channel_name, self.update_strategy)
+    
+    def __repr__(self):
+        """String representation."""
+        return "{}({})".format(self.__class__.__name__, self.update_strategy)
+
+
 class ParseBroker:
-    """This is a parse broker which can send and receive on a channel."""
+    """This is a parse broker which can send and receive on a channel.
+    
+    The transport creates the publisher and the subscriber of the channel.
+    By default, the messages go through the message log on the Parse server.
+    The local_transport module has a transport for clients on the same computer.
+    """
 
-    def __init__(self, channel_name, update_strategy=OnChangeStrategy()):
+    def __init__(self, channel_name, update_strategy=OnChangeStrategy(), transport=None):
         """Create a new ParseBroker for messages delivering and receiving on the channel."""
-        self.publisher = ParsePublisher(channel_name, update_strategy)
-        self.subscriber = ParseSubscriber(channel_name, update_strategy)
+        if transport is None:
+            transport = ParseTransport(update_strategy)
+        self.transport = transport
+        self.publisher = transport.create_publisher(channel_name)
+        self.subscriber = transport.create_subscriber(channel_name)
     
     def subscribe(self, subscriber):
         """Subscribe to the brokers messages."""
@@ -148,6 +716,9 @@ class ParseBroker:
     def delete(self):
         """Delete the own objects on the parse server."""
         self.subscriber.delete()
+        delete = getattr(self.publisher, "delete", None)
+        if delete is not None:
+            delete()
 
 
 class MessagePrintingSubscriber:
@@ -2,7 +2,8 @@
 Run the main program controlling the book scanner.
 """
 from .model import OpenBookScanner
-from .broker import ParseSubscriber, MessagePrintingSubscriber, ParsePublisher
+from .broker import ParseSubscriber, MessagePrintingSubscriber, ParseTransport
+from .local_transport import LocalSocketTransport
 from pprint import pprint
 import time
 from parse_rest.connection import register
@@ -10,45 +11,86 @@ from pprint import pprint
 from .message import message
 import click
 from .update_strategy import BatchStrategy
+from .states import worker_pool
+from .states.instrumentation import enable_instrumentation
+from .snapshot import SnapshotFile
+from .journal import Journal
+from .codec import codecs, get_codec
+from .connection_pool import ConnectionPool, install_connection_pool
+from .push_server import PushServer
 
 APPLICATION_ID = "OpenBookScanner"
 
 
 @click.group()
-def cli():
+@click.option("--connections", type=int, default=4,
+                help="The number of connections to the Parse server which are kept open.")
+@click.option("--timeout", type=float, default=60,
+                help="The number of seconds to wait for the Parse server.")
+def cli(connections, timeout):
     """OpenBookScanner
     
     This command line interface can control the book scanner.
     
     You can find the commands below and use --help behind a command to get more information about it.
     """
+    install_connection_pool(ConnectionPool(connections, timeout))
 
 @cli.command()
 @click.option("--print-messages", type=bool, default=False,
                 help="Print the messages of the message broker.")
-def run(print_messages):
+@click.option("--workers", type=int, default=worker_pool.DEFAULT_NUMBER_OF_WORKERS,
+                help="The number of threads which run the states in parallel.")
+@click.option("--statistics", type=float, default=0,
+                help="Print the time spent in the states every STATISTICS seconds.")
+@click.option("--snapshot", type=click.Path(dir_okay=False), default=None,
+                help="Save the state in this file and restore it on start.")
+@click.option("--local", is_flag=True, default=False,
+                help="Also exchange messages with clients on this computer.")
+@click.option("--codec", type=click.Choice(sorted(codecs)), default="json",
+                help="Encode the outgoing messages with this codec.")
+@click.option("--journal", type=click.Path(dir_okay=False), default=None,
+                help="Keep the requests to the Parse server in this file until they are sent.")
+@click.option("--push-host", type=str, default=None,
+                help="Push the events to web clients which connect to this host, e.g. 127.0.0.1 or 0.0.0.0.")
+def run(print_messages, workers, statistics, snapshot, local, codec, journal, push_host):
     """Run the book scanner."""
+    worker_pool.set_number_of_workers(workers)
+    if statistics > 0:
+        enable_instrumentation().print_periodically(statistics)
     register(APPLICATION_ID, "OpenBookScanner")
-    openbookscanner = OpenBookScanner()
+    snapshot_file = None if snapshot is None else SnapshotFile(snapshot)
+    OpenBookScanner.outgoing_codec = get_codec(codec)
+    if journal is not None:
+        OpenBookScanner.journal = Journal(journal)
+    openbookscanner = OpenBookScanner(None if snapshot_file is None else snapshot_file.load())
+    if local:
+        openbookscanner.open_local_channels(LocalSocketTransport())
+    if push_host is not None:
+        openbookscanner.open_push_server(PushServer(codec=openbookscanner.outgoing_codec, host=push_host))
     if print_messages:
         openbookscanner.print_messages()
-    openbookscanner.run()
+    openbookscanner.run(snapshot_file)
 
 
 @cli.command()
 @click.argument("channel", type=str, nargs=-1)
-def receive(channel):
+@click.option("--local", is_flag=True, default=False,
+                help="Listen to the book scanner on this computer instead of the Parse server.")
+def receive(channel, local):
     """Only listen to the book scanner.
     
-    These channels exist:
-    "OpenBookScanner" is the channel for the book scanner messages. This is the default one.
-    "OpenBookScannerStateChanges" is the channel for state changes.
+    By default, this listens to "OpenBookScannerOutgoing", the messages of the book scanner.
     """
-    register(APPLICATION_ID, "MessageListener")
-    channels = channel or [OpenBookScanner.public_channel_name]
+    channels = channel or [OpenBookScanner.public_channel_name_outgoing]
     click.echo("Listening to channel"+ ("s" if len(channels) > 1 else "") + " \"" + ", ".join(channels) + "\".")
     update = BatchStrategy()
-    subscribers = [ParseSubscriber(channel, update) for channel in channels]
+    if local:
+        transport = LocalSocketTransport()
+        subscribers = [transport.create_subscriber(channel) for channel in channels]
+    else:
+        register(APPLICATION_ID, "MessageListener")
+        subscribers = [ParseSubscriber(channel, update) for channel in channels]
     try:
         for subscriber in subscribers:
             subscriber.subscribe(MessagePrintingSubscriber(subscriber.channel))
@@ -58,23 +100,29 @@ def receive(channel):
                 subscriber.flush()
             update.batch()
     finally:
-        subscriber.delete()
+        for subscriber in subscribers:
+            subscriber.delete()
 
 
 @cli.command()
 @click.argument("channel", type=str, nargs=-1)
-def send(channel):
+@click.option("--local", is_flag=True, default=False,
+                help="Send to the book scanner on this computer instead of the Parse server.")
+def send(channel, local):
     """Send messages to the message bus.
     
-    These channels exist:
-    "OpenBookScanner" is the channel for the book scanner messages. This is the default one.
-    "OpenBookScannerStateChanges" is the channel for state changes.
+    The messages are appended to the message log of the channels.
+    By default, they are sent to the book scanner on "OpenBookScannerIncoming".
     """
-    register(APPLICATION_ID, "MessageSender")
-    channels = channel or [OpenBookScanner.public_channel_name]
+    channels = channel or [OpenBookScanner.public_channel_name_incoming]
     click.echo("Writing to channel"+ ("s" if len(channels) > 1 else "") + " \"" + ", ".join(channels) + "\".")
     update = BatchStrategy()
-    publishers = [ParsePublisher(c, update) for c in channels]
+    if local:
+        transport = LocalSocketTransport()
+    else:
+        register(APPLICATION_ID, "MessageSender")
+        transport = ParseTransport(update)
+    publishers = [transport.create_publisher(c) for c in channels]
     
     while True:
         print("----  Send Message  ----")
@@ -0,0 +1,152 @@
+"""This module converts messages to strings and back for the Parse channels.
+
+The channels store the messages as strings in a Parse array.
+A codec has a name and these methods:
+
+- encode(message) returns the string of a Message or a dict.
+- decode(string) returns the Message.
+
+decode_message() recognizes the codec which encoded a string by its marker,
+so publishers can change their codec without breaking the subscribers.
+
+    publisher = ParsePublisher(channel_name, codec=get_codec("compact"))
+
+These codecs exist:
+
+- "json" is the standard library JSON. The web client understands it.
+- "fast-json" uses orjson if it is installed and is the same JSON otherwise.
+- "compact" leaves out the keys of messages with a known schema.
+
+The web client reads the schemas from the attribute "codec_schemas" of the
+model, see get_schemas().
+"""
+from .message import Message, encode_message
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONCodec:
+    """Encode messages as JSON objects."""
+
+    name = "json"
+
+    def encode(self, message):
+        """Return the JSON string of the message."""
+        return encode_message(message)
+
+    def decode(self, string):
+        """Return the message of a JSON string."""
+        return Message.decode(string)
+
+    def encode_cached(self, message):
+        """Encode the message only once even if it is sent several times."""
+        if isinstance(message, Message):
+            return message.get_encoding(self)
+        return self.encode(message)
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "<{} {}>".format(self.__class__.__name__, self.name)
+
+
+class FastJSONCodec(JSONCodec):
+    """Encode messages as JSON with orjson if it is installed."""
+
+    name = "fast-json"
+    is_fast = orjson is not None
+
+    def encode(self, message):
+        """Return the JSON string of the message."""
+        if not self.is_fast:
+            return super().encode(message)
+        json = message.toJSON() if isinstance(message, Message) else message
+        return orjson.dumps(json).decode("UTF-8")
+
+    def decode(self, string):
+        """Return the message of a JSON string."""
+        if not self.is_fast:
+            return super().decode(string)
+        message = Message.fromJSON(orjson.loads(string))
+        message._json = string
+        return message
+
+
+COMPACT_MARKER = "~1"
+
+# message name -> names of the payload values in the order they are sent
+schemas = {
+    "state_changed": ("state_machine",),
+    "new_book_scanner_server": ("id",),
+}
+
+
+def register_schema(message_name, keys):
+    """Send the payload of these messages as a list of the values of the keys."""
+    schemas[message_name] = tuple(keys)
+
+
+def get_schemas():
+    """Return the schemas as JSON for the clients which decode compact messages."""
+    return {name: list(keys) for name, keys in schemas.items()}
+
+
+class CompactCodec(JSONCodec):
+    """Encode messages as short JSON arrays.
+
+    A message is encoded as the marker followed by [name, payload] or
+    [name, payload, type] if the type is not "message".
+    If the payload has exactly the keys of the schema of the message,
+    it is a list of their values.
+    """
+
+    name = "compact"
+    marker = COMPACT_MARKER
+
+    def encode(self, message):
+        """Return the compact string of the message."""
+        if isinstance(message, Message):
+            name, type, payload = message.name, message.type, message.payload
+        else:
+            payload = dict(message)
+            name = payload.pop("name")
+            type = payload.pop("type", "message")
+            payload.pop("description", None)
+        schema = schemas.get(name)
+        if schema is not None and len(schema) == len(payload) and all(key in payload for key in schema):
+            payload = [payload[key] for key in schema]
+        data = [name, payload] if type == "message" else [name, payload, type]
+        return self.marker + json.dumps(data, separators=(",", ":"))
+
+    def decode(self, string):
+        """Return the message of the compact string."""
+        if not string.startswith(self.marker):
+            raise ValueError("{} does not start with {}.".format(repr(string[:10]), repr(self.marker)))
+        data = json.loads(string[len(self.marker):])
+        name, payload = data[0], data[1]
+        type = data[2] if len(data) > 2 else "message"
+        if isinstance(payload, list):
+            payload = dict(zip(schemas[name], payload))
+        return Message(name, payload, type)
+
+
+codecs = {codec.name: codec for codec in [JSONCodec(), FastJSONCodec(), CompactCodec()]}
+default_codec = codecs["json"]
+
+
+def get_codec(name):
+    """Return the codec with the name."""
+    codec = codecs.get(name)
+    if codec is None:
+        raise ValueError("Unknown codec {}, choose one of {}.".format(repr(name), ", ".join(sorted(codecs))))
+    return codec
+
+
+def decode_message(string):
+    """Return the message of a string encoded by any of the codecs."""
+    if string.startswith(COMPACT_MARKER):
+        return codecs["compact"].decode(string)
+    return codecs["fast-json"].decode(string)
@@ -0,0 +1,211 @@
+"""This module keeps the HTTP connections to the Parse server open.
+
+parse_rest opens a new connection for each request with urlopen().
+A ConnectionPool replaces urlopen() in parse_rest and reuses the connections.
+
+    pool = install_connection_pool(ConnectionPool(maximum_connections_per_host=4))
+    ...
+    print(pool.toJSON())
+
+The pool measures the time each request takes.
+"""
+from .states.instrumentation import Histogram
+from http.client import HTTPConnection, HTTPSConnection, HTTPException, RemoteDisconnected
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request
+import io
+import parse_rest.connection
+import socket
+import threading
+import time
+
+
+class PooledResponse:
+    """The response of a request which has been read completely.
+
+    It has the methods of the response of urlopen() which parse_rest uses.
+    """
+
+    def __init__(self, url, status, reason, headers, body):
+        """Create a new response."""
+        self.url = url
+        self.status = self.code = status
+        self.reason = self.msg = reason
+        self.headers = headers
+        self._body = io.BytesIO(body)
+
+    def read(self, *args):
+        """Return the body."""
+        return self._body.read(*args)
+
+    def getcode(self):
+        """Return the HTTP status code."""
+        return self.status
+
+    def geturl(self):
+        """Return the URL of the request."""
+        return self.url
+
+    def info(self):
+        """Return the headers."""
+        return self.headers
+
+    def close(self):
+        """The connection is already back in the pool."""
+
+
+class ConnectionPool:
+    """Reuse HTTP connections for the requests of parse_rest.
+
+    At most maximum_connections_per_host idle connections are kept per host.
+    More requests can run in parallel, their connections are closed afterwards.
+    """
+
+    connection_classes = {"http": HTTPConnection, "https": HTTPSConnection}
+
+    # These requests can be sent again if the server closes the connection
+    # without a response, see RFC 7231, 4.2.2. PUT is left out because
+    # Parse updates with PUT can increment numbers and add to arrays.
+    idempotent_methods = frozenset(["GET", "HEAD", "DELETE", "OPTIONS", "TRACE"])
+
+    def __init__(self, maximum_connections_per_host=4, timeout=60, clock=time.perf_counter):
+        """Create a new pool without connections.
+
+        timeout is the default time in seconds to wait for the server.
+        """
+        self.maximum_connections_per_host = maximum_connections_per_host
+        self.timeout = timeout
+        self.clock = clock
+        self._idle = {} # (scheme, host, port) -> [connection]
+        self._lock = threading.Lock()
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.latency = {} # method -> Histogram
+
+    def _get_connection(self, key, timeout):
+        """Return an idle connection or a new one and whether it was used before."""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused_connections += 1
+                return idle.pop(), True
+            self.new_connections += 1
+        scheme, host, port = key
+        return self.connection_classes[scheme](host, port, timeout=timeout), False
+
+    def _put_connection(self, key, connection):
+        """Keep the connection for the next request or close it."""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maximum_connections_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def urlopen(self, request, data=None, timeout=None):
+        """Send the urllib request and return the response.
+
+        This raises the same errors as urllib.request.urlopen().
+        """
+        if isinstance(request, str):
+            request = Request(request, data)
+        elif data is not None:
+            request.data = data
+        if timeout is None:
+            timeout = self.timeout
+        url = urlsplit(request.full_url)
+        if url.scheme not in self.connection_classes:
+            raise URLError("unknown url type: {}".format(url.scheme))
+        key = (url.scheme, url.hostname, url.port)
+        path = url.path or "/"
+        if url.query:
+            path += "?" + url.query
+        method = request.get_method()
+        headers = dict(request.header_items())
+        headers.setdefault("Connection", "keep-alive")
+        started = self.clock()
+        while True:
+            connection, was_used = self._get_connection(key, timeout)
+            try:
+                if was_used:
+                    connection.timeout = timeout
+                    if connection.sock is not None:
+                        connection.sock.settimeout(timeout)
+                connection.request(method, path, request.data, headers)
+            except (HTTPException, OSError) as error:
+                connection.close()
+                if was_used and not isinstance(error, socket.timeout):
+                    # The server closed the connection while it was idle.
+                    # The request did not reach it.
+                    continue
+                raise URLError(error)
+            try:
+                response = connection.getresponse()
+                body = response.read()
+            except (HTTPException, OSError) as error:
+                connection.close()
+                if was_used and isinstance(error, RemoteDisconnected) and method in self.idempotent_methods:
+                    # The server closed the idle connection, most likely without
+                    # reading the request. If it did read it, sending it again
+                    # has the same effect.
+                    continue
+                # The server may have received the request.
+                # It is not sent again because it can change data, like POST /batch.
+                raise URLError(error)
+            break
+        if response.will_close:
+            connection.close()
+        else:
+            self._put_connection(key, connection)
+        self._record_latency(method, self.clock() - started)
+        if response.status >= 400:
+            raise HTTPError(request.full_url, response.status, response.reason, response.msg, io.BytesIO(body))
+        return PooledResponse(request.full_url, response.status, response.reason, response.msg, body)
+
+    def _record_latency(self, method, seconds):
+        """Record how long a request took."""
+        with self._lock:
+            histogram = self.latency.get(method)
+            if histogram is None:
+                histogram = self.latency[method] = Histogram()
+            histogram.add(seconds)
+
+    def get_number_of_idle_connections(self):
+        """Return the number of open connections which wait for a request."""
+        with self._lock:
+            return sum(map(len, self._idle.values()))
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def toJSON(self):
+        """Return the metrics of the pool."""
+        with self._lock:
+            return {"type": self.__class__.__name__,
+                    "new_connections": self.new_connections,
+                    "reused_connections": self.reused_connections,
+                    "idle_connections": sum(map(len, self._idle.values())),
+                    "latency": {method: histogram.toJSON() for method, histogram in sorted(self.latency.items())}}
+
+
+_original_urlopen = parse_rest.connection.urlopen
+
+
+def install_connection_pool(pool=None):
+    """Send all requests of parse_rest through the pool and return it."""
+    if pool is None:
+        pool = ConnectionPool()
+    parse_rest.connection.urlopen = pool.urlopen
+    return pool
+
+
+def uninstall_connection_pool():
+    """Open a new connection for each request of parse_rest again."""
+    parse_rest.connection.urlopen = _original_urlopen
@@ -5,14 +5,21 @@ from .message import MessageDispatcher, message
 from openbookscanner.broker import LocalSubscriber
 import tempfile
 from .file_server import NullFileServer
+from .versioned_json import VersionedJSON, get_json
 from flask import send_file
 import os
 import shutil
 import subprocess
+from .states.asynchronous import run_subprocess, get_event_loop, is_in_loop_thread
+import asyncio
 
 
-class Image:
-    """This is an image to the user's liking."""
+class Image(VersionedJSON):
+    """This is an image to the user's liking.
+    
+    The JSON is cached until the image is copied or served.
+    It contains the state of the scanner when the JSON was first requested.
+    """
     
     def __init__(self, scanner, path, mime_type, reference):
         """Create a new image."""
@@ -37,6 +44,7 @@ class Image:
     def served_by(self, server):
         """This image is served by a server."""
         self.server = server
+        self.json_changed()
     
     def flask_send_file(self):
         """Send this as a response of a flask server."""
@@ -53,11 +61,39 @@ class Image:
         """Store at the other location."""
         shutil.copy(self.path, path)
         self.paths.append(path)
+        self.json_changed()
         
     def __repr__(self):
         """Return a string representation."""
         return "<{} at {}>".format(self.__class__.__name__, " and ".join(self.paths))
 
+    def snapshot(self):
+        """Return what is needed to restore the image after a restart."""
+        return {"paths": self.paths, "mime_type": self.mime_type,
+                "scanner": get_json(self.scanner)}
+
+    @classmethod
+    def fromSnapshot(cls, snapshot):
+        """Return the image of the snapshot or None if its files are gone."""
+        paths = [path for path in snapshot["paths"] if os.path.isfile(path)]
+        if not paths:
+            return None
+        image = cls(ScannerDescription(snapshot["scanner"]), paths[0], snapshot["mime_type"], None)
+        image.paths = paths
+        return image
+
+
+class ScannerDescription:
+    """This stands in for the scanner of a restored image."""
+
+    def __init__(self, json):
+        """Describe the scanner by its JSON."""
+        self.json = json
+
+    def toJSON(self):
+        """Return the JSON of the scanner when the image was scanned."""
+        return self.json
+
 
 class ConvertCommand:
     """Convert images using the convert command."""
@@ -75,6 +111,19 @@ class ConvertCommand:
         return Image(scan.get_scanner(), jpg_image, self.mime_type, directory)
 
 
+class AsyncConvertCommand(ConvertCommand):
+    """Convert images using the convert command without blocking the event loop."""
+
+    async def convert_scan_to_image(self, scan):
+        """Convert a scan and return an image."""
+        directory = tempfile.TemporaryDirectory()
+        jpg_image = os.path.join(directory.name, "scan" + self.file_ending)
+        command = ["convert", scan.get_path(), jpg_image]
+        p = await run_subprocess(command)
+        p.check_returncode()
+        return Image(scan.get_scanner(), jpg_image, self.mime_type, directory)
+
+
 class Converter(MessageDispatcher, LocalSubscriber):
     """Convert images in different ways."""
     
@@ -90,5 +139,27 @@ class Converter(MessageDispatcher, LocalSubscriber):
     # TODO: configure conversion
 
 
+class AsyncConverter(Converter):
+    """Convert images on the event loop."""
+
+    def __init__(self, loop=None):
+        super().__init__()
+        self.conversion_strategy = AsyncConvertCommand(".jpg", "image/jpeg")
+        self.loop = loop or get_event_loop()
+
+    def receive_new_scan(self, message_):
+        """Convert the scan in the event loop and deliver the image when done."""
+        coroutine = self.convert(message_["scan"])
+        if is_in_loop_thread(self.loop):
+            self.loop.create_task(coroutine)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def convert(self, scan):
+        """Convert a scan and deliver the image."""
+        image = await self.conversion_strategy.convert_scan_to_image(scan)
+        self.deliver_message(message.new_image(image=image))
+
+
 
 
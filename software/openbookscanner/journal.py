@@ -0,0 +1,127 @@
+"""This module writes the requests to the Parse server to a file before they are sent.
+
+If the Parse server is slow or restarting, the requests wait in the journal
+and are sent later. After a restart, the requests of the last run are sent.
+
+    journal = Journal(path)
+    strategy = BatchStrategy(journal=journal)
+
+The journal is a file with one JSON object per line:
+
+- {"id": 1, "requests": [...]} is a batch of requests which should be sent.
+- {"acknowledged": 1} marks the batch as sent.
+
+When enough batches are acknowledged, the file is rewritten
+with only the batches which were not sent.
+"""
+from collections import OrderedDict
+import json
+import os
+import tempfile
+import threading
+
+
+class Journal:
+    """An append-only file of the batches of requests which were not sent yet."""
+
+    compact_after_acknowledgements = 100
+    synchronize = True
+
+    def __init__(self, path):
+        """Open the journal at the path and load the batches which were not sent."""
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = OrderedDict() # id -> requests, in the order they were added
+        self._last_id = 0
+        self._acknowledgements = 0
+        self._load()
+
+    def _load(self):
+        """Read the batches which were not acknowledged from the file."""
+        try:
+            with open(self.path, "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            return
+        end = content.rfind(b"\n") + 1
+        if end < len(content):
+            # The last line is incomplete after a power cut.
+            # It is removed so that the next record starts on a new line.
+            with open(self.path, "r+b") as file:
+                file.truncate(end)
+        for line in content[:end].decode("UTF-8").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "acknowledged" in record:
+                self._pending.pop(record["acknowledged"], None)
+                self._acknowledgements += 1
+            else:
+                self._pending[record["id"]] = record["requests"]
+                self._last_id = max(self._last_id, record["id"])
+
+    def _write(self, record):
+        """Append a record to the file. The lock must be held."""
+        with open(self.path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+            if self.synchronize:
+                file.flush()
+                os.fsync(file.fileno())
+
+    def append(self, requests):
+        """Add a batch of requests and return its id."""
+        with self._lock:
+            self._last_id += 1
+            self._write({"id": self._last_id, "requests": requests})
+            self._pending[self._last_id] = requests
+            return self._last_id
+
+    def acknowledge(self, id):
+        """The batch was sent and can be forgotten."""
+        with self._lock:
+            if self._pending.pop(id, None) is None:
+                return
+            self._write({"acknowledged": id})
+            self._acknowledgements += 1
+            if self._acknowledgements >= self.compact_after_acknowledgements:
+                self._compact()
+
+    def get_pending(self):
+        """Return the (id, requests) of the batches which were not sent in the order they were added."""
+        with self._lock:
+            return list(self._pending.items())
+
+    def __len__(self):
+        """Return the number of batches which were not sent."""
+        return len(self._pending)
+
+    def compact(self):
+        """Rewrite the file with only the batches which were not sent."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file. The lock must be held.
+
+        The file is replaced at once so a power cut leaves either the old
+        or the new journal.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".journal-")
+        try:
+            with os.fdopen(fd, "w") as file:
+                for id, requests in self._pending.items():
+                    file.write(json.dumps({"id": id, "requests": requests}) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self.path)
+        except:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self._acknowledgements = 0
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "<{} at {} with {} pending>".format(self.__class__.__name__, self.path, len(self._pending))
@@ -0,0 +1,166 @@
+"""This module exchanges messages with clients on the same computer.
+
+The messages go over Unix domain sockets instead of the Parse server.
+Each subscriber of a channel binds a datagram socket in the directory of the channel.
+A publisher sends each message to all the sockets in this directory.
+
+    transport = LocalSocketTransport()
+    broker = ParseBroker("OpenBookScannerIncoming", transport=transport)
+
+See the broker module for the Parse transport.
+"""
+from .message import encode_message
+from .codec import decode_message
+from .broker import accepts_message
+import os
+import socket
+import tempfile
+import time
+import uuid
+
+
+DEFAULT_SOCKET_DIRECTORY = os.path.join(tempfile.gettempdir(), "openbookscanner-channels")
+SOCKET_FILE_ENDING = ".sock"
+
+
+class LocalSocketPublisher:
+    """Send messages to the subscribers of a channel on this computer."""
+
+    maximum_message_size = 256 * 1024
+
+    def __init__(self, directory):
+        """Create a publisher for the channel in the directory."""
+        self.directory = directory
+        self.dropped_messages = 0
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.maximum_message_size)
+        self._socket.setblocking(False)
+        self._subscriber_paths = []
+        self._directory_modified = None
+
+    def get_subscriber_paths(self):
+        """Return the sockets of the subscribers.
+
+        The directory is only listed again when a subscriber joined or left.
+        """
+        try:
+            modified = os.stat(self.directory).st_mtime
+        except FileNotFoundError:
+            return []
+        # The modification time is coarse, changes within the last second could be missed.
+        if modified != self._directory_modified or time.time() - modified < 1:
+            self._subscriber_paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                                      if name.endswith(SOCKET_FILE_ENDING)]
+            self._directory_modified = modified
+        return self._subscriber_paths
+
+    def deliver_message(self, message):
+        """Send the message to all subscribers.
+
+        Sockets of subscribers which are gone are removed.
+        If the socket of a subscriber is full, the message is dropped
+        and counted in dropped_messages instead of waiting for the subscriber.
+        """
+        data = encode_message(message).encode("UTF-8")
+        if len(data) > self.maximum_message_size:
+            raise ValueError("The message has {} bytes, only {} bytes can be sent locally.".format(
+                len(data), self.maximum_message_size))
+        for path in self.get_subscriber_paths():
+            try:
+                self._socket.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._remove_stale_socket(path)
+            except BlockingIOError:
+                self.dropped_messages += 1
+
+    def _remove_stale_socket(self, path):
+        """Remove the socket of a subscriber which did not delete it."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def receive_message(self, message):
+        """When a publisher receives the message, it delivers it."""
+        self.deliver_message(message)
+
+    def delete(self):
+        """Close the socket."""
+        self._socket.close()
+
+
+class LocalSocketSubscriber:
+    """Receive the messages of a channel from publishers on this computer."""
+
+    maximum_message_size = LocalSocketPublisher.maximum_message_size
+
+    def __init__(self, directory):
+        """Create a subscriber with its own socket in the directory of the channel."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, uuid.uuid4().hex + SOCKET_FILE_ENDING)
+        self.subscribers = []
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.maximum_message_size)
+        self._socket.bind(self.path)
+        self._socket.setblocking(False)
+
+    @property
+    def channel(self):
+        """The name of the channel we listen to."""
+        return os.path.basename(self.directory)
+
+    def subscribe(self, subscriber):
+        """Subscribe to all messages sent over the broker."""
+        self.subscribers.append(subscriber)
+
+    def flush(self):
+        """Receive the messages which arrived."""
+        while True:
+            try:
+                data = self._socket.recv(self.maximum_message_size)
+            except BlockingIOError:
+                return
+            self.receive_message(decode_message(data.decode("UTF-8")))
+
+    def receive_message(self, message):
+        """Send the message to the subscribers."""
+        for subscriber in self.subscribers:
+            if accepts_message(subscriber, message):
+                subscriber.receive_message(message)
+
+    def fileno(self):
+        """Return the file descriptor so you can wait for messages with select()."""
+        return self._socket.fileno()
+
+    def delete(self):
+        """Leave the channel."""
+        self._socket.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class LocalSocketTransport:
+    """Create publishers and subscribers which use Unix domain sockets."""
+
+    def __init__(self, directory=DEFAULT_SOCKET_DIRECTORY):
+        """Create the channels as directories in the directory."""
+        self.directory = directory
+
+    def get_channel_directory(self, channel_name):
+        """Return the directory with the sockets of the channel."""
+        return os.path.join(self.directory, channel_name)
+
+    def create_publisher(self, channel_name):
+        """Return a new publisher for the channel."""
+        return LocalSocketPublisher(self.get_channel_directory(channel_name))
+
+    def create_subscriber(self, channel_name):
+        """Return a new subscriber for the channel."""
+        return LocalSocketSubscriber(self.get_channel_directory(channel_name))
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "<{} in {}>".format(self.__class__.__name__, self.directory)
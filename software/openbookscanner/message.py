@@ -2,6 +2,33 @@
 This module contains a way to create new messages and document the accordingly.
 
 """
+from weakref import WeakKeyDictionary
+from types import FunctionType
+from collections.abc import Mapping
+import json
+
+HANDLER_PREFIX = "receive_"
+
+# These methods start with the prefix but do not handle a message of this name.
+NOT_A_HANDLER = ("receive_message", "receive_unknown_message", "receive_message_from_other_state")
+
+# class -> {message name -> function(self, message)}
+# The table of a class is not shared with its subclasses.
+_dispatch_tables = WeakKeyDictionary()
+_handles_unknown_messages = WeakKeyDictionary()
+
+
+def _get_handler(cls, attribute_name):
+    """Return a function(self, message) which calls the handler."""
+    attribute = None
+    for base in cls.__mro__:
+        if attribute_name in base.__dict__:
+            attribute = base.__dict__[attribute_name]
+            break
+    if isinstance(attribute, FunctionType):
+        return attribute
+    return lambda self, message: getattr(self, attribute_name)(message)
+
 
 class MessageDispatcher:
     """Dispatch messages to methods."""
@@ -14,14 +41,176 @@ class MessageDispatcher:
         this method handles the message.
         Otherwise, receive_unknown_message handles the message.
         """
-        message_name = message["name"]
-        method_name = "receive_" + message_name
-        method = getattr(self, method_name, self.receive_unknown_message)
-        method(message)
+        handler = self.get_message_handlers().get(message["name"])
+        if handler is None:
+            self.receive_unknown_message(message)
+        else:
+            handler(self, message)
 
     def receive_unknown_message(self, message):
         """The state reacts to all messages which are not explicitely handeled."""
 
+    @classmethod
+    def get_message_handlers(cls):
+        """Return a dict which maps the message names to the methods handling them.
+        
+        The dict is computed once per class from all the base classes and mixins.
+        """
+        table = _dispatch_tables.get(cls)
+        if table is None:
+            table = {}
+            for attribute_name in dir(cls):
+                if attribute_name.startswith(HANDLER_PREFIX) and \
+                        attribute_name not in NOT_A_HANDLER and \
+                        callable(getattr(cls, attribute_name, None)):
+                    table[attribute_name[len(HANDLER_PREFIX):]] = _get_handler(cls, attribute_name)
+            _dispatch_tables[cls] = table
+        return table
+
+    @classmethod
+    def get_handled_message_names(cls):
+        """Return the names of the messages this class has a method for."""
+        return frozenset(cls.get_message_handlers())
+
+    @classmethod
+    def handles_unknown_messages(cls):
+        """Whether messages without a handler method can have an effect."""
+        result = _handles_unknown_messages.get(cls)
+        if result is None:
+            result = _handles_unknown_messages[cls] = (
+                cls.receive_message is not MessageDispatcher.receive_message or
+                cls.receive_unknown_message is not MessageDispatcher.receive_unknown_message)
+        return result
+
+    def accepts_message(self, message_name):
+        """Whether receiving a message of this name can have an effect.
+        
+        Brokers can skip the subscribers which would ignore the message.
+        """
+        return self.handles_unknown_messages() or message_name in self.get_message_handlers()
+
+    @staticmethod
+    def invalidate_message_handlers():
+        """Compute the dispatch tables again.
+        
+        Call this if you add or remove "receive_" methods of a class or mixin
+        after messages were dispatched.
+        """
+        _dispatch_tables.clear()
+        _handles_unknown_messages.clear()
+
+
+# message name -> description
+descriptions = {}
+
+
+class Message(Mapping):
+    """A message with a name, a type and a payload.
+    
+    You can access it like a read-only dict:
+    
+        message["name"], message["type"], message["description"], message["key"]
+    
+    The description is looked up by the name and not stored in the message.
+    The message is converted to JSON only when it is sent over the wire.
+    """
+    
+    __slots__ = ("name", "type", "payload", "_json", "_encodings")
+    
+    def __init__(self, name, payload=None, type="message"):
+        """Create a new message."""
+        self.name = name
+        self.type = type
+        self.payload = payload or {}
+        self._json = None
+        self._encodings = None # codec name -> string
+    
+    @property
+    def description(self):
+        """The description of the message or None if it is not documented."""
+        return descriptions.get(self.name)
+    
+    def __getitem__(self, key):
+        """Return the name, type, description or a value from the payload."""
+        if key == "name":
+            return self.name
+        if key == "type":
+            return self.type
+        if key == "description":
+            return self.description
+        return self.payload[key]
+    
+    def __iter__(self):
+        """Iterate over the keys of the message."""
+        yield "name"
+        yield "type"
+        yield "description"
+        for key in self.payload:
+            if key not in ("name", "type", "description"):
+                yield key
+    
+    def __len__(self):
+        """Return the number of keys."""
+        return 3 + sum(key not in ("name", "type", "description") for key in self.payload)
+    
+    def toJSON(self):
+        """Return the JSON representation without the description."""
+        json = dict(self.payload)
+        json["name"] = self.name
+        json["type"] = self.type
+        return json
+    
+    def encode(self):
+        """Return the message as a JSON string.
+        
+        The string is computed once.
+        """
+        if self._json is None:
+            self._json = json.dumps(self.toJSON())
+        return self._json
+    
+    def get_encoding(self, codec):
+        """Return the message encoded by the codec.
+        
+        Each codec encodes the message once, see the codec module.
+        """
+        if self._encodings is None:
+            self._encodings = {}
+        encoding = self._encodings.get(codec.name)
+        if encoding is None:
+            encoding = self._encodings[codec.name] = codec.encode(self)
+        return encoding
+    
+    @classmethod
+    def fromJSON(cls, data):
+        """Create a message from its JSON representation."""
+        payload = dict(data)
+        name = payload.pop("name")
+        type = payload.pop("type", "message")
+        payload.pop("description", None)
+        return cls(name, payload, type)
+    
+    @classmethod
+    def decode(cls, string):
+        """Create a message from a JSON string."""
+        message = cls.fromJSON(json.loads(string))
+        message._json = string
+        return message
+    
+    def __repr__(self):
+        """Return the string representation."""
+        arguments = ["{}={!r}".format(key, value) for key, value in self.payload.items()]
+        if self.type != "message":
+            arguments.insert(0, "type={!r}".format(self.type))
+        return "message.{}({})".format(self.name, ", ".join(arguments))
+
+
+def encode_message(message):
+    """Return the JSON string of a Message or a dict."""
+    if isinstance(message, Message):
+        return message.encode()
+    return json.dumps(message)
+
 
 class MessageCreator:
     """A simple way to create new messages.
@@ -35,13 +224,12 @@ class MessageCreator:
 
     def __getattr__(self, name):
         def create_message(**kw):
-            kw.setdefault("type", "message")
-            kw["name"] = name
-            kw["description"] = create_message.__doc__
-            return kw
+            type = kw.pop("type", "message")
+            kw.pop("name", None)
+            return Message(name, kw, type)
         create_message.__name__ += "_" + name
         def document(string):
-            create_message.__doc__ = string
+            create_message.__doc__ = descriptions[name] = string
         create_message.describe_as = document
         setattr(self, name, create_message)
         return create_message
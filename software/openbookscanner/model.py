@@ -1,7 +1,6 @@
-import time
-from .broker import MessagePrintingSubscriber, ParsePublisher, BufferingBroker, ParseSubscriber, LocalBroker
-from .parse_update import ParseUpdater
-from .update_strategy import BatchStrategy
+from .broker import MessagePrintingSubscriber, ParsePublisher, BufferingBroker, ParseLogSubscriber, LocalBroker
+from .parse_update import ParseUpdater, parse_object_exists
+from .update_strategy import BatchStrategy, is_transient_error
 from .states.status import StatusStateMachine
 from .states.state import StateChangeToMessageReceiveAdapter
 from .states.scanner import ScannerListener
@@ -10,6 +9,11 @@ from parse_rest.datatypes import Object
 from .message import message
 from .storage import UserDefinedStorageLocation
 from .conversion import Converter
+from .codec import default_codec, get_schemas
+from .push_server import PushServer
+from .states import worker_pool
+from .states.clock import system_clock
+import traceback
 
 
 PUBLIC_MODEL_CLASS_NAME = "OpenBookScanner"
@@ -22,27 +26,75 @@ class OpenBookScanner:
     
     public_channel_name_outgoing = "OpenBookScannerOutgoing"
     public_channel_name_incoming = "OpenBookScannerIncoming"
+    
+    # the main loop sleeps with this clock, see the clock module
+    clock = system_clock
+    seconds_between_updates = 0.5
+    
+    # when the changes are sent to the Parse server without waiting for the
+    # next update, see BatchStrategy.start_flushing()
+    flush_after_operations = 50
+    flush_after_seconds = 0.1
+    maximum_pending_operations = 1000
+    # the requests wait in this journal while the Parse server can not be reached,
+    # see the journal module. Without a journal, they wait in the batch and
+    # are lost when the process ends.
+    journal = None
+    
+    # how the outgoing messages are encoded, see the codec module
+    outgoing_codec = default_codec
+    
+    # clients on this computer, see open_local_channels()
+    local_incoming_messages = None
+    
+    # web clients which receive the events directly, see open_push_server()
+    push_server = None
+    
+    # the updaters of these relations are saved in a snapshot
+    snapshot_relations = ("status", "listener", "usb_stick_listener", "storage")
 
-    def __init__(self):
+    def __init__(self, snapshot=None):
         """Create a new book scanner.
         
         status(StatusStateMachine) --message--> public_message_buffer(BufferingBroker) --message---
-        ---> public_message_broker(ParseBroker) --"""
+        ---> public_message_broker(ParseBroker) --
+        
+        snapshot is the result of self.snapshot() from an earlier run, see the snapshot module.
+        The restored state is verified in the background.
+        """
+        self.restored_snapshot = snapshot or {}
+        self.updaters = {}
+        self.parse_updaters = []
+        self.verification = None
         self.create_communication_channels()
         self.create_model()
+        if snapshot:
+            self.restore(snapshot)
             
     def create_communication_channels(self):
         """This creates the communication channels to the client."""
-        self.update_strategy = BatchStrategy()
+        self.update_strategy = BatchStrategy(
+            self.flush_after_operations, self.flush_after_seconds, self.maximum_pending_operations,
+            self.journal)
         self.outgoing_messages = BufferingBroker()
-        self.outgoing_messages_publisher = ParsePublisher(self.public_channel_name_outgoing, self.update_strategy)
-        self.incoming_messages = ParseSubscriber(self.public_channel_name_incoming)
+        self.outgoing_messages_publisher = ParsePublisher(
+            self.public_channel_name_outgoing, self.update_strategy, self.outgoing_codec)
+        self.incoming_messages = ParseLogSubscriber(
+            self.public_channel_name_incoming, self.update_strategy,
+            cursor=self.restored_snapshot.get("incoming_messages", {}).get("cursor"))
         self.internal_messages = LocalBroker()
 
     def create_model(self):
         """This creates the model which is observable by the client."""
         self.model = self.ModelClass()
-        self.model.save()
+        # the web client decodes the compact messages with these schemas
+        self.model.codec_schemas = get_schemas()
+        model_id = self.restored_snapshot.get("model")
+        if model_id is None:
+            self.model.save()
+        else:
+            self.model.objectId = model_id
+            self.update_strategy.saveAttributes(self.model, ["codec_schemas"])
         # messaging
         self.outgoing_messages.subscribe(self.outgoing_messages_publisher)
         self.outgoing_messages.deliver_message(message.new_book_scanner_server(id=self.model.objectId))
@@ -57,17 +109,88 @@ class OpenBookScanner:
         self.usb_stick_listener.register_hardware_observer(self)
         # conversion
         self.converter = Converter()
-        self.internal_messages.subscribe(self.converter)
+        self.internal_messages.subscribe(self.converter, names=["new_scan"])
         self.converter.subscribe(self.internal_messages)
         # storage
         self.storage_location = UserDefinedStorageLocation()
         self.parse_storage_location = ParseUpdater(self.storage_location, self.update_strategy)
         self.storage_location.register_state_observer(self.parse_storage_location)
+        self.parse_updaters.append(self.parse_storage_location)
         self.incoming_messages.subscribe(self.storage_location)
-        self.internal_messages.subscribe(self.storage_location)
+        self.internal_messages.subscribe(self.storage_location, names=["new_image"])
         self.storage_location.subscribe(self.internal_messages)
         self.storage_location.run_in_parallel()
         self.relate_to("storage", self.parse_storage_location)
+        self.updaters["storage"] = self.parse_storage_location
+
+    def snapshot(self):
+        """Return the state to restore after a restart."""
+        return {"model": self.model.objectId,
+                "incoming_messages": self.incoming_messages.snapshot(),
+                "updaters": {relation: self.updaters[relation].snapshot() for relation in self.snapshot_relations},
+                "status": self.status.snapshot(),
+                "scanner_listener": self.scanner_listener.snapshot(),
+                "storage": self.storage_location.snapshot()}
+
+    def restore(self, snapshot):
+        """Restore the state of a snapshot and verify it in the background."""
+        for relation, updater_snapshot in snapshot.get("updaters", {}).items():
+            if relation in self.updaters:
+                self.updaters[relation].restore(updater_snapshot)
+        self.status.restore(snapshot.get("status", {}))
+        self.scanner_listener.restore(snapshot.get("scanner_listener", {}))
+        self.storage_location.restore(snapshot.get("storage", {}))
+        self.verification = worker_pool.get_worker_pool().submit(self.verify)
+
+    def verify(self):
+        """Create the objects on the parse server again if the restored ones are gone."""
+        self.incoming_messages.verify()
+        for updater in self.updaters.values():
+            updater.verify()
+        if not parse_object_exists(self.model):
+            self.model.objectId = None
+            self.model.save()
+            self.outgoing_messages.deliver_message(message.new_book_scanner_server(id=self.model.objectId))
+            for relation, updater in self.updaters.items():
+                self.relate_to(relation, updater)
+
+    def wait_for_verification(self):
+        """Wait until the restored state is verified and return whether it is.
+
+        If the verification fails, it is printed and tried again in the background.
+        """
+        if self.verification is not None:
+            try:
+                self.verification.result()
+            except Exception:
+                traceback.print_exc()
+                self.verification = worker_pool.get_worker_pool().submit(self.verify)
+                return False
+            self.verification = None
+        return True
+    
+    def open_local_channels(self, transport):
+        """Also exchange messages with clients on this computer over the transport.
+        
+        See the local_transport module.
+        """
+        self.local_outgoing_messages = transport.create_publisher(self.public_channel_name_outgoing)
+        self.outgoing_messages.subscribe(self.local_outgoing_messages)
+        self.local_incoming_messages = transport.create_subscriber(self.public_channel_name_incoming)
+        self.local_incoming_messages.subscribe(self.incoming_messages)
+    
+    def open_push_server(self, push_server=None):
+        """Push the messages and the updates to web clients over the push server.
+        
+        By default, only clients on this computer can connect, see the push_server module.
+        """
+        if push_server is None:
+            push_server = PushServer(codec=self.outgoing_codec)
+        self.push_server = push_server
+        self.outgoing_messages.subscribe(push_server)
+        for updater in self.parse_updaters:
+            updater.register_observer(push_server)
+        push_server.run_in_parallel()
     
     def relate_to(self, relation, updater):
         """Relate to an updater over a defined relation."""
@@ -97,24 +220,52 @@ class OpenBookScanner:
     def public_state_machine(self, relation, state_machine):
         """Make the state machine public"""
         updater = ParseUpdater(state_machine, self.update_strategy)
+        self.parse_updaters.append(updater)
+        if self.push_server is not None:
+            updater.register_observer(self.push_server)
         state_machine.register_state_observer(updater)
         state_machine.subscribe(self.internal_messages)
         state_machine.register_state_observer(StateChangeToMessageReceiveAdapter(self.internal_messages))
         self.relate_to(relation, updater)
+        self.updaters.setdefault(relation, updater)
         return state_machine
 
-    def run(self):
-         """Run the update in a loop."""
+    def run(self, snapshot_file=None):
+         """Run the update in a loop.
+         
+         If a snapshot_file is given, the snapshot is saved in it after each update.
+         """
          while 1:
              self.update()
-             time.sleep(0.5)
+             if snapshot_file is not None:
+                 snapshot_file.save(self.snapshot())
+             self.clock.sleep(self.seconds_between_updates)
     
     def update(self):
-        """Update the book scanner, send and receive messages."""
-        self.incoming_messages.flush()
+        """Update the book scanner, send and receive messages.
+        
+        If the Parse server can not be reached, the next update reads the
+        incoming messages after the same cursor again and sends the operations
+        which were put back in the batch, see BatchStrategy.
+        """
+        self.retry_in_the_next_update(self.incoming_messages.flush)
+        if self.local_incoming_messages is not None:
+            self.local_incoming_messages.flush()
         self.update_state_machines()
         self.outgoing_messages.flush()
-        self.update_strategy.batch()
+        # The restored objects must exist before we save them.
+        if self.wait_for_verification():
+            self.update_strategy.start_flushing()
+            self.retry_in_the_next_update(self.update_strategy.batch)
+    
+    def retry_in_the_next_update(self, function):
+        """Call the function and print the error if the Parse server can not be reached."""
+        try:
+            function()
+        except Exception as error:
+            if not is_transient_error(error):
+                raise
+            print("Could not reach the Parse server, retrying in the next update: {}".format(error))
     
     def update_state_machines(self):
         """Send an update message to the state machines."""
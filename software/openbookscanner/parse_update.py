@@ -5,8 +5,23 @@
 
 
 from parse_rest.datatypes import Object
+from parse_rest.query import QueryResourceDoesNotExist
+import functools
 import json
 from .update_strategy import OnChangeStrategy
+from .versioned_json import get_json
+
+
+def parse_object_exists(parse_object):
+    """Whether the parse object was saved and still exists on the server."""
+    object_id = getattr(parse_object, "objectId", None)
+    if object_id is None:
+        return False
+    try:
+        parse_object.__class__.Query.get(objectId=object_id)
+    except QueryResourceDoesNotExist:
+        return False
+    return True
 
 
 class ParseUpdater:
@@ -23,9 +38,14 @@ class ParseUpdater:
         """
         self.batch_strategy = batch_strategy
         self.obj = obj
-        self.type = obj.toJSON()["type"]
+        self.observers = []
+        self.type = get_json(obj)["type"]
         self.ParseClass = Object.factory(self.type)
         self.parse_object = self.ParseClass()
+        # the JSON and attributes of the last save which was done
+        self._fingerprint = None
+        self._saved_attributes = {}
+        self._number_of_saves = 0
         self.update()
         
     @staticmethod
@@ -47,9 +67,13 @@ class ParseUpdater:
             obj["attributes"].append(attr)
         return has_value
 
-    def set_attributes(self, data):
-        """Set the attributes of the parse object from a json dict."""
-        self.parse_object.json = json.dumps(data)
+    def set_attributes(self, data, encoded_data=None):
+        """Set the attributes of the parse object from a json dict.
+        
+        encoded_data is the data as a JSON string if it is known.
+        """
+        self.parse_object.json = json.dumps(data) if encoded_data is None else encoded_data
+        self.parse_object.attributes = []
         self.set_attr(self.parse_object.__dict__, "description", data, "")
         self.set_attr(self.parse_object.__dict__, "type", data, "unclassified")
         self.set_attr(self.parse_object.__dict__, "state", data, {})
@@ -62,13 +86,73 @@ class ParseUpdater:
     
     def update(self):
         """Update the local represenation of the object using obj.toJSON() and save it to the server.
+        
+        Nothing is saved if the JSON did not change since the last save was done.
+        Otherwise, only the attributes which changed since then are saved.
         """
-        self.set_attributes(self.obj.toJSON())
-        self.save()
+        data = get_json(self.obj)
+        fingerprint = json.dumps(data)
+        if fingerprint != self.parse_object.__dict__.get("json"):
+            self.set_attributes(data, fingerprint)
+        if fingerprint != self._fingerprint:
+            self.save_changes()
+    
+    attribute_names = ("json", "description", "has_description", "type", "has_type",
+                       "state", "has_state", "attributes")
+
+    def get_attributes(self):
+        """Return the attributes which are set on the parse object."""
+        attributes = vars(self.parse_object)
+        return {name: attributes[name] for name in self.attribute_names if name in attributes}
     
     def save(self):
-        """Save the object."""
-        self.batch_strategy.save(self.parse_object)
+        """Save the object and notify the observers afterwards."""
+        self.batch_strategy.save(self.parse_object, self._get_save_callback())
+    
+    def _get_save_callback(self):
+        """Return the callback which remembers what the save sent."""
+        self._number_of_saves += 1
+        return functools.partial(self._save_done, self._number_of_saves, self.parse_object.json,
+                                 self.get_attributes())
+    
+    def _save_done(self, number, fingerprint, attributes):
+        """The save was done, the attributes are on the server.
+        
+        When the last save is done, the observers are notified.
+        If the object changed while it was saved, the changes are saved again.
+        """
+        self._fingerprint = fingerprint
+        self._saved_attributes = attributes
+        if number != self._number_of_saves:
+            # Saves which were merged are done together.
+            return
+        self.saved()
+        if self.get_changed_attribute_names():
+            self.save_changes()
+    
+    def get_changed_attribute_names(self):
+        """Return the names of the attributes which changed since they were last saved."""
+        attributes = self.get_attributes()
+        return [name for name, value in attributes.items() if self._saved_attributes.get(name) != value]
+    
+    def save_changes(self):
+        """Save the changed attributes and notify the observers afterwards."""
+        if getattr(self.parse_object, "objectId", None) is None or not self._saved_attributes:
+            self.save()
+            return
+        changed = self.get_changed_attribute_names()
+        if not changed:
+            return
+        self.batch_strategy.saveAttributes(self.parse_object, changed, self._get_save_callback())
+    
+    def register_observer(self, observer):
+        """Call observer.parse_object_saved(updater) when the parse object was saved."""
+        self.observers.append(observer)
+    
+    def saved(self):
+        """The parse object was saved, notify the observers."""
+        for observer in self.observers:
+            observer.parse_object_saved(self)
     
     def delete(self):
         """Delete the object."""
@@ -86,5 +170,26 @@ class ParseUpdater:
         """This returns the parse object."""
         return self.parse_object
 
+    def snapshot(self):
+        """Return the id of the parse object to restore after a restart."""
+        return {"objectId": getattr(self.parse_object, "objectId", None)}
+
+    def restore(self, snapshot):
+        """Use the parse object of the snapshot instead of creating a new one."""
+        object_id = snapshot.get("objectId")
+        if object_id is not None:
+            self.parse_object.objectId = object_id
+
+    def verify(self):
+        """Create the parse object again if the restored one is gone.
+        
+        Return whether the object had to be created.
+        """
+        if getattr(self.parse_object, "objectId", None) is None or parse_object_exists(self.parse_object):
+            return False
+        self.parse_object.objectId = None
+        self.parse_object.save()
+        return True
+
 
 
@@ -0,0 +1,115 @@
+"""Push messages and updates to the web clients as they happen.
+
+The web clients connect to the push server with Server-Sent Events.
+
+    https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events
+
+These events are sent:
+
+- "message" with a message of the outgoing channel
+- "update" with the attributes of a parse object which was saved by a ParseUpdater
+
+The server listens on localhost unless another host is given.
+"""
+from flask import Flask, Response
+from .codec import default_codec
+import json
+import queue
+import threading
+
+
+class PushServer:
+    """Stream events to the web clients."""
+
+    EVENTS = "/events"
+    maximum_queued_events = 1000
+    seconds_between_heartbeats = 15
+    milliseconds_to_reconnect = 1000
+    codec = default_codec
+    host = "127.0.0.1"
+
+    def __init__(self, port=8002, codec=None, host=None):
+        """Create a new push server.
+
+        The codec encodes the messages like the publisher of the channel.
+        Use host "0.0.0.0" to let clients on other computers connect.
+        """
+        if codec is not None:
+            self.codec = codec
+        if host is not None:
+            self.host = host
+        self.app = Flask(self.__class__.__name__)
+        self.app.route(self.EVENTS)(self.serve_events)
+        self.port = port
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def add_client(self):
+        """Return a new queue which receives the events."""
+        client = queue.Queue(self.maximum_queued_events)
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def remove_client(self, client):
+        """Do not send events to the client any more."""
+        with self._lock:
+            self._clients.discard(client)
+
+    def get_number_of_clients(self):
+        """Return the number of connected clients."""
+        return len(self._clients)
+
+    def push(self, event, data):
+        """Send an event with the data to all clients.
+
+        If a client does not read its events, it is disconnected and reconnects later.
+        """
+        text = "event: {}\ndata: {}\n\n".format(event, data)
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.put_nowait(text)
+            except queue.Full:
+                self.remove_client(client)
+
+    def receive_message(self, message):
+        """Push a message to the clients."""
+        self.push("message", self.codec.encode_cached(message))
+
+    def parse_object_saved(self, updater):
+        """Push the new attributes of the parse object of the updater."""
+        self.push("update", json.dumps({"objectId": updater.get_parse_object().objectId,
+                                        "attributes": updater.get_attributes()}))
+
+    def serve_events(self):
+        """Stream the events to a client."""
+        client = self.add_client()
+        def stream():
+            try:
+                yield "retry: {}\n\n".format(self.milliseconds_to_reconnect)
+                while True:
+                    try:
+                        yield client.get(timeout=self.seconds_between_heartbeats)
+                    except queue.Empty:
+                        if client not in self._clients:
+                            return
+                        yield ": heartbeat\n\n"
+            finally:
+                self.remove_client(client)
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "Access-Control-Allow-Origin": "*"})
+
+    def get_port(self):
+        """Return the port to connect to."""
+        return self.port
+
+    def run(self):
+        """Run the server."""
+        self.app.run(host=self.host, port=self.port, threaded=True)
+
+    def run_in_parallel(self):
+        """Run the server in parellel."""
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
@@ -0,0 +1,77 @@
+"""This module saves the state of the book scanner in a file so a restart is fast.
+
+When the book scanner starts, it detects the drivers, lists the scanners
+and creates its objects on the Parse server.
+A snapshot remembers the result of this so a restart can skip these steps.
+
+    snapshot_file = SnapshotFile(path)
+    openbookscanner = OpenBookScanner(snapshot_file.load())
+    ...
+    snapshot_file.save(openbookscanner.snapshot())
+
+Objects which can be saved in a snapshot have these methods:
+
+- snapshot() returns a dict which can be converted to JSON.
+- restore(snapshot) takes such a dict and restores the object.
+
+What is restored is verified in the background after the start.
+"""
+import json
+import os
+import tempfile
+
+
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotFile:
+    """A file which contains a snapshot."""
+
+    def __init__(self, path):
+        """Create a new snapshot file at the path."""
+        self.path = path
+        self._last_saved = None
+
+    def load(self):
+        """Return the snapshot from the file or None if there is no valid snapshot."""
+        try:
+            with open(self.path) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def save(self, snapshot):
+        """Save the snapshot to the file if it changed.
+
+        The file is replaced at once so a power cut leaves either the old
+        or the new snapshot and never a broken one.
+        """
+        content = json.dumps(dict(snapshot, version=SNAPSHOT_VERSION), sort_keys=True)
+        if content == self._last_saved:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self.path)
+        except:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self._last_saved = content
+
+    def delete(self):
+        """Remove the snapshot file."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._last_saved = None
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "<{} at {}>".format(self.__class__.__name__, self.path)
@@ -0,0 +1,229 @@
+"""This module contains the states which run on an asyncio event loop.
+
+The threaded RunningState occupies a worker while it runs.
+The states in this module run as asyncio tasks instead.
+This way, many state machines can share one event loop.
+
+    class Scanning(AsyncRunningState):
+        async def run(self):
+            process = await run_subprocess(["scanimage"])
+
+If the state machine is an AsyncStateMachine, the states run on its loop.
+Otherwise, they run on the loop which runs in this thread or on a loop
+which runs in a thread of its own.
+"""
+import asyncio
+import functools
+import inspect
+import subprocess
+import sys
+import threading
+from .state import StateMachine, RunningState, PollingState, TimingOut
+
+
+def get_running_loop():
+    """Return the event loop running in the current thread or None."""
+    if hasattr(asyncio, "get_running_loop"):
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+    # Before Python 3.7, get_event_loop() returns the running loop
+    # in coroutines and callbacks.
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        return None
+    return loop if loop.is_running() else None
+
+
+def is_in_loop_thread(loop):
+    """Whether the loop is running in the current thread."""
+    return loop is not None and get_running_loop() is loop
+
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_event_loop():
+    """Return an event loop which runs forever in a daemon thread."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="event loop", daemon=True)
+            thread.start()
+            _background_loop = loop
+        return _background_loop
+
+
+def get_event_loop():
+    """Return the running event loop or the event loop which runs in the background."""
+    loop = get_running_loop()
+    if loop is None:
+        return get_background_event_loop()
+    return loop
+
+
+async def maybe_await(result):
+    """Return the result or await it if it is awaitable."""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+async def run_subprocess(command, stdin=None, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
+    """Run the command without blocking the event loop.
+
+    This returns a subprocess.CompletedProcess like subprocess.run().
+    """
+    if sys.version_info < (3, 8):
+        # Before Python 3.8, the child watcher only notices the subprocesses
+        # of a loop which it was attached to in the main thread.
+        run = functools.partial(subprocess.run, command, stdin=stdin, stdout=stdout, stderr=stderr)
+        return await asyncio.get_event_loop().run_in_executor(None, run)
+    process = await asyncio.create_subprocess_exec(*command, stdin=stdin, stdout=stdout, stderr=stderr)
+    output, error = await process.communicate()
+    return subprocess.CompletedProcess(command, process.returncode, output, error)
+
+
+class AsyncStateMachine(StateMachine):
+    """A state machine which runs its asynchronous states on an event loop.
+
+    You can set the loop attribute to choose the event loop.
+    Set it before the first state is entered, e.g. in the constructor.
+    """
+
+    loop = None
+
+    def get_event_loop(self):
+        """Return the event loop to run the states on."""
+        if self.loop is None:
+            self.loop = get_event_loop()
+        return self.loop
+
+
+class AsyncRunningState(RunningState):
+    """This state runs the coroutine run() on the event loop.
+
+    When run() is done, the state machine is updated so that it can transition.
+    """
+
+    def get_event_loop(self):
+        """Return the event loop of the state machine."""
+        return getattr(self.state_machine, "get_event_loop", get_event_loop)()
+
+    def start(self):
+        """Start the coroutine run() on the event loop."""
+        self.loop = self.get_event_loop()
+        if is_in_loop_thread(self.loop):
+            self.future = self.loop.create_task(self.run())
+        else:
+            self.future = asyncio.run_coroutine_threadsafe(self.run(), self.loop)
+        self.future.add_done_callback(self._done)
+
+    async def run(self):
+        """This is called when the state machine enters the state.
+
+        While running, you can transition_into other states.
+        When running is done, the state machine will enter the new state.
+        """
+
+    def _done(self, future):
+        """Update the state machine so it can transition when we are done."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        if self.state_machine.state is self:
+            if is_in_loop_thread(self.loop):
+                self.state_machine.update()
+            else:
+                self.loop.call_soon_threadsafe(self.state_machine.update)
+
+    def get_exception(self):
+        """Return the exception of run(), a stopped state has none."""
+        if self.future.cancelled():
+            return None
+        return self.future.exception()
+
+    async def wait_async(self):
+        """Wait for run() to finish inside of the event loop."""
+        future = self.future
+        if not isinstance(future, asyncio.Future):
+            future = asyncio.wrap_future(future)
+        await asyncio.wait([future])
+
+    def wait(self, timeout=None):
+        """Wait for run() to finish.
+
+        timeout is given in seconds.
+        In the thread of the event loop, use "await state.wait_async()".
+        """
+        if self.future.done():
+            return
+        if is_in_loop_thread(self.loop):
+            raise RuntimeError("Use \"await state.wait_async()\" in the thread of the event loop.")
+        if self.loop.is_running():
+            waiting = threading.Event()
+            self.loop.call_soon_threadsafe(self.future.add_done_callback, lambda future: waiting.set())
+            waiting.wait(timeout)
+        else:
+            try:
+                self.loop.run_until_complete(asyncio.wait_for(self.wait_async(), timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        """Stop running."""
+        self._stopped = True
+        if is_in_loop_thread(self.loop) or not isinstance(self.future, asyncio.Future):
+            self.future.cancel()
+        else:
+            self.loop.call_soon_threadsafe(self.future.cancel)
+
+
+class AsyncPollingState(AsyncRunningState, PollingState):
+    """This state awaits poll() all "timeout" seconds on the event loop.
+
+    poll(), start_polling() and check() can be coroutines or normal methods.
+    """
+
+    async def run(self):
+        """Poll until we transition or stop."""
+        self._wake_up = asyncio.Event()
+        await maybe_await(self.start_polling())
+        while not self.is_waiting_for_a_message_to_transition_to_the_next_state():
+            if self.should_stop():
+                return
+            self._wake_up.clear()
+            await maybe_await(self.poll())
+            if not self.is_waiting_for_a_message_to_transition_to_the_next_state():
+                try:
+                    await asyncio.wait_for(self._wake_up.wait(), self.seconds_until_next_poll())
+                except asyncio.TimeoutError:
+                    pass
+
+    def wake_up(self):
+        """Poll now instead of waiting for the timeout."""
+        wake_up = getattr(self, "_wake_up", None)
+        if wake_up is None:
+            return
+        if is_in_loop_thread(self.loop):
+            wake_up.set()
+        else:
+            self.loop.call_soon_threadsafe(wake_up.set)
+
+
+class AsyncTimingOut(AsyncPollingState, TimingOut):
+    """After the given time, this state transitions into another state.
+
+    check() can be a coroutine.
+    """
+
+    async def poll(self):
+        """Check if the timeout has passed."""
+        await maybe_await(self.check())
+        if self.is_waiting_for_a_message_to_transition_to_the_next_state():
+            return # we transitioned into another state
+        if not self.seconds_remaining:
+            self.transition_into(self.state_when_the_timeout_was_reached())
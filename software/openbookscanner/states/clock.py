@@ -0,0 +1,98 @@
+"""This module contains the clocks which the states use to measure time.
+
+The states do not use the time module directly but the clock of their state machine.
+By default, this is the system clock.
+
+    class SimulatedScanner(Scanner):
+        clock = VirtualClock()
+
+The time of a VirtualClock only changes when you advance it.
+This way, tests and simulations do not need to wait for timeouts in real time.
+
+    clock.advance(10) # all timers due in the next ten seconds are called
+"""
+import threading
+import time
+
+
+class SystemClock:
+    """The real time of the system."""
+
+    advances_by_itself = True
+
+    def time(self):
+        """Return the current time in seconds."""
+        return time.time()
+
+    def sleep(self, seconds):
+        """Wait for some seconds."""
+        time.sleep(seconds)
+
+    def wait(self, condition, seconds):
+        """Wait for the condition to be notified or for the seconds to pass.
+
+        The lock of the condition must be held.
+        """
+        condition.wait(seconds)
+
+    def add_observer(self, observer):
+        """The system time changes by itself, observers are not notified."""
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "{}()".format(self.__class__.__name__)
+
+
+class VirtualClock(SystemClock):
+    """A clock which only advances when you tell it to.
+
+    Sleeping advances the clock at once.
+    observer() is called after the time changed.
+    The timer services observe the clock, so the timers which are due
+    were called when advance() returns.
+    """
+
+    advances_by_itself = False
+
+    def __init__(self, start=0):
+        """Create a new clock which starts at the given time in seconds."""
+        self._now = start
+        self._lock = threading.Lock()
+        self._observers = []
+
+    def time(self):
+        """Return the virtual time in seconds."""
+        return self._now
+
+    def advance(self, seconds):
+        """Advance the time by seconds."""
+        if seconds < 0:
+            raise ValueError("The time can not go back by {} seconds.".format(-seconds))
+        with self._lock:
+            self._now += seconds
+            observers = list(self._observers)
+        for observer in observers:
+            observer()
+
+    def sleep(self, seconds):
+        """Advance the time instead of waiting."""
+        self.advance(seconds)
+
+    def wait(self, condition, seconds):
+        """Wait until the condition is notified, e.g. after the time advanced.
+
+        The lock of the condition must be held.
+        """
+        condition.wait()
+
+    def add_observer(self, observer):
+        """Call observer() when the time changes."""
+        with self._lock:
+            self._observers.append(observer)
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "<{} at {} seconds>".format(self.__class__.__name__, self._now)
+
+
+system_clock = SystemClock()
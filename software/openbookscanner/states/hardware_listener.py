@@ -70,6 +70,15 @@ class ListeningForHardwareChanges(PollingState, Checks):
             self.state_machine.listen_for_hardware()
 
 
+class VerifyingDriverSupport(ListeningForHardwareChanges):
+    """The driver support was restored from a snapshot. Verify it while we listen."""
+
+    def start_polling(self):
+        """Check the driver support once before listening."""
+        if not self.state_machine.has_driver_support():
+            self.transition_into(NotSupported())
+
+
 class NotifyingAboutNewHardware(State, Checks):
      """Notify all the observers in a threadsave manner about the new hardware changes."""
 
@@ -152,6 +161,38 @@ class HardwareListener(StateMachine):
                 print('test', observer, new_hardware)
                 observer.new_hardware_detected(new_hardware)
 
+    def snapshot(self):
+        """Return the found hardware and driver support to restore after a restart."""
+        hardware = [self.snapshot_hardware(hardware) for hardware in self.get_hardware()]
+        return {"has_driver_support": not getattr(self.state, "is_detecting_driver_support", False),
+                "hardware": [snapshot for snapshot in hardware if snapshot is not None]}
+
+    def restore(self, snapshot):
+        """Restore the hardware and skip the detection of the driver support.
+        
+        The driver support is verified while we listen for hardware changes.
+        """
+        for hardware_snapshot in snapshot.get("hardware", []):
+            hardware = self.restore_hardware(hardware_snapshot)
+            if hardware is not None and hardware not in self._added_hardware:
+                self.found_new_hardware(hardware)
+        if snapshot.get("has_driver_support") and getattr(self.state, "is_detecting_driver_support", False):
+            self.transition_into(VerifyingDriverSupport())
+
+    def snapshot_hardware(self, hardware):
+        """Return a snapshot of the hardware or None if it can not be restored.
+        
+        Please replace this method together with restore_hardware().
+        """
+        return None
+
+    def restore_hardware(self, snapshot):
+        """Return the hardware from the snapshot or None.
+        
+        Please replace this method together with snapshot_hardware().
+        """
+        return None
+
     def has_new_hardware(self):
         """Return whether we have new hardware detected."""
         return bool(self._new_hardware)
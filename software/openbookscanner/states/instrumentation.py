@@ -0,0 +1,197 @@
+"""This module measures where the state machines spend their time.
+
+Instrumentation is off by default.
+When you enable it, the state machines record
+
+- the time spent in each state,
+- the time it takes to handle a message in a state and
+- the number of transitions from one state into another.
+
+    instrumentation = enable_instrumentation()
+    ...
+    print(instrumentation.format_table())
+    instrumentation.toJSON()
+"""
+import math
+import threading
+import time
+from .timer import get_timer_service
+from .state import StateMachine
+
+
+class Histogram:
+    """Count durations in buckets which double in size.
+
+    The first bucket holds durations up to a microsecond.
+    """
+
+    smallest_bucket = 0.000001
+    number_of_buckets = 42
+
+    def __init__(self):
+        """Create an empty histogram."""
+        self.buckets = [0] * self.number_of_buckets
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, seconds):
+        """Add a duration in seconds."""
+        if seconds <= self.smallest_bucket:
+            index = 0
+        else:
+            index = min(int(math.ceil(math.log2(seconds / self.smallest_bucket))), self.number_of_buckets - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if self.maximum is None or seconds > self.maximum:
+            self.maximum = seconds
+
+    @property
+    def mean(self):
+        """The average duration."""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket which contains the percentile."""
+        if not self.count:
+            return None
+        wanted = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(self.smallest_bucket * 2 ** index, self.maximum)
+        return self.maximum
+
+    def toJSON(self):
+        """Return the JSON representation."""
+        return {"count": self.count, "total": self.total, "mean": self.mean,
+                "min": self.minimum, "max": self.maximum,
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99)}
+
+
+def get_state_machine_name(state_machine):
+    """Return the name of the state machine to group measurements by."""
+    id = getattr(state_machine, "id", None)
+    name = state_machine.__class__.__name__
+    return name if id is None else "{} {}".format(name, id)
+
+
+def get_state_name(state):
+    """Return the name of the state to group measurements by."""
+    return state.__class__.__name__
+
+
+class Instrumentation:
+    """Record the timing of state machines."""
+
+    def __init__(self, clock=time.perf_counter):
+        """Create a new empty record.
+
+        clock is a function returning the time in seconds.
+        """
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.time_in_state = {} # (machine, state) -> Histogram
+        self.message_handling = {} # (machine, state, message) -> Histogram
+        self.transitions = {} # (machine, old state, new state) -> count
+
+    def transitioned(self, state_machine, old_state, new_state, entered_at):
+        """Record a transition and return the time the new state was entered.
+
+        entered_at is the time when the old state was entered or None.
+        """
+        now = self.clock()
+        machine = get_state_machine_name(state_machine)
+        old = get_state_name(old_state)
+        key = (machine, old, get_state_name(new_state))
+        with self._lock:
+            self.transitions[key] = self.transitions.get(key, 0) + 1
+            if entered_at is not None:
+                self._get_histogram(self.time_in_state, (machine, old)).add(now - entered_at)
+        return now
+
+    def handled_message(self, state_machine, state, message_name, seconds):
+        """Record how long it took to handle a message."""
+        key = (get_state_machine_name(state_machine), get_state_name(state), message_name)
+        with self._lock:
+            self._get_histogram(self.message_handling, key).add(seconds)
+
+    @staticmethod
+    def _get_histogram(histograms, key):
+        """Return the histogram under the key. The lock must be held."""
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram()
+        return histogram
+
+    def reset(self):
+        """Forget all measurements."""
+        with self._lock:
+            self.time_in_state = {}
+            self.message_handling = {}
+            self.transitions = {}
+
+    def toJSON(self):
+        """Return the JSON representation of the measurements."""
+        with self._lock:
+            return {
+                "type": self.__class__.__name__,
+                "time_in_state": [
+                    {"state_machine": machine, "state": state, "seconds": histogram.toJSON()}
+                    for (machine, state), histogram in sorted(self.time_in_state.items())],
+                "message_handling": [
+                    {"state_machine": machine, "state": state, "message": name, "seconds": histogram.toJSON()}
+                    for (machine, state, name), histogram in sorted(self.message_handling.items())],
+                "transitions": [
+                    {"state_machine": machine, "from": old, "to": new, "count": count}
+                    for (machine, old, new), count in sorted(self.transitions.items())]}
+
+    def format_table(self):
+        """Return the measurements as text."""
+        json = self.toJSON()
+        lines = ["{:<40} {:<40} {:>7} {:>10} {:>10} {:>10}".format(
+                 "state machine", "state", "count", "mean", "p90", "max")]
+        def seconds(value):
+            return "-" if value is None else "{:.6f}".format(value)
+        lines.append("time in state:")
+        for entry in json["time_in_state"]:
+            s = entry["seconds"]
+            lines.append("{:<40} {:<40} {:>7} {:>10} {:>10} {:>10}".format(
+                entry["state_machine"], entry["state"], s["count"],
+                seconds(s["mean"]), seconds(s["p90"]), seconds(s["max"])))
+        lines.append("message handling:")
+        for entry in json["message_handling"]:
+            s = entry["seconds"]
+            lines.append("{:<40} {:<40} {:>7} {:>10} {:>10} {:>10}".format(
+                entry["state_machine"], entry["state"] + "." + entry["message"], s["count"],
+                seconds(s["mean"]), seconds(s["p90"]), seconds(s["max"])))
+        lines.append("transitions:")
+        for entry in json["transitions"]:
+            lines.append("{:<40} {:<40} {:>7}".format(
+                entry["state_machine"], entry["from"] + " -> " + entry["to"], entry["count"]))
+        return "\n".join(lines)
+
+    def print_periodically(self, seconds):
+        """Print the measurements every few seconds."""
+        def print_table():
+            print(self.format_table())
+            get_timer_service().call_later(seconds, print_table)
+        get_timer_service().call_later(seconds, print_table)
+
+
+def enable_instrumentation(instrumentation=None):
+    """Record the timing of all state machines and return the Instrumentation."""
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+    StateMachine.instrumentation = instrumentation
+    return instrumentation
+
+
+def disable_instrumentation():
+    """Stop recording the timing of the state machines."""
+    StateMachine.instrumentation = None
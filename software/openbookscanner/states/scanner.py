@@ -5,6 +5,7 @@ This module controls the scanners.
 
 from .hardware_listener import HardwareListener
 from .state import StateMachine, RunningState, FinalState, State, TransitionOnReceivedMessage, PollingState, TimingOut
+from .asynchronous import AsyncStateMachine, AsyncRunningState, run_subprocess
 import subprocess
 import tempfile
 import os
@@ -69,7 +70,7 @@ class AbleToScan(ScannerStateMixin, State):
 
     def receive_scan(self, message):
         """Scan an image."""
-        self.transition_into(Scanning())
+        self.transition_into(self.scanner.scanning_state())
         
     def receive_update(self, message):
         if not self.scanner.check_if_available():
@@ -88,10 +89,16 @@ class Scanning(ScannerStateMixin, RunningState):
         """Perform a scan."""
         directory = tempfile.TemporaryDirectory()
         scan_image = os.path.join(directory.name, "scan.pnm")
-        command = ["scanimage", "--device", self.scanner.device,
-                                "--format", "pnm"]
         with open(scan_image, "wb") as stdout:
-            p = subprocess.run(command, stdout=stdout, stderr=subprocess.PIPE)
+            p = subprocess.run(self.get_scan_command(), stdout=stdout, stderr=subprocess.PIPE)
+        self.scanned(p, scan_image, directory)
+
+    def get_scan_command(self):
+        """Return the command which writes the scan to stdout."""
+        return ["scanimage", "--device", self.scanner.device, "--format", "pnm"]
+
+    def scanned(self, p, scan_image, directory):
+        """Transition depending on the result of the scan command."""
         if p.returncode != 0:
             self.transition_into(UnableToScan(p.stderr.decode()))
             return
@@ -106,6 +113,18 @@ class Scanning(ScannerStateMixin, RunningState):
         self.transition_into(WaitingToBeAvailableAgain(scan))
 
 
+class AsyncScanning(Scanning, AsyncRunningState):
+    """The scanner is currently scanning an image."""
+
+    async def run(self):
+        """Perform a scan without blocking the event loop."""
+        directory = tempfile.TemporaryDirectory()
+        scan_image = os.path.join(directory.name, "scan.pnm")
+        with open(scan_image, "wb") as stdout:
+            p = await run_subprocess(self.get_scan_command(), stdout=stdout)
+        self.scanned(p, scan_image, directory)
+
+
 class WaitingToBeAvailableAgain(ScannerStateMixin, TimingOut):
     """The scanner cannot be accessed shortly after scanning."""
     
@@ -183,6 +202,8 @@ class Scan:
 class Scanner(StateMachine):
     """A Scanner which is connected to the computer."""
     
+    scanning_state = Scanning
+
     def first_state(self):
         """Wait for a message to arrive so we can create scanners with no cost."""
         return TransitionOnReceivedMessage(AbleToScan())
@@ -233,6 +254,12 @@ class Scanner(StateMachine):
         return self.device in self.listener.list_currect_device_ids()
 
 
+class AsyncScanner(AsyncStateMachine, Scanner):
+    """A Scanner which scans on the event loop."""
+
+    scanning_state = AsyncScanning
+
+
 class ScannerListener(HardwareListener):
     """Listen if new scanners get attached.
     """
@@ -248,6 +275,8 @@ class ScannerListener(HardwareListener):
     timeout_for_hardware_changes = 3
     timeout_for_driver_detection = 10
     
+    scanner_class = Scanner
+    
     def __init__(self):
         super().__init__()
         self.device_list = set()
@@ -271,12 +300,37 @@ class ScannerListener(HardwareListener):
         for line in p.stdout.decode().splitlines():
             number, device, type, model, producer = line.split("|")
             self.new_device_list.add(device)
-            scanner = Scanner(self, number, device, type, model, producer)
+            scanner = self.scanner_class(self, number, device, type, model, producer)
             if scanner not in self.get_hardware():
                 self.found_new_hardware(scanner)
                 scanner.update()
         self.device_list = self.new_device_list
 #        print("scanner list", self.list_currect_device_ids())
+
+    def snapshot_hardware(self, scanner):
+        """Return what is needed to create the scanner again."""
+        return {"number": scanner.number, "device": scanner.device, "type": scanner.type,
+                "model": scanner.model, "producer": scanner.producer}
+
+    def restore_hardware(self, snapshot):
+        """Create the scanner from the snapshot.
+        
+        If it is not attached any more, the next listing finds out.
+        """
+        self.device_list.add(snapshot["device"])
+        return self.scanner_class(self, snapshot["number"], snapshot["device"], snapshot["type"],
+                                  snapshot["model"], snapshot["producer"])
+
+
+class AsyncScannerListener(AsyncStateMachine, ScannerListener):
+    """Listen for new scanners which scan on the event loop."""
+
+    scanner_class = AsyncScanner
+
+    def found_new_hardware(self, scanner):
+        """The scanners share the event loop of the listener."""
+        scanner.loop = self.get_event_loop()
+        super().found_new_hardware(scanner)
         
             
       
@@ -2,13 +2,20 @@
 This module contains the common states of all objects.
 
 """
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
+from collections import deque
+import functools
 import sys
+import threading
+import traceback
 from openbookscanner.message import message
-import time
 from openbookscanner.broker import LocalSubscriber
 import atexit
 from openbookscanner.message import MessageDispatcher
+from openbookscanner.versioned_json import VersionedJSON, get_json
+from . import worker_pool
+from . import timer
+from .clock import system_clock
 
 
 class State(MessageDispatcher):
@@ -18,6 +25,14 @@ class State(MessageDispatcher):
         """The state machine enters this state."""
         self.state_machine = state_machine
         self.on_enter()
+
+    def __setattr__(self, name, value):
+        """Public attributes can change the JSON of the state machine."""
+        super().__setattr__(name, value)
+        if not name.startswith("_"):
+            state_machine = self.__dict__.get("state_machine")
+            if state_machine is not None:
+                state_machine.json_changed()
     
     def on_enter(self):
         """Called when the state is entered."""
@@ -33,6 +48,10 @@ class State(MessageDispatcher):
         """Use this to transition into another state."""
         self.state_machine.transition_into(new_state)
     
+    def get_clock(self):
+        """Return the clock of the state machine to measure time with."""
+        return getattr(self.state_machine, "clock", system_clock)
+    
     def toJSON(self):
         return {"type": self.__class__.__name__,
                 "is_final": self.is_final(),
@@ -84,7 +103,7 @@ class FirstState(State):
         raise ValueError("Please use transition_into to get away from this state for {}!".format(self.state_machine))
 
 
-class StateMachine(LocalSubscriber):
+class StateMachine(VersionedJSON, LocalSubscriber):
     """This is the base class for all state machines.
     
     A state machine "stm" implements these patterns:
@@ -97,17 +116,45 @@ class StateMachine(LocalSubscriber):
     - an observable
       state_machine.register_state_observer(observer) adds a new observer which is notified on state changes
       observer.state_changed(stm) notifies the observers about the state change
+    
+    Received messages go into a mailbox.
+    They are processed one after the other, each to completion.
+    The state machine has no thread of its own: receive_message() processes
+    the mailbox in the thread of the caller, e.g. the main loop.
+    If a message arrives while another one is processed, in this or in another thread,
+    it is processed after the current message by the thread which is processing already.
+    post_message() lets the worker pool process the mailbox instead.
+    
+    The result of toJSON() is cached until the state or an attribute changes.
+    Use get_json() and get_json_delta(version) to access it.
+    
+    If instrumentation is set, the time in the states and the time to handle
+    messages is recorded, see the instrumentation module.
+    
+    The states measure time with the clock, see the clock module.
     """
     
     first_state = FirstState
+    clock = system_clock
+    instrumentation = None
+    _state_entered_at = None
     
     def __init__(self):
         """Create a new state machine."""
+        self._mailbox = deque()
+        self._mailbox_lock = threading.Lock()
+        self._is_processing_the_mailbox = False
+        self._processing_lock = threading.RLock()
         super().__init__()
         self.state_observers = []
         self.state = FirstState()
         self.transition_into(self.first_state())
     
+    def __setattr__(self, name, value):
+        """Attributes and the state can change the JSON."""
+        super().__setattr__(name, value)
+        self.json_changed()
+
     def register_state_observer(self, observer):
         """The observer observes the state of the state machine."""
         self.state_observers.append(observer)
@@ -118,14 +165,115 @@ class StateMachine(LocalSubscriber):
 
     def transition_into(self, state):
         """Transition into a new state."""
-        self.state.leave(self)
-        self.state = state
-        self.state.enter(self)
-        self.state_changed()
+        with self._processing_lock:
+            instrumentation = self.instrumentation
+            if instrumentation is not None:
+                # This attribute does not change the JSON.
+                object.__setattr__(self, "_state_entered_at", instrumentation.transitioned(
+                    self, self.state, state, self._state_entered_at))
+            self.state.leave(self)
+            self.state = state
+            self.state.enter(self)
+            self.state_changed()
 
     def receive_message(self, message):
-        """Receive a message and send it to the state."""
-        self.state.receive_message(message)
+        """Put the message into the mailbox and process the mailbox in this thread.
+        
+        If the mailbox is processed already, this returns at once
+        and the processing thread handles the message.
+        Errors of the states are raised in the thread processing the mailbox.
+        """
+        with self._mailbox_lock:
+            self._mailbox.append(message)
+            if self._is_processing_the_mailbox:
+                return
+            self._is_processing_the_mailbox = True
+        self._process_mailbox()
+
+    def post_message(self, message):
+        """Put the message into the mailbox and return without processing it.
+        
+        If no thread is processing the mailbox, the worker pool processes it.
+        Errors of the states are printed because nobody waits for them.
+        """
+        with self._mailbox_lock:
+            self._mailbox.append(message)
+            if self._is_processing_the_mailbox:
+                return
+            self._is_processing_the_mailbox = True
+        self._submit_processing_of_the_mailbox()
+
+    def _submit_processing_of_the_mailbox(self):
+        """Process the mailbox in the worker pool."""
+        try:
+            future = worker_pool.get_worker_pool().submit(self._process_mailbox)
+        except RuntimeError:
+            # The worker pool is shut down because the program is exiting.
+            with self._mailbox_lock:
+                self._is_processing_the_mailbox = False
+            return
+        future.add_done_callback(self._print_error_of_the_mailbox)
+
+    def _print_error_of_the_mailbox(self, future):
+        """Print the error raised while the worker pool processed the mailbox."""
+        error = future.exception()
+        if error is not None:
+            print("Error while {} processed a message:".format(self), file=sys.stderr)
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+    def _process_mailbox(self):
+        """Process the messages in the mailbox until it is empty.
+        
+        The caller must have set _is_processing_the_mailbox.
+        """
+        try:
+            while True:
+                with self._mailbox_lock:
+                    if not self._mailbox:
+                        self._is_processing_the_mailbox = False
+                        return
+                    message = self._mailbox.popleft()
+                with self._processing_lock:
+                    self.process_message(message)
+        except:
+            with self._mailbox_lock:
+                has_messages_left = bool(self._mailbox)
+                self._is_processing_the_mailbox = has_messages_left
+            if has_messages_left:
+                self._submit_processing_of_the_mailbox()
+            raise
+
+    def get_number_of_messages_in_the_mailbox(self):
+        """Return the number of messages waiting to be processed."""
+        return len(self._mailbox)
+
+    def process_message(self, message):
+        """Send a message to the state.
+        
+        The state decides if it reacts to the message when it is processed,
+        so it does not matter which state accepted it.
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            self.state.receive_message(message)
+            return
+        state = self.state
+        start = instrumentation.clock()
+        try:
+            state.receive_message(message)
+        finally:
+            instrumentation.handled_message(self, state, message["name"], instrumentation.clock() - start)
+
+    def accepts_message(self, message_name):
+        """Whether the current state can react to a message of this name.
+        
+        While the mailbox is processed, all messages are accepted
+        because the state can change before the message is processed.
+        """
+        with self._mailbox_lock:
+            if self._is_processing_the_mailbox:
+                return True
+        return self.state.accepts_message(message_name)
     
     def toJSON(self):
         """Return the JSON representation of the object."""
@@ -188,9 +336,11 @@ class ErrorRaisingState(ErrorState):
         raise self.error
 
 _shutdown = False
+SECONDS_TO_WAIT_FOR_THE_WORKERS_AT_EXIT = 1
 def _python_exit():
     global _shutdown
     _shutdown = True
+    worker_pool.shutdown(timeout=SECONDS_TO_WAIT_FOR_THE_WORKERS_AT_EXIT)
 
 atexit.register(_python_exit)
 
@@ -213,8 +363,15 @@ class RunningState(State):
     def enter(self, state_machine):
         """Enter the state and start the parallel execution."""
         super().enter(state_machine)
-        self.executor = ThreadPoolExecutor(max_workers=1)
-        self.future = self.executor.submit(self.run)
+        self.start()
+
+    def start(self):
+        """Start the parallel execution."""
+        self.future = self.get_worker_pool().submit(self.run)
+
+    def get_worker_pool(self):
+        """Return the worker pool which runs this state in parallel."""
+        return worker_pool.get_worker_pool()
     
     def run(self):
         """This is called when the state machine enters the state.
@@ -250,7 +407,7 @@ class RunningState(State):
         if self.is_running():
             super().receive_message(message)
         else:
-            if self.future.exception() is not None: # Errors should never pass silently.
+            if self.get_exception() is not None: # Errors should never pass silently.
                 self.next_state = self.get_error_state()
             super().transition_into(self.next_state)
             self.next_state.receive_message_from_other_state(message)
@@ -265,29 +422,121 @@ class RunningState(State):
         self._stopped = True
         self.wait()
         
+    def get_exception(self):
+        """Return the exception raised while running or None."""
+        return self.future.exception()
+
     def get_error_state(self):
         """Return the error state."""
-        return ErrorRaisingState(self.future.exception())
+        return ErrorRaisingState(self.get_exception())
 
 
 class PollingState(RunningState):
-    """This state runs the poll function all "timeout" seconds and stops on transition."""
-    
-    timeout = 0.001 # TODO: refector to seconds_between_polls
+    """This state runs the poll function all "timeout" seconds and stops on transition.
 
-    def run(self):
-        """Call self.poll() on a regular basis, waiting self.timeout in between.
+    The polls are scheduled by the timer service and run on the worker pool.
+    No thread is used while we wait for the next poll.
+    """
+    
+    timeout = 0.05 # TODO: refector to seconds_between_polls
+
+    def start(self):
+        """Schedule the first poll."""
+        self.future = Future()
+        self.future.set_running_or_notify_cancel()
+        self._poll_lock = threading.Lock()
+        self._poll_timer = None
+        self._poll_generation = 0
+        self._is_polling = False
+        self._has_started_polling = False
+        self._schedule_poll(0)
+
+    def _schedule_poll(self, seconds, unless_polling=False):
+        """Poll after the given seconds. Only the last scheduled poll is run."""
+        with self._poll_lock:
+            if self.future.done() or (unless_polling and self._is_polling):
+                return
+            if self._poll_timer is not None:
+                self._poll_timer.cancel()
+            self._poll_generation += 1
+            self._poll_timer = self.get_timer_service().call_later(
+                seconds, functools.partial(self._submit_poll, self._poll_generation))
+
+    def _submit_poll(self, generation):
+        """The timer is due, poll in the worker pool."""
+        try:
+            self.get_worker_pool().submit(self._poll, generation)
+        except RuntimeError:
+            # The worker pool is shut down because the program is exiting.
+            self._poll(generation)
+
+    def _poll(self, generation):
+        """Call self.poll() once and schedule the next poll.
         
         If the Python program stops, a SystemExit error is raised.
         """
-        self.start_polling()
-        while not self.is_waiting_for_a_message_to_transition_to_the_next_state():
+        with self._poll_lock:
+            if generation != self._poll_generation or self._is_polling or self.future.done():
+                return
+            self._is_polling = True
+        try:
+            try:
+                self._run_poll()
+            finally:
+                with self._poll_lock:
+                    self._is_polling = False
+        except BaseException as error:
+            self.future.set_exception(error)
+            return
+        if self.is_waiting_for_a_message_to_transition_to_the_next_state():
+            self.future.set_result(None)
+        else:
+            self._schedule_poll(self.seconds_until_next_poll())
+
+    def _run_poll(self):
+        """Run one step of polling."""
+        if self.should_stop():
+            raise SystemExit("The program is exiting.")
+        if not self._has_started_polling:
+            self._has_started_polling = True
+            self.start_polling()
+        if not self.is_waiting_for_a_message_to_transition_to_the_next_state():
             self.poll()
-            if not self.is_waiting_for_a_message_to_transition_to_the_next_state():
-                time.sleep(self.timeout)
-            if self.should_stop():
-                raise SystemExit("The program is exiting.")
-    
+        if self.should_stop():
+            raise SystemExit("The program is exiting.")
+
+    def seconds_until_next_poll(self):
+        """Return the seconds to wait until the next poll."""
+        return self.timeout
+
+    def get_timer_service(self):
+        """Return the timer service which schedules the polls with our clock."""
+        return timer.get_timer_service(self.get_clock())
+
+    def wake_up(self):
+        """Poll now instead of waiting for the timeout.
+        
+        If we transitioned, the polling finishes at once.
+        """
+        self._schedule_poll(0, unless_polling=True)
+
+    def transition_into(self, next_state):
+        """Defer the transition and finish polling."""
+        super().transition_into(next_state)
+        self.wake_up()
+
+    def stop(self):
+        """Stop polling."""
+        self._stopped = True
+        self.wake_up()
+        self.wait()
+
+    def leave(self, state_machine):
+        """Stop polling when the state machine leaves this state."""
+        self._stopped = True
+        self.wake_up()
+        super().leave(state_machine)
+
     def poll(self):
         """This is called regularly.
         
@@ -345,7 +594,7 @@ class StateChangeToMessageReceiveAdapter:
     
     def state_changed(self, state_machine):
         """When the state changes, a message is sent to the publisher."""
-        self.publisher.receive_message(message.state_changed(state_machine=state_machine.toJSON()))
+        self.publisher.receive_message(message.state_changed(state_machine=get_json(state_machine)))
 
 
 class PrintStateChanges:
@@ -390,10 +639,14 @@ class TimingOut(PollingState):
     def timeout(self):
         """Provide the right timeout to the PollingState."""
         return float(self.timeout_seconds) / self.numer_of_checks_in_timeout
+
+    def seconds_until_next_poll(self):
+        """Check again after the timeout or when the time is up."""
+        return min(self.timeout, self.seconds_remaining)
         
     def start_polling(self):
         """Remember the time when polling started."""
-        self.start_time = time.time()
+        self.start_time = self.get_clock().time()
         self.start_checking()
     
     @property
@@ -402,7 +655,7 @@ class TimingOut(PollingState):
         
         If the is 0, the timeout occurred.
         """
-        seconds_remaning = self.start_time + self.timeout_seconds - time.time()
+        seconds_remaning = self.start_time + self.timeout_seconds - self.get_clock().time()
         return (seconds_remaning if seconds_remaning > 0 else 0)
         
     def poll(self):
@@ -29,4 +29,15 @@ class StatusStateMachine(StateMachine):
     """This state machine tracks the status of the whole machine."""
 
     first_state = Working
+    states = {state.__name__: state for state in (Working, Error)}
+
+    def snapshot(self):
+        """Return the state to restore after a restart."""
+        return {"state": self.state.__class__.__name__}
+
+    def restore(self, snapshot):
+        """Enter the state of the snapshot."""
+        state = self.states.get(snapshot.get("state"))
+        if state is not None and not isinstance(self.state, state):
+            self.transition_into(state())
 
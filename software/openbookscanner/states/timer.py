@@ -0,0 +1,178 @@
+"""This module contains the timer service which calls functions at a given time.
+
+Instead of a thread which sleeps for each polling state,
+one thread waits for the next deadline of all the timers.
+
+    timer = get_timer_service().call_later(seconds, function)
+    timer.cancel()
+
+The functions are called in the thread of the timer service.
+They should return quickly.
+If you need to do some work, submit it to the worker pool.
+Each clock has its own timer service, see the clock module.
+The thread stops when there is nothing to do and starts again with the next timer.
+
+If the clock does not advance by itself, like a VirtualClock,
+advancing it calls the timers which are due in the thread which advances it.
+"""
+import heapq
+import itertools
+import threading
+import traceback
+from .clock import system_clock
+
+
+class Timer:
+    """A function which is called when the deadline is reached."""
+
+    def __init__(self, deadline, function, sequence_number):
+        """Create a new timer."""
+        self.deadline = deadline
+        self.function = function
+        self.sequence_number = sequence_number
+        self._cancelled = False
+
+    def cancel(self):
+        """Do not call the function."""
+        self._cancelled = True
+
+    def is_cancelled(self):
+        """Whether the timer was cancelled."""
+        return self._cancelled
+
+    def __lt__(self, other):
+        """Timers are ordered by their deadline and then in the order of creation."""
+        return (self.deadline, self.sequence_number) < (other.deadline, other.sequence_number)
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "<{} at {} for {}>".format(self.__class__.__name__, self.deadline, self.function)
+
+
+class TimerService:
+    """Call functions when their deadline is reached.
+
+    The timers are kept in a heap ordered by their deadline.
+    A thread sleeps until the first deadline or until an earlier timer is added.
+    If it has no timers for seconds_until_an_idle_thread_stops, it stops.
+    """
+
+    seconds_until_an_idle_thread_stops = 10
+
+    def __init__(self, name="TimerService", clock=system_clock):
+        """Create a new timer service which uses the time of the clock."""
+        self.name = name
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._timers_changed = threading.Condition(self._lock)
+        self._timers = []
+        self._sequence_numbers = itertools.count()
+        self._thread = None
+        clock.add_observer(self._time_changed)
+
+    def time(self):
+        """Return the current time of the clock in seconds."""
+        return self.clock.time()
+
+    def _time_changed(self):
+        """The clock advanced, call the timers which are due.
+
+        When this returns, the timers which are due were called.
+        """
+        while True:
+            with self._lock:
+                timer = self._pop_due_timer()
+                if timer is None:
+                    if self._thread is None or self._thread is threading.current_thread():
+                        return
+                    # The thread calls a timer which was due before.
+                    self._timers_changed.wait()
+                    continue
+            self._call(timer)
+
+    def call_later(self, seconds, function):
+        """Call the function after a delay of seconds and return the Timer."""
+        return self.call_at(self.time() + seconds, function)
+
+    def call_at(self, deadline, function):
+        """Call the function when the time reaches the deadline and return the Timer."""
+        timer = Timer(deadline, function, next(self._sequence_numbers))
+        with self._lock:
+            heapq.heappush(self._timers, timer)
+            if self._timers[0] is timer:
+                self._timers_changed.notify_all()
+            if self._thread is None and (self.clock.advances_by_itself or deadline <= self.time()):
+                self._start()
+        return timer
+
+    def _start(self):
+        """Start the thread which calls the functions. The lock must be held."""
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self._thread.start()
+
+    def _run(self):
+        """Call the functions of the timers when they are due."""
+        while True:
+            with self._lock:
+                timer = self._get_next_due_timer()
+                if timer is None:
+                    self._thread = None
+                    self._timers_changed.notify_all()
+                    return
+            self._call(timer)
+
+    def _call(self, timer):
+        """Call the function of the timer unless it was cancelled."""
+        if timer.is_cancelled():
+            return
+        try:
+            timer.function()
+        except Exception:
+            traceback.print_exc()
+
+    def _pop_due_timer(self):
+        """Return the next timer which is due or None. The lock must be held."""
+        while self._timers and self._timers[0].is_cancelled():
+            heapq.heappop(self._timers)
+        if self._timers and self._timers[0].deadline <= self.time():
+            return heapq.heappop(self._timers)
+        return None
+
+    def _get_next_due_timer(self):
+        """Wait until a timer is due and return it.
+
+        None is returned if the thread can stop.
+        The lock must be held.
+        """
+        while True:
+            timer = self._pop_due_timer()
+            if timer is not None:
+                return timer
+            if not self.clock.advances_by_itself:
+                # The timers are called when the clock advances.
+                return None
+            if self._timers:
+                self.clock.wait(self._timers_changed, self._timers[0].deadline - self.time())
+            elif not self._timers_changed.wait(self.seconds_until_an_idle_thread_stops) and not self._timers:
+                return None
+
+    def get_number_of_timers(self):
+        """Return the number of timers waiting for their deadline."""
+        return sum(not timer.is_cancelled() for timer in list(self._timers))
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "<{} with {} timers>".format(self.__class__.__name__, self.get_number_of_timers())
+
+
+_timer_services = {} # clock -> TimerService
+_timer_service_lock = threading.Lock()
+
+
+def get_timer_service(clock=system_clock):
+    """Return the timer service shared by all the states which use the clock."""
+    with _timer_service_lock:
+        timer_service = _timer_services.get(clock)
+        if timer_service is None:
+            timer_service = _timer_services[clock] = TimerService(clock=clock)
+        return timer_service
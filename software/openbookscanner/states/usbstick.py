@@ -1,4 +1,5 @@
 from openbookscanner.states.state import StateMachine, State, FinalState, RunningState, PollingState
+from openbookscanner.states.asynchronous import AsyncStateMachine, AsyncRunningState, AsyncPollingState, run_subprocess
 import time
 import tempfile
 import subprocess
@@ -17,7 +18,7 @@ class USBStickStateMixin: # rename to mixin
 class PluggedIn(USBStickStateMixin, State):
     
     def on_enter(self):
-        self.transition_into(USBStickIsMounting())
+        self.transition_into(self.state_machine.mounting_state())
 
 class USBStickIsMounting(USBStickStateMixin, RunningState):
 
@@ -27,12 +28,28 @@ class USBStickIsMounting(USBStickStateMixin, RunningState):
         tempdir = tempfile.mkdtemp(prefix='openbookscanner-usbstick-')
         # Mount USBStick to temporary directory
         # Requires root privilege
-        p = subprocess.run(["mount", self.state_machine.get_mount_partition_path(), tempdir], stdout=subprocess.PIPE)
+        p = subprocess.run(self.get_mount_command(tempdir), stdout=subprocess.PIPE)
+        self.mounted(p, tempdir)
+
+    def get_mount_command(self, tempdir):
+        """Return the command to mount the USB stick."""
+        return ["mount", self.state_machine.get_mount_partition_path(), tempdir]
+
+    def mounted(self, p, tempdir):
+        """Transition depending on the result of the mount command."""
         if p.returncode == 0:
-            self.transition_into(Mounted(tempdir))
+            self.transition_into(self.state_machine.mounted_state(tempdir))
         else:
             self.transition_into(ErrorMounting())
 
+class AsyncUSBStickIsMounting(USBStickIsMounting, AsyncRunningState):
+
+    async def run(self):
+        """Mount the USBStick without blocking the event loop."""
+        tempdir = tempfile.mkdtemp(prefix='openbookscanner-usbstick-')
+        p = await run_subprocess(self.get_mount_command(tempdir))
+        self.mounted(p, tempdir)
+
 class ErrorMounting(USBStickStateMixin, State):
     pass
 
@@ -46,6 +63,10 @@ class Mounted(USBStickStateMixin, PollingState):
     def poll(self):
         """Check if USBStick is still mounted"""
         p = subprocess.run(["mount"], stdout=subprocess.PIPE)
+        self.check_mounts(p)
+
+    def check_mounts(self, p):
+        """Transition if the output of the mount command does not list us as writable."""
         path = self.path.encode()
         if path not in p.stdout or not self.state_machine.is_plugged_in():
             self.transition_into(UnMounted())
@@ -58,6 +79,13 @@ class Mounted(USBStickStateMixin, PollingState):
     
     def no_space_left(self):
         self.transition_into(NoSpaceLeft())
+
+class AsyncMounted(Mounted, AsyncPollingState):
+
+    async def poll(self):
+        """Check if USBStick is still mounted without blocking the event loop"""
+        p = await run_subprocess(["mount"])
+        self.check_mounts(p)
         
 
 class UnMounted(USBStickStateMixin, FinalState):
@@ -74,6 +102,9 @@ class NoSpaceLeft(USBStickStateMixin, FinalState):
 
 class USBStick(StateMachine):
 
+    mounting_state = USBStickIsMounting
+    mounted_state = Mounted
+
     def __init__(self, device, listener):
         """Create a new USB device.
         
@@ -125,3 +156,19 @@ class USBStick(StateMachine):
         d["id"] = self.id
         d["label"] = self.label
         return d
+
+
+class AsyncUSBStick(AsyncStateMachine, USBStick):
+    """A USB stick which is mounted on the event loop."""
+
+    mounting_state = AsyncUSBStickIsMounting
+    mounted_state = AsyncMounted
+
+    def __init__(self, device, listener, loop=None):
+        """Create a new USB device which is mounted on the loop.
+
+        The loop is set before the mounting starts.
+        """
+        if loop is not None:
+            self.loop = loop
+        super().__init__(device, listener)
@@ -3,7 +3,8 @@ import subprocess
 
 from .state import State
 from openbookscanner.states.hardware_listener import HardwareListener
-from openbookscanner.states.usbstick import USBStick
+from openbookscanner.states.usbstick import USBStick, AsyncUSBStick
+from openbookscanner.states.asynchronous import AsyncStateMachine
 
 
 class InitializationFailed(State):
@@ -15,6 +16,8 @@ class InitializationFailed(State):
 
 class USBStickListener(HardwareListener): 
 
+    usb_stick_class = USBStick
+
     def __init__(self):
         super().__init__()
 
@@ -34,7 +37,20 @@ class USBStickListener(HardwareListener):
         new_block_devices = self.get_block_devices()
         
         for new_block_device in new_block_devices.difference(self._block_devices):
-            self.found_new_hardware(USBStick(new_block_device, self))
+            self.found_new_hardware(self.create_usb_stick(new_block_device))
 
         self._block_devices = new_block_devices
 
+    def create_usb_stick(self, device):
+        """Return a new USB stick for the device."""
+        return self.usb_stick_class(device, self)
+
+
+class AsyncUSBStickListener(AsyncStateMachine, USBStickListener):
+    """Listen for USB sticks which are mounted on the event loop."""
+
+    usb_stick_class = AsyncUSBStick
+
+    def create_usb_stick(self, device):
+        """The USB sticks share the event loop of the listener."""
+        return self.usb_stick_class(device, self, loop=self.get_event_loop())
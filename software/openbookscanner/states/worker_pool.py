@@ -0,0 +1,160 @@
+"""This module contains the worker pool which runs the parallel activity of the states.
+
+All RunningStates share one pool of worker threads.
+This way, we do not create a new thread for each state we enter.
+
+    pool = get_worker_pool()
+    future = pool.submit(function)
+"""
+from concurrent.futures import Future
+from collections import deque
+import threading
+import time
+
+
+DEFAULT_NUMBER_OF_WORKERS = 8
+
+
+class WorkerPool:
+    """A bounded pool of worker threads which run submitted functions."""
+
+    def __init__(self, number_of_workers=DEFAULT_NUMBER_OF_WORKERS, name="WorkerPool"):
+        """Create a new pool which starts up to number_of_workers threads."""
+        if number_of_workers < 1:
+            raise ValueError("A worker pool needs at least one worker, not {}.".format(number_of_workers))
+        self.number_of_workers = number_of_workers
+        self.name = name
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._queue = deque()
+        self._workers = []
+        self._idle_workers = 0
+        self._busy_workers = 0
+        self._is_shut_down = False
+
+    def submit(self, function, *args, **kw):
+        """Run the function in a worker thread and return a concurrent.futures.Future."""
+        future = Future()
+        with self._lock:
+            if self._is_shut_down:
+                raise RuntimeError("Can not submit to {} after it was shut down.".format(self))
+            self._queue.append((future, function, args, kw))
+            if self._idle_workers:
+                self._work_available.notify()
+            elif len(self._workers) < self.number_of_workers:
+                self._start_worker()
+        return future
+
+    def _start_worker(self):
+        """Start a new worker thread. The lock must be held."""
+        thread = threading.Thread(target=self._work, daemon=True,
+                                  name="{}-{}".format(self.name, len(self._workers)))
+        self._workers.append(thread)
+        thread.start()
+
+    def _work(self):
+        """Run the queued functions until the pool is shut down."""
+        while True:
+            with self._lock:
+                while not self._queue and not self._is_shut_down:
+                    self._idle_workers += 1
+                    self._work_available.wait()
+                    self._idle_workers -= 1
+                if not self._queue:
+                    return
+                future, function, args, kw = self._queue.popleft()
+                self._busy_workers += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = function(*args, **kw)
+                    except BaseException as error:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self._lock:
+                    self._busy_workers -= 1
+
+    def get_queue_depth(self):
+        """Return the number of functions waiting for a worker."""
+        return len(self._queue)
+
+    def get_busy_workers(self):
+        """Return the number of workers which currently run a function."""
+        return self._busy_workers
+
+    def get_number_of_threads(self):
+        """Return the number of threads started so far."""
+        return len(self._workers)
+
+    def is_shut_down(self):
+        """Whether the pool accepts no more work."""
+        return self._is_shut_down
+
+    def shutdown(self, wait=True, timeout=None):
+        """Stop accepting work and let the workers finish the queued functions.
+
+        If wait is True, this waits for the worker threads to finish.
+        timeout is given in seconds.
+        """
+        with self._lock:
+            self._is_shut_down = True
+            self._work_available.notify_all()
+            workers = list(self._workers)
+        if wait:
+            stop = None if timeout is None else time.time() + timeout
+            for worker in workers:
+                if worker is not threading.current_thread():
+                    worker.join(None if stop is None else max(0, stop - time.time()))
+
+    def toJSON(self):
+        """Return the JSON representation of the pool's load."""
+        return {"type": self.__class__.__name__,
+                "number_of_workers": self.number_of_workers,
+                "number_of_threads": self.get_number_of_threads(),
+                "busy_workers": self.get_busy_workers(),
+                "queue_depth": self.get_queue_depth()}
+
+    def __repr__(self):
+        """Return the string representation."""
+        return "<{} {} busy of {} workers, {} queued>".format(
+            self.__class__.__name__, self.get_busy_workers(),
+            self.number_of_workers, self.get_queue_depth())
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+_number_of_workers = DEFAULT_NUMBER_OF_WORKERS
+
+
+def get_worker_pool():
+    """Return the worker pool shared by all the states."""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = WorkerPool(_number_of_workers)
+        return _worker_pool
+
+
+def set_number_of_workers(number_of_workers):
+    """Configure how many threads the shared worker pool may use.
+
+    This replaces the shared pool.
+    States which are running at the moment finish on the old pool.
+    """
+    global _worker_pool, _number_of_workers
+    with _worker_pool_lock:
+        _number_of_workers = number_of_workers
+        old_pool = _worker_pool
+        _worker_pool = WorkerPool(number_of_workers)
+    if old_pool is not None:
+        old_pool.shutdown(wait=False)
+
+
+def shutdown(wait=True, timeout=None):
+    """Shut down the shared worker pool."""
+    with _worker_pool_lock:
+        pool = _worker_pool
+    if pool is not None:
+        pool.shutdown(wait=wait, timeout=timeout)
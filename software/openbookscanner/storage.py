@@ -4,6 +4,8 @@ from .message import MessageDispatcher, message
 from openbookscanner.broker import LocalSubscriber
 import tempfile
 from .file_server import FileServer
+from .versioned_json import VersionedJSON, get_json
+from .conversion import Image
 import os
 
 
@@ -21,10 +23,14 @@ class DirectoryStorage:
         path = os.path.join(self.directory, file_name)
         file.copy_to(path)
         self.files.append(file)
+
+    def restore(self, file):
+        """Keep a file which was stored before a restart without copying it."""
+        self.files.append(file)
     
     def toJSON(self):
         """Return the JSON represenation."""
-        return {"path": self.directory, "images": [file.toJSON() for file in self.files],
+        return {"path": self.directory, "images": [get_json(file) for file in self.files],
                 "type": self.__class__.__name__}
 
 
@@ -37,7 +43,7 @@ class TemporaryStorageLocation(DirectoryStorage):
         super().__init__(self.__temp_directory.name)
     
 
-class UserDefinedStorageLocation(MessageDispatcher, LocalSubscriber):
+class UserDefinedStorageLocation(VersionedJSON, MessageDispatcher, LocalSubscriber):
     """This gives the user the ability to define the storage location."""
     
     default_storage = TemporaryStorageLocation
@@ -66,6 +72,7 @@ class UserDefinedStorageLocation(MessageDispatcher, LocalSubscriber):
     
     def state_changed(self):
         """Notify the overservers about the state change."""
+        self.json_changed()
         for observer in self.state_observers:
             observer.state_changed(self)
     
@@ -74,6 +81,19 @@ class UserDefinedStorageLocation(MessageDispatcher, LocalSubscriber):
         return {"type": self.__class__.__name__, "storage": self.storage.toJSON(), 
                 "description": self.__class__.__doc__}
         
+    def snapshot(self):
+        """Return the stored images to restore after a restart."""
+        return {"images": [file.snapshot() for file in self.storage.files]}
+
+    def restore(self, snapshot):
+        """Serve the images of the snapshot again if their files still exist."""
+        for image_snapshot in snapshot.get("images", []):
+            image = Image.fromSnapshot(image_snapshot)
+            if image is not None:
+                self.storage.restore(image)
+                self.server.add_file(image)
+        self.state_changed()
+
     def run_in_parallel(self):
         """Run the server in parellel."""
         self.server.run_in_parallel()
@@ -8,6 +8,7 @@ from unittest.mock import Mock
 from openbookscanner.message import message
 from openbookscanner.states.hardware_listener import HardwareListener
 from openbookscanner.states.usbstick_listener import USBStickListener
+from openbookscanner.states.clock import VirtualClock
 
 #import hanging_threads
 #
@@ -64,9 +65,11 @@ class PollingDone(State):
 
 class StateMachineX(StateMachine):
 
-    def __init__(self, state):
+    def __init__(self, state, clock=None):
         super().__init__()
         self.stop_polling = False
+        if clock is not None:
+            self.clock = clock
         self.transition_into(state)
 
     def transition_into(self, new_state):
@@ -174,10 +177,11 @@ class TestHardwareListener(HardwareListener):
 
     driver_support = False
     
-    timeout_for_driver_detection = 0.0001
-    timeout_for_hardware_changes = 0.0001
+    timeout_for_driver_detection = 1
+    timeout_for_hardware_changes = 1
     
     def __init__(self):
+        self.clock = VirtualClock()
         super().__init__()
         print("init")
 
@@ -0,0 +1,83 @@
+from openbookscanner.states.asynchronous import (
+    AsyncStateMachine, AsyncRunningState, AsyncPollingState, AsyncTimingOut,
+    run_subprocess)
+from openbookscanner.states import State, TimedOut
+from pytest import fixture
+import asyncio
+
+
+@fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+class Done(State):
+    pass
+
+
+class RunningX(AsyncRunningState):
+
+    async def run(self):
+        await asyncio.sleep(0)
+        self.transition_into(Done())
+
+
+class PollingX(AsyncPollingState):
+
+    polls = 0
+
+    def poll(self):
+        self.polls += 1
+        if self.polls == 3:
+            self.transition_into(Done())
+
+
+class TimingOutX(AsyncTimingOut):
+
+    timeout_seconds = 0.01
+
+
+class AsyncStateMachineX(AsyncStateMachine):
+
+    def __init__(self, loop, state):
+        self.loop = loop
+        super().__init__()
+        self.transition_into(state)
+
+
+def run_until_state(loop, m, state_class):
+    async def wait_for_state():
+        while not isinstance(m.state, state_class):
+            await asyncio.sleep(0.001)
+    loop.run_until_complete(asyncio.wait_for(wait_for_state(), 1))
+
+
+def test_running_state_transitions_when_done(loop):
+    m = AsyncStateMachineX(loop, RunningX())
+    run_until_state(loop, m, Done)
+
+
+def test_polling_state_polls_until_transition(loop):
+    state = PollingX()
+    m = AsyncStateMachineX(loop, state)
+    run_until_state(loop, m, Done)
+    assert state.polls == 3
+
+
+def test_timing_out(loop):
+    m = AsyncStateMachineX(loop, TimingOutX())
+    run_until_state(loop, m, TimedOut)
+
+
+def test_wait_outside_of_the_loop(loop):
+    m = AsyncStateMachineX(loop, TimingOutX())
+    m.state.wait(1)
+    assert not m.state.is_running()
+
+
+def test_run_subprocess(loop):
+    p = loop.run_until_complete(run_subprocess(["echo", "test"]))
+    assert p.returncode == 0
+    assert p.stdout == b"test\n"
@@ -1,6 +1,13 @@
-from openbookscanner.update_strategy import OnChangeStrategy, BatchStrategy
+from openbookscanner.update_strategy import OnChangeStrategy, BatchStrategy, ArrayOperation, AttributeUpdate, \
+    Increment, is_transient_error
+from parse_rest.core import ParseBatchError, ParseError, ResourceRequestBadRequest, ResourceRequestNotFound
+from urllib.error import HTTPError, URLError
 from unittest.mock import Mock
 from pytest import fixture
+import io
+import pytest
+import threading
+import time
 
 
 class TestOnChangeStrategy:
@@ -72,3 +79,384 @@ class TestBatchStrategy:
         s.batch()
         batcher.batch.assert_not_called()
 
+
+    def test_saves_are_merged(self, s, mock, batcher):
+        callbacks = [Mock(), Mock()]
+        s.save(mock, callbacks[0])
+        s.save(mock, callbacks[1])
+        s.batch()
+        batcher.batch.assert_called_once_with([mock.save])
+        callbacks[0].assert_called_once_with()
+        callbacks[1].assert_called_once_with()
+
+    def test_saves_of_different_objects_are_not_merged(self, s, batcher):
+        objects = [Mock(), Mock()]
+        for obj in objects + objects:
+            s.save(obj)
+        s.batch()
+        batcher.batch.assert_called_once_with([obj.save for obj in objects])
+
+    def test_delete_cancels_the_save(self, s, mock, batcher):
+        callback = Mock()
+        s.save(mock, callback)
+        s.delete(mock)
+        s.batch()
+        batcher.batch.assert_called_once_with([mock.delete])
+        callback.assert_not_called()
+
+    def test_save_after_array_operation_is_not_merged(self, s, mock, batcher):
+        s.save(mock)
+        s.addToArray(mock, "messages", [1])
+        s.save(mock)
+        s.batch()
+        operations = batcher.batch.call_args[0][0]
+        assert operations[0] == operations[2] == mock.save
+        assert len(operations) == 3
+
+    def test_attribute_updates_are_merged(self, s, mock, batcher):
+        s.saveAttributes(mock, ["a"])
+        s.saveAttributes(mock, ["b", "a"])
+        s.batch()
+        operations = batcher.batch.call_args[0][0]
+        assert len(operations) == 1
+        assert operations[0].attribute_names == ["a", "b"]
+
+    def test_save_includes_the_attribute_update(self, s, mock, batcher):
+        s.saveAttributes(mock, ["a"])
+        s.save(mock)
+        s.batch()
+        operation = batcher.batch.call_args[0][0][0]
+        operation(batch=True)
+        mock.save.assert_called_once_with(batch=True)
+
+    def test_attributes_of_a_new_object_are_saved_completely(self, s, mock, batcher):
+        mock.objectId = None
+        s.saveAttributes(mock, ["a"])
+        s.batch()
+        batcher.batch.assert_called_once_with([mock.save])
+
+    def test_attribute_update_sends_a_put_request(self):
+        class Holder:
+            PUT = Mock(return_value="request")
+            _absolute_url = "/classes/Holder/id"
+            a = 1
+            b = 2
+        assert AttributeUpdate(Holder(), ["a"])(batch=True)[0] == "request"
+        Holder.PUT.assert_called_once_with("/classes/Holder/id", batch=True, a=1)
+
+
+class TestBatchedArrayOperations:
+
+    @fixture
+    def batcher(self):
+        return Mock()
+
+    @fixture
+    def s(self, batcher):
+        s = BatchStrategy()
+        s.new_batcher = lambda: batcher
+        return s
+
+    def batched_operations(self, batcher):
+        return [(operation.operation, operation.objects)
+                for call in batcher.batch.call_args_list for operation in call[0][0]]
+
+    def test_add_waits(self, s, mock):
+        s.addToArray(mock, "messages", [1])
+        mock.addToArray.assert_not_called()
+
+    def test_additions_are_merged(self, s, mock, batcher):
+        s.addToArray(mock, "messages", [1])
+        s.addToArray(mock, "messages", [2, 3])
+        s.batch()
+        assert self.batched_operations(batcher) == [("Add", [1, 2, 3])]
+
+    def test_different_arrays_are_not_merged(self, s, mock, batcher):
+        s.addToArray(mock, "messages", [1])
+        s.addToArray(mock, "other", [2])
+        s.batch()
+        assert self.batched_operations(batcher) == [("Add", [1]), ("Add", [2])]
+
+    def test_removal_drops_the_addition(self, s, mock, batcher):
+        s.addToArray(mock, "messages", [1, 2])
+        s.removeFromArray(mock, "messages", [1])
+        s.batch()
+        assert self.batched_operations(batcher) == [("Add", [2]), ("Remove", [1])]
+
+    def test_empty_additions_are_not_sent(self, s, mock, batcher):
+        callback = Mock()
+        s.addToArray(mock, "messages", [1], callback)
+        s.removeFromArray(mock, "messages", [1])
+        s.batch()
+        assert self.batched_operations(batcher) == [("Remove", [1])]
+        callback.assert_called_once_with()
+
+    def test_addition_after_removal_is_kept_in_order(self, s, mock, batcher):
+        s.removeFromArray(mock, "messages", [1])
+        s.addToArray(mock, "messages", [1])
+        s.batch()
+        assert self.batched_operations(batcher) == [("Remove", [1]), ("Add", [1])]
+
+    def test_save_is_not_overtaken(self, s, mock, batcher):
+        s.addToArray(mock, "messages", [1])
+        s.save(mock)
+        s.addToArray(mock, "messages", [2])
+        s.batch()
+        operations = batcher.batch.call_args[0][0]
+        assert operations[1] == mock.save
+        assert [operations[0].objects, operations[2].objects] == [[1], [2]]
+
+    def test_at_most_50_operations_per_request(self, s, batcher):
+        for i in range(120):
+            s.addToArray(Mock(), "messages", [i])
+        s.batch()
+        # the requests are sent in parallel
+        assert sorted(len(call[0][0]) for call in batcher.batch.call_args_list) == [20, 50, 50]
+
+    def test_rejected_operations_are_passed_to_their_error_callback(self, s, batcher):
+        errors = []
+        callback = Mock()
+        s.addToArray(Mock(), "messages", [1], error_callback=errors.append)
+        s.addToArray(Mock(), "messages", [2], callback, error_callback=errors.append)
+        def batch(operations):
+            operations[0]._update_object({})
+            raise ParseBatchError([{"code": 101, "error": "Object not found."}])
+        batcher.batch.side_effect = batch
+        s.batch()
+        assert errors == [{"code": 101, "error": "Object not found."}]
+        callback.assert_called_once_with()
+
+    def test_rejected_operations_without_error_callback_raise(self, s, batcher):
+        s.addToArray(Mock(), "messages", [1])
+        batcher.batch.side_effect = ParseBatchError([{"code": 101, "error": "Object not found."}])
+        with pytest.raises(ParseBatchError):
+            s.batch()
+
+    def test_operation_sends_a_put_request(self):
+        class Holder:
+            PUT = Mock()
+            _absolute_url = "/classes/Holder/id"
+        holder = Holder()
+        holder.messages = [0]
+        operation = ArrayOperation(holder, "messages", ArrayOperation.ADD)
+        operation.add([1], Mock())
+        request, callback = operation(batch=True)
+        Holder.PUT.assert_called_once_with(
+            "/classes/Holder/id", batch=True, messages={"__op": "Add", "objects": [1]})
+        callback({})
+        assert holder.messages == [0, 1]
+
+    def test_increments_are_merged(self, s, batcher):
+        counter = Mock()
+        numbers = []
+        s.increment(counter, "sequence", 1, numbers.append)
+        s.increment(counter, "sequence", 2, numbers.append)
+        batcher.batch.assert_not_called()
+        s.batch()
+        operation, = batcher.batch.call_args[0][0]
+        assert operation.amounts == [1, 2]
+        operation._update_object({"sequence": 10})
+        operation.call_callbacks()
+        assert numbers == [8, 10]
+        assert counter.sequence == 10
+
+    def test_increment_sends_a_put_request(self):
+        class Counter:
+            PUT = Mock()
+            _absolute_url = "/classes/Counter/id"
+        counter = Counter()
+        operation = Increment(counter, "sequence")
+        operation.add(2)
+        request, callback = operation(batch=True)
+        Counter.PUT.assert_called_once_with(
+            "/classes/Counter/id", batch=True, sequence={"__op": "Increment", "amount": 2})
+        callback({"sequence": 5})
+        assert counter.sequence == 5
+
+    def test_rejected_increments_do_not_call_back(self):
+        operation = Increment(Mock(), "sequence")
+        callback = Mock()
+        operation.add(1, callback)
+        operation.call_callbacks()
+        callback.assert_not_called()
+
+
+
+class TestParallelBatches:
+
+    @fixture
+    def s(self):
+        s = BatchStrategy()
+        s.maximum_operations_per_request = 2
+        s.requests = []
+        s.lock = threading.Lock()
+        def new_batcher():
+            batcher = Mock()
+            def batch(operations):
+                time.sleep(0.05)
+                with s.lock:
+                    s.requests.append([(operation.obj, operation.objects) for operation in operations])
+            batcher.batch.side_effect = batch
+            return batcher
+        s.new_batcher = new_batcher
+        return s
+
+    def test_independent_requests_are_sent_in_parallel(self, s):
+        for i in range(8):
+            s.addToArray(Mock(), "messages", [i])
+        started = time.time()
+        s.batch()
+        assert len(s.requests) == 4
+        assert time.time() - started < 0.15 # one after the other takes 0.2 seconds
+
+    def test_operations_of_an_object_stay_in_order(self, s):
+        objects = [Mock() for i in range(3)]
+        for i in range(12):
+            s.addToArray(objects[i % 3], "messages", [i])
+            s.removeFromArray(objects[i % 3], "messages", [100 + i])
+        s.batch()
+        for obj in objects:
+            sent = [objects for request in s.requests for o, objects in request if o is obj]
+            assert sent == sorted(sent, key=lambda objects: objects[0] % 100)
+            assert len(sent) == 8
+
+    def test_callbacks_are_called_when_the_request_is_done(self, s):
+        callbacks = [Mock() for i in range(5)]
+        for callback in callbacks:
+            s.addToArray(Mock(), "messages", [1], callback)
+        s.batch()
+        for callback in callbacks:
+            callback.assert_called_once_with()
+
+    def test_requests_after_a_failed_request_remain(self, s):
+        obj = Mock()
+        def fail(operations):
+            raise ValueError()
+        batchers = iter([Mock(batch=fail)] + [Mock() for i in range(5)])
+        s.new_batcher = lambda: next(batchers)
+        s.addToArray(obj, "messages", [1])
+        s.addToArray(Mock(), "messages", [2])
+        other = Mock()
+        s.save(obj)
+        s.save(other)
+        with pytest.raises(ValueError):
+            s.batch()
+        # the second request changes obj after the first one
+        assert [entry[0] for entry in s._batch] == [obj.save, other.save]
+
+    def test_requests_which_did_not_reach_the_server_are_sent_again(self, s):
+        obj = Mock()
+        def fail(operations):
+            raise URLError("connection refused")
+        batchers = iter([Mock(batch=fail)] + [Mock() for i in range(5)])
+        s.new_batcher = lambda: next(batchers)
+        s.addToArray(obj, "messages", [1])
+        s.addToArray(Mock(), "messages", [2])
+        other = Mock()
+        s.save(obj)
+        s.save(other)
+        with pytest.raises(URLError):
+            s.batch()
+        # the failed request is sent before the one which depends on it
+        assert [entry[0].objects for entry in list(s._batch)[:2]] == [[1], [2]]
+        assert [entry[0] for entry in list(s._batch)[2:]] == [obj.save, other.save]
+        assert s.get_number_of_pending_operations() == 4
+
+    def test_a_single_request_is_sent_again(self):
+        s = BatchStrategy()
+        s.new_batcher = lambda: Mock(batch=Mock(side_effect=URLError("connection refused")))
+        obj = Mock()
+        s.save(obj)
+        with pytest.raises(URLError):
+            s.batch()
+        assert [entry[0] for entry in s._batch] == [obj.save]
+        s.new_batcher = Mock
+        s.batch()
+        assert s.get_number_of_pending_operations() == 0
+
+
+class TestAutomaticFlushing:
+
+    @fixture
+    def batcher(self):
+        return Mock()
+
+    @fixture
+    def s(self, batcher):
+        s = BatchStrategy()
+        s.new_batcher = lambda: batcher
+        yield s
+        s.stop_flushing()
+
+    def test_nothing_is_sent_without_the_flusher(self, s, batcher):
+        s.flush_after_operations = 1
+        s.save(Mock())
+        time.sleep(0.05)
+        batcher.batch.assert_not_called()
+
+    def test_flush_after_operations(self, s, batcher):
+        s.flush_after_operations = 3
+        s.start_flushing()
+        s.save(Mock())
+        s.save(Mock())
+        time.sleep(0.05)
+        batcher.batch.assert_not_called()
+        s.save(Mock())
+        timeout(lambda: batcher.batch.called)
+        assert len(batcher.batch.call_args[0][0]) == 3
+
+    def test_flush_after_seconds(self, s, batcher):
+        s.flush_after_seconds = 0.1
+        s.start_flushing()
+        time.sleep(0.02) # the flusher waits for an empty batch
+        s.save(Mock())
+        time.sleep(0.02)
+        batcher.batch.assert_not_called()
+        timeout(lambda: batcher.batch.called)
+
+    def test_stop_flushing(self, s, batcher):
+        s.flush_after_operations = 1
+        s.start_flushing()
+        s.stop_flushing()
+        s.save(Mock())
+        time.sleep(0.05)
+        batcher.batch.assert_not_called()
+
+    def test_the_pending_operations_are_bounded(self, s):
+        sending = threading.Event()
+        release = threading.Event()
+        batcher = Mock()
+        def batch(operations):
+            sending.set()
+            release.wait(1)
+        batcher.batch.side_effect = batch
+        s.new_batcher = lambda: batcher
+        s.maximum_pending_operations = 2
+        s.start_flushing()
+        s.save(Mock())
+        s.save(Mock())
+        sending.wait(1)
+        s.save(Mock())
+        s.save(Mock())
+        adder = threading.Thread(target=s.save, args=(Mock(),), daemon=True)
+        adder.start()
+        adder.join(0.05)
+        assert adder.is_alive()
+        assert s.get_number_of_pending_operations() == 2
+        release.set()
+        adder.join(1)
+        assert not adder.is_alive()
+
+
+@pytest.mark.parametrize("error,transient", [
+    (URLError("connection refused"), True),
+    (ConnectionResetError(), True),
+    (ParseError("internal server error"), True),
+    (HTTPError("/", 503, "unavailable", {}, io.BytesIO()), True),
+    (HTTPError("/", 429, "too many requests", {}, io.BytesIO()), True),
+    (HTTPError("/", 400, "bad request", {}, io.BytesIO()), False),
+    (ResourceRequestBadRequest("invalid"), False),
+    (ResourceRequestNotFound("not found"), False),
+    (ValueError(), False)])
+def test_transient_errors(error, transient):
+    assert is_transient_error(error) == transient
@@ -0,0 +1,77 @@
+from openbookscanner.states.clock import VirtualClock
+from openbookscanner.states.timer import TimerService
+from openbookscanner.states import TimingOut, TimedOut
+from pytest import fixture, raises
+from .conftest import StateMachineX
+import threading
+
+
+@fixture
+def clock():
+    return VirtualClock()
+
+
+def test_virtual_time_only_changes_when_advanced(clock):
+    assert clock.time() == 0
+    clock.advance(3)
+    assert clock.time() == 3
+    clock.sleep(2)
+    assert clock.time() == 5
+
+
+def test_virtual_time_does_not_go_back(clock):
+    with raises(ValueError):
+        clock.advance(-1)
+
+
+def test_timers_are_called_when_the_clock_advances(clock):
+    timers = TimerService(clock=clock)
+    called = threading.Event()
+    timers.call_later(60, called.set)
+    assert not called.wait(0.01)
+    clock.advance(59)
+    assert not called.wait(0.01)
+    clock.advance(1)
+    assert called.wait(1)
+
+
+def test_advance_calls_the_due_timers_before_it_returns(clock):
+    timers = TimerService(clock=clock)
+    threads = []
+    timers.call_later(10, lambda: threads.append(threading.current_thread()))
+    clock.advance(10)
+    assert threads == [threading.current_thread()]
+
+
+def test_timers_which_are_due_are_called_without_advancing(clock):
+    timers = TimerService(clock=clock)
+    called = threading.Event()
+    timers.call_later(0, called.set)
+    assert called.wait(1)
+
+
+def test_no_thread_waits_for_the_virtual_time(clock):
+    timers = TimerService(clock=clock)
+    timers.call_later(0, lambda: None)
+    timers.call_later(10, lambda: None)
+    timeout(lambda: timers._thread is None)
+
+
+class LongTimingOut(TimingOut):
+
+    timeout_seconds = 3600
+
+
+class VirtualStateMachine(StateMachineX):
+
+    clock = VirtualClock()
+
+
+def test_timing_out_uses_the_clock_of_the_state_machine():
+    m = VirtualStateMachine(LongTimingOut())
+    timeout(lambda: hasattr(m.state, "start_time"))
+    assert m.state.seconds_remaining == 3600
+    m.clock.advance(3600)
+    m.state.wait(1)
+    m.update()
+    assert isinstance(m.state, TimedOut)
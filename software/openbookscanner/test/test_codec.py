@@ -0,0 +1,77 @@
+from openbookscanner.codec import get_codec, decode_message, codecs, CompactCodec, COMPACT_MARKER, \
+    register_schema, get_schemas, schemas
+from openbookscanner.message import message
+from unittest.mock import patch
+import pytest
+
+
+MESSAGES = [
+    message.test(),
+    message.test(a=1, b=[1, "x"]),
+    message.state_changed(state_machine={"type": "Scanner", "state": {"type": "Scanning"}}),
+    message.new_book_scanner_server(id="abc", extra=True),
+    message.update(type="command"),
+]
+
+
+@pytest.mark.parametrize("name", sorted(codecs))
+@pytest.mark.parametrize("m", MESSAGES)
+def test_encode_and_decode(name, m):
+    codec = get_codec(name)
+    string = codec.encode(m)
+    assert isinstance(string, str)
+    assert decode_message(string) == m
+    assert codec.decode(string) == m
+
+
+@pytest.mark.parametrize("name", sorted(codecs))
+def test_dicts_can_be_encoded(name):
+    string = get_codec(name).encode({"name": "test", "type": "message", "x": 1})
+    assert decode_message(string) == message.test(x=1)
+
+
+def test_compact_codec_leaves_out_the_keys_of_the_schema():
+    m = message.new_book_scanner_server(id="abc")
+    string = get_codec("compact").encode(m)
+    assert string == COMPACT_MARKER + '["new_book_scanner_server",["abc"]]'
+    assert len(string) < len(get_codec("json").encode(m))
+
+
+def test_compact_codec_keeps_keys_which_do_not_fit_the_schema():
+    string = get_codec("compact").encode(message.new_book_scanner_server(id="abc", extra=True))
+    assert '"id":"abc"' in string
+
+
+def test_compact_codec_keeps_the_description_of_the_state_machine():
+    m = message.state_changed(state_machine={"type": "Scanner", "description": "A scanner."})
+    string = get_codec("compact").encode(m)
+    assert decode_message(string)["state_machine"]["description"] == "A scanner."
+    assert decode_message(string)["description"] == m.description
+
+
+def test_registered_schemas_are_given_to_the_clients():
+    with patch.dict(schemas):
+        register_schema("test", ["a", "b"])
+        assert get_schemas()["test"] == ["a", "b"]
+        assert get_schemas()["state_changed"] == ["state_machine"]
+        string = get_codec("compact").encode(message.test(a=1, b=2))
+    assert string == COMPACT_MARKER + '["test",[1,2]]'
+
+
+def test_compact_codec_needs_the_marker():
+    with pytest.raises(ValueError):
+        get_codec("compact").decode(get_codec("json").encode(message.test()))
+
+
+def test_a_message_is_encoded_once_per_codec():
+    codec = CompactCodec()
+    m = message.test()
+    with patch.object(codec, "encode", return_value="encoded") as encode:
+        assert codec.encode_cached(m) == "encoded"
+        assert codec.encode_cached(m) == "encoded"
+    encode.assert_called_once_with(m)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec("xml")
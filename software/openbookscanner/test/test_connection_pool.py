@@ -0,0 +1,127 @@
+from openbookscanner.connection_pool import ConnectionPool, install_connection_pool, uninstall_connection_pool
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.error import HTTPError, URLError
+from urllib.request import Request
+import parse_rest.connection
+import pytest
+import threading
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/dropped":
+            self.close_connection = True
+            return
+        status = 404 if self.path == "/missing" else 200
+        body = "{} {}".format(self.command, self.path).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/broken":
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nbro")
+            self.close_connection = True
+            return
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(("localhost", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://localhost:{}".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool(maximum_connections_per_host=2, timeout=5)
+    yield pool
+    pool.close()
+
+
+def test_connections_are_reused(server, pool):
+    for i in range(3):
+        response = pool.urlopen(Request(server + "/classes/x"))
+        assert response.read() == b"GET /classes/x"
+    assert pool.new_connections == 1
+    assert pool.reused_connections == 2
+    assert pool.get_number_of_idle_connections() == 1
+
+
+def test_method_and_data(server, pool):
+    request = Request(server + "/batch", b"{}", {"Content-Type": "application/json"})
+    request.get_method = lambda: "POST"
+    assert pool.urlopen(request).read() == b"POST /batch"
+
+
+def test_errors_are_raised_like_urlopen(server, pool):
+    with pytest.raises(HTTPError) as error:
+        pool.urlopen(Request(server + "/missing"))
+    assert error.value.code == 404
+    assert error.value.read() == b"GET /missing"
+
+
+def test_a_closed_connection_is_replaced(server, pool):
+    pool.urlopen(Request(server + "/"))
+    pool._idle[next(iter(pool._idle))][0].sock.close()
+    assert pool.urlopen(Request(server + "/")).read() == b"GET /"
+    assert pool.new_connections == 2
+
+
+def test_a_request_which_reached_the_server_is_not_sent_again(server, pool):
+    pool.urlopen(Request(server + "/"))
+    request = Request(server + "/broken", b"{}")
+    request.get_method = lambda: "POST"
+    with pytest.raises(URLError):
+        pool.urlopen(request)
+    assert pool.new_connections == 1
+
+
+def test_a_post_is_not_sent_again_if_the_server_closes_the_connection(server, pool):
+    pool.urlopen(Request(server + "/"))
+    request = Request(server + "/dropped", b"{}")
+    request.get_method = lambda: "POST"
+    with pytest.raises(URLError):
+        pool.urlopen(request)
+    assert pool.new_connections == 1
+
+
+def test_a_get_is_sent_again_if_the_server_closes_the_connection(server, pool):
+    pool.urlopen(Request(server + "/"))
+    with pytest.raises(URLError):
+        pool.urlopen(Request(server + "/dropped"))
+    assert pool.new_connections == 2
+
+
+def test_server_is_not_reachable(pool):
+    with pytest.raises(URLError):
+        pool.urlopen(Request("http://localhost:1/"))
+
+
+def test_latency_is_measured(server, pool):
+    pool.urlopen(Request(server + "/"))
+    json = pool.toJSON()
+    assert json["latency"]["GET"]["count"] == 1
+    assert json["new_connections"] == 1
+
+
+def test_install_in_parse_rest(pool):
+    original = parse_rest.connection.urlopen
+    install_connection_pool(pool)
+    try:
+        assert parse_rest.connection.urlopen == pool.urlopen
+    finally:
+        uninstall_connection_pool()
+    assert parse_rest.connection.urlopen is original
@@ -29,6 +29,7 @@ class TestStateTransition:
         assert hardware_listener.state.is_detecting_driver_support
         @timeout
         def check_for_state_update():
+            hardware_listener.clock.advance(1)
             hardware_listener.update()
             return hardware_listener.state.could_not_detect_driver_support
         assert not hardware_listener.state.finding_hardware_changes
@@ -37,6 +38,7 @@ class TestStateTransition:
         hardware_listener.driver_support = True
         @timeout
         def check_for_state_update():
+            hardware_listener.clock.advance(1)
             hardware_listener.update()
             return hardware_listener.state.finding_hardware_changes
         assert hardware_listener.state.finding_hardware_changes
@@ -48,6 +50,7 @@ class TestStateTransition:
         @timeout
         def check_for_state_update():
             #print(hardware_listener.get_hardware(), hardware_listener.new_test_hardware)
+            hardware_listener.clock.advance(1)
             hardware_listener.update()
             return observer.new_hardware_detected.called
         observer.new_hardware_detected.assert_called_once_with(hw)
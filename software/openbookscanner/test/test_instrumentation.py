@@ -0,0 +1,56 @@
+from openbookscanner.states.instrumentation import Instrumentation, Histogram
+from openbookscanner.message import message
+from pytest import fixture
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+@fixture
+def instrumentation(m):
+    m.instrumentation = Instrumentation(Clock())
+    return m.instrumentation
+
+
+def test_histogram():
+    h = Histogram()
+    for seconds in (0.001, 0.002, 0.004, 1):
+        h.add(seconds)
+    assert h.count == 4
+    assert h.minimum == 0.001
+    assert h.maximum == 1
+    assert 0.002 <= h.percentile(50) <= 0.004
+
+
+def test_transitions_are_counted(m, instrumentation):
+    m.receive_message(message.message2())
+    m.receive_message(message.message1())
+    m.receive_message(message.message2())
+    transitions = {(t["from"], t["to"]): t["count"] for t in instrumentation.toJSON()["transitions"]}
+    assert transitions == {("State1", "State2"): 2, ("State2", "State1"): 1}
+
+
+def test_time_in_state(m, instrumentation):
+    m.receive_message(message.message2())
+    m.receive_message(message.message1())
+    times = {t["state"]: t["seconds"] for t in instrumentation.toJSON()["time_in_state"]}
+    assert times["State2"]["count"] == 1
+
+
+def test_message_handling(m, instrumentation):
+    m.receive_message(message.message1())
+    entries = instrumentation.toJSON()["message_handling"]
+    assert [(e["state"], e["message"]) for e in entries] == [("State1", "message1")]
+    assert entries[0]["seconds"]["count"] == 1
+
+
+def test_format_table(m, instrumentation):
+    m.receive_message(message.message2())
+    assert "State1 -> State2" in instrumentation.format_table()
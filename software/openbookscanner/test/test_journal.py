@@ -0,0 +1,193 @@
+from openbookscanner.journal import Journal
+from openbookscanner.update_strategy import BatchStrategy
+from parse_rest.core import ResourceRequestBadRequest
+from unittest.mock import Mock
+from pytest import fixture
+
+
+@fixture
+def path(tmpdir):
+    return str(tmpdir.join("journal.jsonl"))
+
+
+@fixture
+def journal(path):
+    return Journal(path)
+
+
+def test_empty_journal(journal):
+    assert journal.get_pending() == []
+    assert len(journal) == 0
+
+
+def test_pending_requests_are_loaded(journal, path):
+    id1 = journal.append([{"method": "PUT"}])
+    id2 = journal.append([{"method": "POST"}])
+    journal.acknowledge(id1)
+    assert Journal(path).get_pending() == [(id2, [{"method": "POST"}])]
+
+
+def test_new_ids_follow_the_loaded_ones(journal, path):
+    id1 = journal.append([])
+    assert Journal(path).append([]) > id1
+
+
+def test_incomplete_last_line_is_ignored(journal, path):
+    journal.append([1])
+    with open(path, "a") as file:
+        file.write('{"id": 2, "requ')
+    reloaded = Journal(path)
+    assert len(reloaded) == 1
+    id = reloaded.append([3])
+    assert Journal(path).get_pending() == [(1, [1]), (id, [3])]
+
+
+def test_compaction(journal, path):
+    journal.compact_after_acknowledgements = 2
+    ids = [journal.append([i]) for i in range(3)]
+    journal.acknowledge(ids[0])
+    journal.acknowledge(ids[1])
+    with open(path) as file:
+        assert len(file.readlines()) == 1
+    assert Journal(path).get_pending() == [(ids[2], [2])]
+
+
+class Operation:
+
+    def __init__(self, name):
+        self.name = name
+        self.parse_callback = Mock()
+
+    def __call__(self, batch=False):
+        return {"path": self.name}, self.parse_callback
+
+
+class NewObject:
+
+    objectId = None
+
+    def save(self, batch=False):
+        method = "PUT" if self.objectId else "POST"
+        return {"method": method, "path": "new"}, self.saved
+
+    def saved(self, response):
+        self.objectId = response.get("objectId", self.objectId)
+
+
+class TestBatchStrategyWithJournal:
+
+    @fixture
+    def now(self):
+        return [0]
+
+    @fixture
+    def s(self, journal, now):
+        s = BatchStrategy(journal=journal)
+        s.clock = lambda: now[0]
+        s.batcher = Mock()
+        s.batcher.execute.side_effect = lambda uri, method, requests: [{"success": {}} for r in requests]
+        s.new_batcher = lambda: s.batcher
+        return s
+
+    def add(self, s, name, callback=None):
+        operation = Operation(name)
+        s._batch.append((operation, callback or Mock(), name))
+        return operation
+
+    def sent(self, s):
+        return [[r["path"] for r in call[1]["requests"]] for call in s.batcher.execute.call_args_list]
+
+    def test_requests_are_sent_and_acknowledged(self, s, journal):
+        callback = Mock()
+        operation = self.add(s, "a", callback)
+        s.batch()
+        assert self.sent(s) == [["a"]]
+        assert len(journal) == 0
+        callback.assert_called_once_with()
+        operation.parse_callback.assert_called_once_with({})
+
+    def test_failed_requests_are_kept_and_retried_later(self, s, journal, now):
+        s.batcher.execute.side_effect = ConnectionError()
+        callback = Mock()
+        self.add(s, "a", callback)
+        s.batch()
+        assert len(journal) == 1
+        callback.assert_not_called()
+        s.batcher.execute.side_effect = lambda uri, method, requests: [{"success": {}} for r in requests]
+        s.batcher.execute.reset_mock()
+        self.add(s, "b")
+        s.batch()
+        # we wait for the retry
+        s.batcher.execute.assert_not_called()
+        assert len(journal) == 2
+        now[0] = s.seconds_until_first_retry
+        s.batch()
+        assert self.sent(s) == [["a"], ["b"]]
+        assert len(journal) == 0
+        callback.assert_called_once_with()
+
+    def test_backoff_doubles(self, s, now):
+        s.batcher.execute.side_effect = ConnectionError()
+        self.add(s, "a")
+        s.batch()
+        now[0] = 1
+        s.batch()
+        assert s._next_replay_at == 1 + 2
+        now[0] = 3
+        s.batch()
+        assert s._next_replay_at == 3 + 4
+
+    def test_rejected_requests_are_not_sent_again(self, s, journal):
+        s.batcher.execute.side_effect = lambda uri, method, requests: [{"error": "no"}]
+        operation = self.add(s, "a")
+        s.batch()
+        assert len(journal) == 0
+        operation.parse_callback.assert_not_called()
+
+    def test_rejected_batches_are_not_sent_again(self, s, journal):
+        s.batcher.execute.side_effect = ResourceRequestBadRequest("invalid")
+        callback = Mock()
+        operation = self.add(s, "a", callback)
+        s.batch()
+        assert len(journal) == 0
+        assert s._next_replay_at is None
+        operation.parse_callback.assert_not_called()
+        callback.assert_called_once_with()
+
+    def test_rejected_requests_are_passed_to_the_operation(self, s):
+        s.batcher.execute.side_effect = lambda uri, method, requests: [{"error": {"code": 101}}]
+        operation = self.add(s, "a")
+        operation.failed = Mock(return_value=True)
+        s.batch()
+        operation.failed.assert_called_once_with({"code": 101})
+
+    def test_requests_of_the_last_run_are_sent(self, s, path):
+        Journal(path).append([{"path": "old"}])
+        s.journal = Journal(path)
+        self.add(s, "new")
+        s.batch()
+        assert self.sent(s) == [["old"], ["new"]]
+
+    def test_an_object_is_created_once_while_the_server_is_down(self, s, journal, now):
+        s.batcher.execute.side_effect = ConnectionError()
+        obj = NewObject()
+        callbacks = [Mock() for i in range(3)]
+        s.save(obj, callbacks[0])
+        s.batch()
+        s.save(obj, callbacks[1])
+        s.batch()
+        now[0] = s.seconds_until_first_retry
+        s.save(obj, callbacks[2])
+        s.batch()
+        assert len(journal) == 1
+        assert s.get_number_of_pending_operations() == 1
+        s.batcher.execute.reset_mock()
+        s.batcher.execute.side_effect = lambda uri, method, requests: \
+            [{"success": {"objectId": "id"}} for r in requests]
+        now[0] = 100
+        s.batch()
+        methods = [[r["method"] for r in call[1]["requests"]] for call in s.batcher.execute.call_args_list]
+        assert methods == [["POST"], ["PUT"]]
+        assert len(journal) == 0
+        for callback in callbacks:
+            callback.assert_called_once_with()
@@ -0,0 +1,57 @@
+from openbookscanner.local_transport import LocalSocketTransport
+from openbookscanner.broker import ParseBroker
+from openbookscanner.message import message
+from unittest.mock import Mock
+from pytest import fixture
+import os
+import time
+
+
+@fixture
+def transport(tmpdir):
+    return LocalSocketTransport(str(tmpdir))
+
+
+@fixture
+def local_broker(transport):
+    broker = ParseBroker("test", transport=transport)
+    yield broker
+    broker.delete()
+
+
+def test_subscribers_receive_messages(local_broker, mock):
+    local_broker.subscribe(mock)
+    m = message.test(number=1)
+    local_broker.deliver_message(m)
+    local_broker.flush()
+    mock.receive_message.assert_called_once_with(m)
+
+
+def test_all_subscribers_of_a_channel_receive_the_messages(transport):
+    subscribers = [transport.create_subscriber("test") for i in range(3)]
+    mocks = [Mock() for subscriber in subscribers]
+    for subscriber, mock in zip(subscribers, mocks):
+        subscriber.subscribe(mock)
+    transport.create_publisher("test").deliver_message(message.test())
+    transport.create_publisher("other").deliver_message(message.other())
+    for subscriber, mock in zip(subscribers, mocks):
+        subscriber.flush()
+        assert [call[0][0]["name"] for call in mock.receive_message.call_args_list] == ["test"]
+
+
+def test_sockets_of_closed_subscribers_are_removed(transport):
+    subscriber = transport.create_subscriber("test")
+    subscriber._socket.close()
+    transport.create_publisher("test").deliver_message(message.test())
+    assert not os.path.exists(subscriber.path)
+
+
+def test_messages_to_a_full_subscriber_are_dropped(transport):
+    subscriber = transport.create_subscriber("test")
+    publisher = transport.create_publisher("test")
+    started = time.monotonic()
+    for i in range(1000):
+        publisher.deliver_message(message.test(text="x" * 1000))
+    assert time.monotonic() - started < 1
+    assert publisher.dropped_messages > 0
+    subscriber.delete()
@@ -0,0 +1,45 @@
+from openbookscanner.message import message, Message
+from openbookscanner.serial import message_to_serial
+import json
+
+
+def test_message_has_name_and_type():
+    m = message.test(key="value")
+    assert m["name"] == "test"
+    assert m["type"] == "message"
+    assert m["key"] == "value"
+
+
+def test_description_is_looked_up():
+    assert message.test()["description"] == message.test.__doc__
+    assert "description" not in message.test().toJSON()
+
+
+def test_messages_are_equal_to_dicts():
+    m = message.test(key="value")
+    assert m == {"name": "test", "type": "message", "key": "value",
+                 "description": message.test.__doc__}
+
+
+def test_message_is_encoded_once():
+    m = message.test(key="value")
+    assert m.encode() is m.encode()
+    assert json.loads(m.encode()) == {"name": "test", "type": "message", "key": "value"}
+
+
+def test_decode_encoded_message():
+    m = message.test(key="value")
+    assert Message.decode(m.encode()) == m
+
+
+def test_decode_ignores_the_description():
+    m = Message.decode(json.dumps({"name": "test", "description": "from the client"}))
+    assert m["description"] == message.test.__doc__
+
+
+def test_messages_have_no_instance_dict():
+    assert not hasattr(message.test(), "__dict__")
+
+
+def test_serial_uses_the_name():
+    assert message_to_serial(message.test()) == "test\r\n"
@@ -1,4 +1,8 @@
 from openbookscanner.message import message
+from openbookscanner.broker import BufferingBroker, BLOCK, DROP_OLDEST, COALESCE
+import pytest
+import threading
+import time
 
 
 def test_can_subscribe_to_broker(broker, mock):
@@ -20,3 +24,193 @@ def test_defer_messages(buffering_broker, mock):
     buffering_broker.flush()
     mock.receive_message.assert_called_once_with(m)
     
+
+def test_messages_are_delivered_in_order(buffering_broker, mock):
+    buffering_broker.subscribe(mock)
+    messages = [message.test(index=i) for i in range(5)]
+    for m in messages:
+        buffering_broker.deliver_message(m)
+    buffering_broker.flush()
+    assert [c[0][0] for c in mock.receive_message.call_args_list] == messages
+
+
+class TestSubscribeToNames:
+
+    def test_only_named_messages_are_received(self, broker, mock):
+        broker.subscribe(mock, names=["new_image"])
+        broker.deliver_message(message.test())
+        mock.receive_message.assert_not_called()
+        m = message.new_image()
+        broker.deliver_message(m)
+        mock.receive_message.assert_called_once_with(m)
+
+    def test_subscribers_are_called_in_order_of_subscription(self, broker):
+        received = []
+        class Subscriber:
+            def __init__(self, name):
+                self.name = name
+            def receive_message(self, message):
+                received.append(self.name)
+        broker.subscribe(Subscriber(1))
+        broker.subscribe(Subscriber(2), names=["test"])
+        broker.subscribe(Subscriber(3))
+        broker.subscribe(Subscriber(4), names=["other"])
+        broker.deliver_message(message.test())
+        assert received == [1, 2, 3]
+
+    def test_subscribing_to_all_messages_after_names_receives_them_once(self, broker, mock):
+        broker.subscribe(mock, names=["test"])
+        broker.subscribe(mock)
+        broker.deliver_message(message.test())
+        broker.deliver_message(message.other())
+        assert mock.receive_message.call_count == 2
+
+    def test_subscribing_to_names_after_all_messages_receives_them_once(self, broker, mock):
+        broker.subscribe(mock)
+        broker.subscribe(mock, names=["test"])
+        broker.deliver_message(message.test())
+        mock.receive_message.assert_called_once()
+
+    def test_subscribe_while_delivering(self, broker, mock):
+        class Subscriber:
+            def receive_message(self, message):
+                broker.subscribe(mock)
+        broker.subscribe(Subscriber())
+        broker.deliver_message(message.test())
+        mock.receive_message.assert_not_called()
+        broker.deliver_message(message.test())
+        mock.receive_message.assert_called_once()
+
+
+class TestBoundedBuffer:
+
+    def deliver(self, buffer, count):
+        for i in range(count):
+            buffer.deliver_message(message.test(index=i))
+
+    def received(self, mock):
+        return [c[0][0]["index"] for c in mock.receive_message.call_args_list]
+
+    def test_drop_oldest(self, mock):
+        buffer = BufferingBroker(maximum_size=3, overflow_policy=DROP_OLDEST)
+        buffer.subscribe(mock)
+        self.deliver(buffer, 5)
+        buffer.flush()
+        assert self.received(mock) == [2, 3, 4]
+        assert buffer.get_statistics()["dropped"] == 2
+
+    def test_coalesce_replaces_equal_messages(self, mock):
+        buffer = BufferingBroker(maximum_size=2, overflow_policy=COALESCE)
+        buffer.subscribe(mock)
+        self.deliver(buffer, 2)
+        buffer.deliver_message(message.test(index=1))
+        buffer.deliver_message(message.test(index=2))
+        buffer.flush()
+        assert self.received(mock) == [1, 2]
+        statistics = buffer.get_statistics()
+        assert statistics["coalesced"] == 1
+        assert statistics["dropped"] == 1
+
+    def test_block_until_flushed(self, mock):
+        buffer = BufferingBroker(maximum_size=1, overflow_policy=BLOCK)
+        buffer.subscribe(mock)
+        self.deliver(buffer, 1)
+        thread = threading.Thread(target=self.deliver, args=(buffer, 2), daemon=True)
+        thread.start()
+        thread.join(0.05)
+        assert thread.is_alive()
+        while thread.is_alive() or buffer.get_depth():
+            buffer.flush()
+        assert self.received(mock) == [0, 0, 1]
+
+    def test_the_flushing_thread_does_not_block(self, mock):
+        buffer = BufferingBroker(maximum_size=1, overflow_policy=BLOCK)
+        buffer.subscribe(mock)
+        buffer.flush()
+        self.deliver(buffer, 2)
+        buffer.flush()
+        assert self.received(mock) == [1]
+        assert buffer.get_statistics()["dropped"] == 1
+
+    def test_block_at_most_seconds_to_block(self, mock):
+        buffer = BufferingBroker(maximum_size=1, overflow_policy=BLOCK)
+        buffer.seconds_to_block = 0.05
+        buffer.subscribe(mock)
+        self.deliver(buffer, 1)
+        started = time.time()
+        buffer.deliver_message(message.test(index=1))
+        assert 0.05 <= time.time() - started < 1
+        buffer.flush()
+        assert self.received(mock) == [1]
+
+    def test_high_water_mark(self, mock):
+        buffer = BufferingBroker(high_water_mark=2)
+        buffer.register_observer(mock)
+        self.deliver(buffer, 3)
+        mock.high_water_mark_reached.assert_called_once_with(buffer)
+        buffer.flush()
+        self.deliver(buffer, 2)
+        assert mock.high_water_mark_reached.call_count == 2
+
+    def test_statistics(self, buffering_broker):
+        self.deliver(buffering_broker, 3)
+        assert buffering_broker.get_statistics()["depth"] == 3
+        buffering_broker.flush()
+        statistics = buffering_broker.get_statistics()
+        assert statistics["depth"] == 0
+        assert statistics["maximum_depth"] == 3
+        assert statistics["delivered"] == 3
+        assert statistics["maximum_latency"] >= statistics["mean_latency"] >= 0
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            BufferingBroker(overflow_policy="lose everything")
+
+
+class TestCoalesceStateChanges:
+
+    def state_changed(self, state, id=None, type="Scanner"):
+        state_machine = {"type": type, "state": {"type": state}}
+        if id is not None:
+            state_machine["id"] = id
+        return message.state_changed(state_machine=state_machine)
+
+    def states(self, mock):
+        return [(c[0][0]["state_machine"].get("id"), c[0][0]["state_machine"]["state"]["type"])
+                for c in mock.receive_message.call_args_list]
+
+    def test_only_the_latest_state_is_delivered(self, mock):
+        buffer = BufferingBroker(coalesce_state_changes=True)
+        buffer.subscribe(mock)
+        for state in ["Scanning", "WaitingToBeAvailableAgain", "AbleToScan"]:
+            buffer.deliver_message(self.state_changed(state, id=1))
+        buffer.deliver_message(self.state_changed("Scanning", id=2))
+        buffer.flush()
+        assert self.states(mock) == [(1, "AbleToScan"), (2, "Scanning")]
+        assert "transitions" not in mock.receive_message.call_args_list[0][0][0]
+
+    def test_state_changes_are_not_coalesced_by_default(self, buffering_broker, mock):
+        buffering_broker.subscribe(mock)
+        buffering_broker.deliver_message(self.state_changed("Scanning"))
+        buffering_broker.deliver_message(self.state_changed("AbleToScan"))
+        buffering_broker.flush()
+        assert len(self.states(mock)) == 2
+
+    def test_coalesce_per_flush(self, mock):
+        buffer = BufferingBroker(coalesce_state_changes=True)
+        buffer.subscribe(mock)
+        buffer.deliver_message(self.state_changed("Scanning"))
+        buffer.flush()
+        buffer.deliver_message(self.state_changed("AbleToScan"))
+        buffer.flush()
+        assert self.states(mock) == [(None, "Scanning"), (None, "AbleToScan")]
+
+    def test_transition_trail(self, mock):
+        buffer = BufferingBroker(coalesce_state_changes=True, keep_transition_trail=True)
+        buffer.subscribe(mock)
+        for state in ["Scanning", "WaitingToBeAvailableAgain", "AbleToScan"]:
+            buffer.deliver_message(self.state_changed(state))
+        buffer.flush()
+        m = mock.receive_message.call_args[0][0]
+        assert m["transitions"] == ["Scanning", "WaitingToBeAvailableAgain"]
+        assert m["state_machine"]["state"]["type"] == "AbleToScan"
@@ -0,0 +1,76 @@
+from openbookscanner.message import MessageDispatcher, message
+from unittest.mock import Mock
+
+
+class HandlerMixin:
+
+    def receive_from_mixin(self, message):
+        self.received.append(("mixin", message["name"]))
+
+
+class Dispatcher(HandlerMixin, MessageDispatcher):
+
+    def __init__(self):
+        self.received = []
+
+    def receive_test(self, message):
+        self.received.append(("test", message["name"]))
+
+
+class SubDispatcher(Dispatcher):
+
+    def receive_other(self, message):
+        self.received.append(("other", message["name"]))
+
+
+class UnknownDispatcher(Dispatcher):
+
+    def receive_unknown_message(self, message):
+        self.received.append(("unknown", message["name"]))
+
+
+def test_handlers_are_called():
+    d = Dispatcher()
+    d.receive_message(message.test())
+    d.receive_message(message.from_mixin())
+    d.receive_message(message.not_handled())
+    assert d.received == [("test", "test"), ("mixin", "from_mixin")]
+
+
+def test_handled_message_names():
+    assert Dispatcher.get_handled_message_names() == {"test", "from_mixin"}
+    assert SubDispatcher.get_handled_message_names() == {"test", "from_mixin", "other"}
+
+
+def test_subclasses_do_not_share_the_table():
+    Dispatcher.get_message_handlers()
+    d = SubDispatcher()
+    d.receive_message(message.other())
+    assert d.received == [("other", "other")]
+
+
+def test_accepts_message():
+    assert Dispatcher().accepts_message("test")
+    assert not Dispatcher().accepts_message("other")
+    assert UnknownDispatcher().accepts_message("other")
+
+
+def test_broker_skips_subscribers_which_ignore_the_message(broker):
+    d = Dispatcher()
+    d.receive_message = Mock()
+    broker.subscribe(d)
+    broker.deliver_message(message.other())
+    d.receive_message.assert_not_called()
+    broker.deliver_message(message.test())
+    d.receive_message.assert_called_once()
+
+
+def test_invalidate_after_adding_a_handler_to_a_mixin():
+    class Mixin:
+        pass
+    class D(Mixin, MessageDispatcher):
+        pass
+    assert not D().accepts_message("new")
+    Mixin.receive_new = lambda self, message: None
+    MessageDispatcher.invalidate_message_handlers()
+    assert D().accepts_message("new")
@@ -0,0 +1,175 @@
+from openbookscanner.broker import ParseLogSubscriber, ParseLogPublisher
+from openbookscanner.message import message
+from unittest.mock import Mock
+from pytest import fixture
+import datetime
+
+
+class Entry:
+
+    def __init__(self, sequence, message):
+        self.sequence = sequence
+        self.message = message.encode()
+
+
+class Cursor:
+
+    def __init__(self, sequence, updatedAt=None):
+        self.sequence = sequence
+        self.updatedAt = updatedAt or datetime.datetime.utcnow()
+
+
+class FakeLog:
+
+    def __init__(self):
+        self.entries = []
+        self.cursors = []
+        self.queries = 0
+
+    def append(self, sequence, message):
+        self.entries.append(Entry(sequence, message))
+        self.entries.sort(key=lambda entry: entry.sequence)
+
+    def get_entries_after(self, sequence_number, limit):
+        self.queries += 1
+        return [entry for entry in self.entries if entry.sequence > sequence_number][:limit]
+
+    def get_last_sequence_number(self):
+        return max([0] + [entry.sequence for entry in self.entries])
+
+    def get_entries_until(self, sequence_number, limit):
+        return [entry for entry in self.entries if entry.sequence <= sequence_number][:limit]
+
+    def new_cursor(self, sequence_number):
+        return Cursor(sequence_number)
+
+    def get_cursors(self):
+        return self.cursors
+
+
+@fixture
+def log():
+    return FakeLog()
+
+
+@fixture
+def strategy():
+    return Mock()
+
+
+@fixture
+def subscriber(log, mock, strategy):
+    subscriber = ParseLogSubscriber("test", strategy, cursor=0)
+    subscriber.log = log
+    subscriber.subscribe(mock)
+    return subscriber
+
+
+def received(mock):
+    return [call[0][0]["name"] for call in mock.receive_message.call_args_list]
+
+
+def test_nothing_to_receive_is_one_query(subscriber, log, mock):
+    subscriber.flush()
+    assert log.queries == 1
+    mock.receive_message.assert_not_called()
+
+
+def test_messages_are_received_once(subscriber, log, mock):
+    log.append(1, message.m1())
+    log.append(2, message.m2())
+    subscriber.flush()
+    subscriber.flush()
+    assert received(mock) == ["m1", "m2"]
+    assert subscriber.cursor == 2
+
+
+def test_messages_are_received_in_pages(subscriber, log, mock):
+    subscriber.page_size = 2
+    for i in range(1, 6):
+        log.append(i, message.m())
+    subscriber.flush()
+    assert len(received(mock)) == 5
+    assert log.queries == 3
+
+
+def test_wait_for_a_gap(subscriber, log, mock):
+    log.append(1, message.m1())
+    log.append(3, message.m3())
+    subscriber.flush()
+    assert received(mock) == ["m1"]
+    log.append(2, message.m2())
+    subscriber.flush()
+    assert received(mock) == ["m1", "m2", "m3"]
+
+
+def test_skip_a_gap_after_a_while(subscriber, log, mock):
+    subscriber.seconds_to_wait_for_a_gap = 0
+    log.append(2, message.m2())
+    subscriber.flush()
+    assert received(mock) == ["m2"]
+
+
+def test_cursor_is_in_the_snapshot(subscriber, log):
+    log.append(1, message.m1())
+    subscriber.flush()
+    assert subscriber.snapshot() == {"cursor": 1}
+
+
+def test_verify_moves_the_cursor_back_if_the_log_was_reset(log):
+    subscriber = ParseLogSubscriber("test", cursor=10)
+    subscriber.log = log
+    assert subscriber.verify()
+    assert subscriber.cursor == 0
+
+
+def test_the_cursor_is_saved_when_it_moves(subscriber, log, strategy):
+    subscriber.flush()
+    cursor = strategy.saveAttributes.call_args[0][0]
+    assert cursor.sequence == 0
+    subscriber.flush()
+    assert strategy.saveAttributes.call_count == 1
+    log.append(1, message.m1())
+    subscriber.flush()
+    assert strategy.saveAttributes.call_count == 2
+    assert cursor.sequence == 1
+
+
+def test_entries_up_to_the_lowest_cursor_are_deleted(subscriber, log, strategy):
+    subscriber.trim_after_messages = 3
+    log.cursors = [Cursor(2)]
+    for i in range(1, 4):
+        log.append(i, message.m())
+    subscriber.flush()
+    deleted = [call[0][0] for call in strategy.delete.call_args_list]
+    assert [entry.sequence for entry in deleted] == [1, 2]
+
+
+def test_forgotten_cursors_are_deleted(subscriber, log, strategy):
+    subscriber.trim_after_messages = 1
+    forgotten = Cursor(0, datetime.datetime.utcnow() - datetime.timedelta(days=2))
+    log.cursors = [forgotten]
+    log.append(1, message.m())
+    subscriber.flush()
+    deleted = [call[0][0] for call in strategy.delete.call_args_list]
+    assert deleted[0] is forgotten
+    assert [entry.sequence for entry in deleted[1:]] == [1]
+
+
+def test_the_cursor_is_deleted_with_the_subscriber(subscriber, strategy):
+    subscriber.flush()
+    cursor = strategy.saveAttributes.call_args[0][0]
+    subscriber.delete()
+    strategy.delete.assert_called_once_with(cursor)
+
+
+def test_publisher_saves_the_message_under_the_reserved_number(strategy):
+    publisher = ParseLogPublisher("test", strategy)
+    publisher.log = Mock()
+    publisher.deliver_message(message.m1())
+    update_strategy, callback = publisher.log.reserve_sequence_number.call_args[0]
+    assert update_strategy is strategy
+    strategy.save.assert_not_called()
+    callback(7)
+    assert publisher.log.new_entry.call_args[0][0] == 7
+    strategy.save.assert_called_once_with(publisher.log.new_entry.return_value)
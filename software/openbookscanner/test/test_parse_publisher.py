@@ -0,0 +1,82 @@
+from openbookscanner.broker import ParsePublisher, channel_subscribers_changed
+from openbookscanner.message import message
+from unittest.mock import Mock
+from pytest import fixture
+
+
+@fixture
+def holders():
+    holders = Mock()
+    holders.Query.all.return_value = ["holder1", "holder2"]
+    return holders
+
+
+@fixture
+def publisher(holders, mock):
+    publisher = ParsePublisher("TestParsePublisher", mock)
+    publisher.message_holder_class = holders
+    return publisher
+
+
+def test_messages_are_delivered_to_all_holders(publisher, mock):
+    publisher.deliver_message(message.test())
+    assert [call[0][0] for call in mock.addToArray.call_args_list] == ["holder1", "holder2"]
+
+
+def test_holders_are_cached(publisher, holders, mock):
+    for i in range(5):
+        publisher.deliver_message(message.test())
+    holders.Query.all.assert_called_once()
+    assert mock.addToArray.call_count == 10
+
+
+def test_joining_subscribers_invalidate_the_cache(publisher, holders):
+    publisher.deliver_message(message.test())
+    channel_subscribers_changed("TestParsePublisher")
+    publisher.deliver_message(message.test())
+    assert holders.Query.all.call_count == 2
+
+
+def test_holders_are_refreshed_periodically(publisher, holders):
+    publisher.seconds_between_refreshes = 0
+    publisher.deliver_message(message.test())
+    publisher.deliver_message(message.test())
+    assert holders.Query.all.call_count == 2
+
+
+def test_deleted_holders_do_not_receive_messages(publisher, holders, mock):
+    publisher.deliver_message(message.test())
+    error_callback = mock.addToArray.call_args_list[0][1]["error_callback"]
+    error_callback({"code": 101, "error": "Object not found."})
+    mock.addToArray.reset_mock()
+    publisher.deliver_message(message.test())
+    assert [call[0][0] for call in mock.addToArray.call_args_list] == ["holder2"]
+    holders.Query.all.assert_called_once()
+
+
+def test_holders_are_kept_after_other_errors(publisher, mock):
+    publisher.deliver_message(message.test())
+    mock.addToArray.call_args_list[0][1]["error_callback"]({"code": 1, "error": "Internal server error."})
+    mock.addToArray.reset_mock()
+    publisher.deliver_message(message.test())
+    assert [call[0][0] for call in mock.addToArray.call_args_list] == ["holder1", "holder2"]
+
+
+def test_cached_holders_are_used_while_the_server_can_not_be_reached(publisher, holders, mock):
+    publisher.seconds_between_refreshes = 0
+    publisher.deliver_message(message.test())
+    holders.Query.all.side_effect = ConnectionError()
+    mock.addToArray.reset_mock()
+    publisher.deliver_message(message.test())
+    assert [call[0][0] for call in mock.addToArray.call_args_list] == ["holder1", "holder2"]
+    holders.Query.all.side_effect = None
+    holders.Query.all.return_value = ["holder3"]
+    mock.addToArray.reset_mock()
+    publisher.deliver_message(message.test())
+    assert [call[0][0] for call in mock.addToArray.call_args_list] == ["holder3"]
+
+
+def test_no_holders_while_the_server_can_not_be_reached(publisher, holders, mock):
+    holders.Query.all.side_effect = ConnectionError()
+    publisher.deliver_message(message.test())
+    mock.addToArray.assert_not_called()
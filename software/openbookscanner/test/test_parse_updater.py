@@ -1,5 +1,6 @@
 from pytest import fixture, mark
 from openbookscanner.parse_update import ParseUpdater
+from openbookscanner.update_strategy import BatchStrategy
 from unittest.mock import Mock
 import json
 
@@ -25,7 +26,8 @@ class TestSavingObject:
         return ParseUpdater(obj, ss)
     
     def test_object_is_saved_at_start(self, pu, ss):
-        ss.save.assert_called_once_with(pu.parse_object)
+        ss.save.assert_called_once()
+        assert ss.save.call_args[0][0] is pu.parse_object
     
     @mark.parametrize("name,value,exists", [
         ("type", data["type"], True),
@@ -62,3 +64,93 @@ class TestSavingToParse:
         assert pu.type == self.data["type"]
         
         
+
+
+def test_observers_are_notified_after_saving(mock):
+    strategy = BatchStrategy()
+    strategy.new_batcher = Mock
+    obj = Mock()
+    obj.toJSON.return_value = {"type": "TestObserverMock"}
+    updater = ParseUpdater(obj, strategy)
+    updater.register_observer(mock)
+    obj.toJSON.return_value = {"type": "TestObserverMock", "description": "test"}
+    updater.update()
+    mock.parse_object_saved.assert_not_called()
+    strategy.batch()
+    mock.parse_object_saved.assert_called_once_with(updater)
+    assert updater.get_attributes()["description"] == "test"
+
+
+class TestChangeDetection:
+
+    @fixture
+    def obj(self):
+        obj = Mock()
+        obj.toJSON.return_value = {"type": "TestChangeDetectionMock", "description": "test",
+                                   "state": {"type": "A"}}
+        return obj
+
+    @fixture
+    def strategy(self, mock):
+        """The saves are done when they are called."""
+        mock.save.side_effect = lambda obj, callback: callback()
+        mock.saveAttributes.side_effect = lambda obj, names, callback: callback()
+        return mock
+
+    @fixture
+    def pu(self, obj, strategy):
+        pu = ParseUpdater(obj, strategy)
+        pu.parse_object.objectId = "id"
+        strategy.reset_mock()
+        return pu
+
+    def test_unchanged_object_is_not_saved(self, pu, mock):
+        pu.update()
+        mock.save.assert_not_called()
+        mock.saveAttributes.assert_not_called()
+
+    def test_only_changed_attributes_are_saved(self, pu, obj, mock):
+        obj.toJSON.return_value = {"type": "TestChangeDetectionMock", "description": "test",
+                                   "state": {"type": "B"}}
+        pu.update()
+        mock.saveAttributes.assert_called_once()
+        assert mock.saveAttributes.call_args[0][:2] == (pu.parse_object, ["json", "state"])
+
+    def test_object_without_id_is_saved_completely(self, pu, obj, mock):
+        pu.parse_object.objectId = None
+        obj.toJSON.return_value = {"type": "TestChangeDetectionMock"}
+        pu.update()
+        mock.save.assert_called_once()
+        assert mock.save.call_args[0][0] is pu.parse_object
+
+    def test_attributes_do_not_accumulate(self, pu, obj):
+        obj.toJSON.return_value = {"type": "TestChangeDetectionMock", "description": "other"}
+        pu.update()
+        assert pu.parse_object.attributes == ["description", "type"]
+
+    def test_changes_are_saved_again_until_the_save_is_done(self, pu, obj, mock):
+        mock.saveAttributes.side_effect = None
+        obj.toJSON.return_value = {"type": "TestChangeDetectionMock", "description": "other",
+                                   "state": {"type": "A"}}
+        pu.update()
+        # the save was lost
+        obj.toJSON.return_value = {"type": "TestChangeDetectionMock", "description": "other",
+                                   "state": {"type": "B"}}
+        pu.update()
+        assert mock.saveAttributes.call_args[0][:2] == (pu.parse_object, ["json", "description", "state"])
+
+    def test_changes_during_the_save_are_saved_afterwards(self, pu, obj, mock):
+        mock.saveAttributes.side_effect = None
+        obj.toJSON.return_value = {"type": "TestChangeDetectionMock", "description": "test",
+                                   "state": {"type": "B"}}
+        pu.update()
+        done = mock.saveAttributes.call_args[0][2]
+        # the state changes back while B is sent
+        obj.toJSON.return_value = {"type": "TestChangeDetectionMock", "description": "test",
+                                   "state": {"type": "A"}}
+        pu.update()
+        assert mock.saveAttributes.call_count == 1
+        assert pu.parse_object.state["type"] == "A"
+        done()
+        assert mock.saveAttributes.call_count == 2
+        assert mock.saveAttributes.call_args[0][:2] == (pu.parse_object, ["json", "state"])
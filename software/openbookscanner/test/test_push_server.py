@@ -0,0 +1,52 @@
+from openbookscanner.push_server import PushServer
+from openbookscanner.message import message
+from unittest.mock import Mock
+from pytest import fixture
+import json
+
+
+@fixture
+def server():
+    return PushServer()
+
+
+def test_messages_are_pushed(server):
+    client = server.add_client()
+    server.receive_message(message.test())
+    event = client.get_nowait()
+    assert event.startswith("event: message\ndata: ")
+    assert json.loads(event.split("data: ", 1)[1])["name"] == "test"
+
+
+def test_updates_are_pushed(server):
+    client = server.add_client()
+    updater = Mock()
+    updater.get_parse_object().objectId = "abc"
+    updater.get_attributes.return_value = {"json": "{}"}
+    server.parse_object_saved(updater)
+    data = json.loads(client.get_nowait().split("data: ", 1)[1])
+    assert data == {"objectId": "abc", "attributes": {"json": "{}"}}
+
+
+def test_slow_clients_are_disconnected(server):
+    server.maximum_queued_events = 2
+    server.add_client()
+    for i in range(3):
+        server.receive_message(message.test())
+    assert server.get_number_of_clients() == 0
+
+
+def test_stream_over_http(server):
+    http = server.app.test_client()
+    response = http.get(PushServer.EVENTS, buffered=False)
+    assert response.mimetype == "text/event-stream"
+    events = response.response
+    assert next(events).startswith(b"retry: ")
+    server.receive_message(message.test())
+    assert next(events).startswith(b"event: message\n")
+    response.close()
+
+
+def test_only_clients_on_this_computer_can_connect_by_default():
+    assert PushServer().host == "127.0.0.1"
+    assert PushServer(host="0.0.0.0").host == "0.0.0.0"
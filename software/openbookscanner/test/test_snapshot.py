@@ -0,0 +1,101 @@
+import os
+from pytest import fixture
+from openbookscanner.snapshot import SnapshotFile
+from openbookscanner.states.status import StatusStateMachine, Error
+from openbookscanner.states.scanner import ScannerListener
+from openbookscanner.storage import UserDefinedStorageLocation, DirectoryStorage
+from openbookscanner.message import message
+
+
+@fixture
+def snapshot_file(tmpdir):
+    return SnapshotFile(str(tmpdir.join("snapshot.json")))
+
+
+class TestSnapshotFile:
+
+    def test_no_snapshot(self, snapshot_file):
+        assert snapshot_file.load() is None
+
+    def test_save_and_load(self, snapshot_file):
+        snapshot_file.save({"model": "abc"})
+        assert snapshot_file.load()["model"] == "abc"
+
+    def test_broken_snapshot_is_ignored(self, snapshot_file):
+        with open(snapshot_file.path, "w") as file:
+            file.write("{\"model\": ")
+        assert snapshot_file.load() is None
+
+    def test_no_temporary_files_are_left(self, snapshot_file):
+        snapshot_file.save({"model": "abc"})
+        snapshot_file.save({"model": "def"})
+        assert os.listdir(os.path.dirname(snapshot_file.path)) == ["snapshot.json"]
+
+
+def test_status_is_restored():
+    status = StatusStateMachine()
+    status.receive_message(message.error_occurred())
+    restored = StatusStateMachine()
+    restored.restore(status.snapshot())
+    assert isinstance(restored.state, Error)
+
+
+class SupportedScannerListener(ScannerListener):
+
+    timeout_for_driver_detection = 1000
+
+    def has_driver_support(self):
+        return True
+
+    def listen_for_hardware(self):
+        pass
+
+
+def test_scanners_are_restored():
+    listener = SupportedScannerListener()
+    listener.restore({"has_driver_support": True, "hardware": [
+        {"number": "0", "device": "test:0", "type": "flatbed", "model": "X", "producer": "Y"}]})
+    assert listener.state.finding_hardware_changes
+    scanner, = listener.get_hardware()
+    assert scanner.device == "test:0"
+    assert scanner.check_if_available()
+    assert listener.snapshot()["hardware"] == [
+        {"number": "0", "device": "test:0", "type": "flatbed", "model": "X", "producer": "Y"}]
+    listener.stop()
+
+
+class Storage(UserDefinedStorageLocation):
+
+    def __init__(self, directory):
+        self.directory = directory
+        super().__init__()
+
+    def default_storage(self):
+        return DirectoryStorage(self.directory)
+
+
+def test_images_with_existing_files_are_restored(tmpdir):
+    path = str(tmpdir.join("scan.jpg"))
+    with open(path, "wb") as file:
+        file.write(b"image")
+    snapshot = {"images": [
+        {"paths": [path], "mime_type": "image/jpeg", "scanner": {"type": "Scanner"}},
+        {"paths": [str(tmpdir.join("gone.jpg"))], "mime_type": "image/jpeg", "scanner": {}}]}
+    storage = Storage(str(tmpdir.mkdir("storage")))
+    storage.restore(snapshot)
+    image, = storage.storage.files
+    assert image.path == path
+    assert image.toJSON()["scanner"] == {"type": "Scanner"}
+    assert len(os.listdir(storage.directory)) == 0
+
+
+def test_restored_images_are_not_copied_again(tmpdir):
+    path = str(tmpdir.join("scan.jpg"))
+    with open(path, "wb") as file:
+        file.write(b"image")
+    snapshot = {"images": [{"paths": [path], "mime_type": "image/jpeg", "scanner": {}}]}
+    for i in range(3):
+        storage = Storage(str(tmpdir.mkdir("storage{}".format(i))))
+        storage.restore(snapshot)
+        snapshot = storage.snapshot()
+    assert snapshot["images"][0]["paths"] == [path]
@@ -1,6 +1,30 @@
 from openbookscanner.message import message
+import threading
 import time
-from pytest import raises
+from pytest import raises, fixture
+from openbookscanner.states import TimingOut, TimedOut, State
+from openbookscanner.states.clock import VirtualClock
+from .conftest import StateMachineX, PollingStateX, ErrorPollingStateX
+
+
+@fixture
+def clock():
+    return VirtualClock()
+
+
+@fixture
+def mp(clock):
+    return StateMachineX(PollingStateX(), clock)
+
+
+@fixture
+def epm(clock):
+    return StateMachineX(ErrorPollingStateX(), clock)
+
+
+class LongTimingOut(TimingOut):
+
+    timeout_seconds = 3600
 
 class TestStateTransition:
 
@@ -45,8 +69,9 @@ class TestPollingState:
         mp.stop_polling = True
 
 
-    def test_can_exit_polling_state(self, mp):
+    def test_can_exit_polling_state(self, mp, clock):
         mp.stop_polling = True
+        clock.advance(PollingStateX.timeout)
         mp.state.wait(1)
         print(mp.state)
         print(mp.state.future)
@@ -77,3 +102,98 @@ class TestStateMachineObserver:
         
     
 
+
+class TestTimingOut:
+
+    def test_timing_out_transitions_after_the_timeout(self, clock):
+        m = StateMachineX(LongTimingOut(), clock)
+        timeout(lambda: hasattr(m.state, "start_time"))
+        clock.advance(LongTimingOut.timeout_seconds)
+        m.state.wait(1)
+        m.update()
+        assert isinstance(m.state, TimedOut)
+
+    def test_leaving_a_polling_state_stops_polling(self, mp, s1):
+        state = mp.state
+        mp.transition_into(s1)
+        state.wait(1)
+        assert not state.is_running()
+
+
+class RecordingState(State):
+
+    def __init__(self):
+        self.received = []
+
+    def receive_first(self, m):
+        self.received.append("first start")
+        self.state_machine.receive_message(message.second())
+        self.received.append("first end")
+
+    def receive_second(self, message):
+        self.received.append("second")
+
+    def receive_broken(self, message):
+        raise ValueError("broken")
+
+
+class AcceptingThird(State):
+
+    def receive_third(self, message):
+        pass
+
+
+class TransitioningState(State):
+
+    def receive_first(self, message):
+        self.accepted_third = self.state_machine.accepts_message("third")
+        self.state_machine.transition_into(AcceptingThird())
+
+
+class TestMailbox:
+
+    def test_messages_are_processed_to_completion(self):
+        state = RecordingState()
+        m = StateMachineX(state)
+        m.receive_message(message.first())
+        assert state.received == ["first start", "first end", "second"]
+        assert m.get_number_of_messages_in_the_mailbox() == 0
+
+    def test_post_message_is_processed_in_the_worker_pool(self):
+        state = RecordingState()
+        m = StateMachineX(state)
+        m.post_message(message.second())
+        timeout(lambda: state.received == ["second"])
+
+    def test_errors_of_posted_messages_are_printed(self, capsys):
+        m = StateMachineX(RecordingState())
+        m.post_message(message.broken())
+        errors = []
+        timeout(lambda: errors.append(capsys.readouterr().err) or "ValueError: broken" in "".join(errors))
+
+    def test_messages_are_accepted_while_the_mailbox_is_processed(self):
+        state = TransitioningState()
+        m = StateMachineX(state)
+        assert not m.accepts_message("third")
+        m.receive_message(message.first())
+        assert state.accepted_third
+        assert m.accepts_message("third")
+
+    def test_errors_are_raised_and_the_mailbox_is_usable_afterwards(self):
+        state = RecordingState()
+        m = StateMachineX(state)
+        with raises(ValueError):
+            m.receive_message(message.broken())
+        m.receive_message(message.second())
+        assert state.received == ["second"]
+
+    def test_messages_from_many_threads_are_all_processed(self):
+        state = RecordingState()
+        m = StateMachineX(state)
+        threads = [threading.Thread(target=lambda: [m.receive_message(message.second()) for i in range(100)])
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        timeout(lambda: len(state.received) == 400)
@@ -0,0 +1,50 @@
+from openbookscanner.states.timer import TimerService
+from pytest import fixture
+import threading
+
+
+@fixture
+def timers():
+    return TimerService()
+
+
+def test_function_is_called_after_the_delay(timers):
+    called = threading.Event()
+    timers.call_later(0.01, called.set)
+    assert called.wait(1)
+
+
+def test_timers_are_called_in_the_order_of_their_deadline(timers):
+    calls = []
+    done = threading.Event()
+    timers.call_later(0.05, lambda: (calls.append(2), done.set()))
+    timers.call_later(0.01, lambda: calls.append(1))
+    assert done.wait(1)
+    assert calls == [1, 2]
+
+
+def test_an_earlier_timer_wakes_the_service_up(timers):
+    called = threading.Event()
+    timers.call_later(100, lambda: None)
+    timers.call_later(0, called.set)
+    assert called.wait(1)
+
+
+def test_cancelled_timers_are_not_called(timers, mock):
+    done = threading.Event()
+    timer = timers.call_later(0, mock)
+    timer.cancel()
+    timers.call_later(0.01, done.set)
+    assert done.wait(1)
+    mock.assert_not_called()
+    assert timers.get_number_of_timers() == 0
+
+
+def test_the_thread_stops_when_it_has_nothing_to_do(timers):
+    timers.seconds_until_an_idle_thread_stops = 0.01
+    called = threading.Event()
+    timers.call_later(0, called.set)
+    assert called.wait(1)
+    timeout(lambda: timers._thread is None)
+    timers.call_later(0, called.clear)
+    timeout(lambda: not called.is_set())
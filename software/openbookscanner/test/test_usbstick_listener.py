@@ -1,3 +1,7 @@
+from openbookscanner.states.usbstick_listener import AsyncUSBStickListener
+from openbookscanner.states.usbstick import AsyncUSBStick, AsyncUSBStickIsMounting, Mounted, UnMounted
+import threading
+
 
 def test_zero_on_start(usle):
     assert not usle.has_new_hardware()
@@ -10,8 +14,42 @@ def test_new_hardware_notified_once(usle, mock):
     usle.print_state_changes()
     usle.register_hardware_observer(mock)
     usle.listen_for_hardware()
-    usle.update() # not thread-safe
+    # The hardware is polled on a worker thread and the updates transition.
+    timeout(lambda: usle.update() or mock.new_hardware_detected.called, seconds=3)
     usle.update()
     print(mock.new_hardware_detected.call_args_list)
     mock.new_hardware_detected.assert_called_once()
-    assert mock.new_hardware_detected.call_args[0][0].is_USBStick()
\ No newline at end of file
+    assert mock.new_hardware_detected.call_args[0][0].is_usb_stick()
+
+
+class AsyncUSBStickIsMountingX(AsyncUSBStickIsMounting):
+
+    def get_mount_command(self, tempdir):
+        return ["true"]
+
+
+class AsyncUSBStickX(AsyncUSBStick):
+
+    mounting_state = AsyncUSBStickIsMountingX
+
+
+class AsyncUSBStickListenerX(AsyncUSBStickListener):
+
+    usb_stick_class = AsyncUSBStickX
+
+    def get_block_devices(self):
+        return set(["sdx"])
+
+
+def test_async_usb_sticks_mount_on_the_loop_of_the_listener():
+    listener = AsyncUSBStickListenerX()
+    listener._block_devices = set()
+    # The hardware is listened for on a worker thread without an event loop.
+    thread = threading.Thread(target=listener.listen_for_hardware)
+    thread.start()
+    thread.join()
+    usb_stick, = listener.get_hardware()
+    assert usb_stick.loop is listener.get_event_loop()
+    assert usb_stick.loop.is_running()
+    # The stick is unmounted when the mount command does not list it.
+    timeout(lambda: isinstance(usb_stick.state, (Mounted, UnMounted)), "the mount command succeeds")
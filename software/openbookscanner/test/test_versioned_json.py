@@ -0,0 +1,62 @@
+from openbookscanner.versioned_json import VersionedJSON
+from openbookscanner.message import message
+from unittest.mock import patch
+
+
+class Counter(VersionedJSON):
+
+    def __init__(self):
+        self.count = 0
+        self.calls = 0
+
+    def toJSON(self):
+        self.calls += 1
+        return {"type": "Counter", "count": self.count}
+
+
+def test_json_is_cached():
+    c = Counter()
+    assert c.get_json() == {"type": "Counter", "count": 0}
+    c.get_json()
+    assert c.calls == 1
+
+
+def test_json_is_computed_after_a_change():
+    c = Counter()
+    c.get_json()
+    c.count = 1
+    c.json_changed()
+    assert c.get_json()["count"] == 1
+    assert c.calls == 2
+
+
+def test_delta_contains_the_changed_attributes():
+    c = Counter()
+    version, json = c.get_json_snapshot()
+    c.count = 3
+    c.json_changed()
+    delta = c.get_json_delta(version)
+    assert delta["base_version"] == version
+    assert delta["changed"] == {"count": 3}
+    assert delta["removed"] == []
+
+
+def test_delta_of_an_unknown_version_is_the_whole_json():
+    c = Counter()
+    delta = c.get_json_delta(None)
+    assert delta["base_version"] is None
+    assert delta["changed"] == {"type": "Counter", "count": 0}
+
+
+def test_state_machine_caches_json(m):
+    with patch.object(m, "toJSON", wraps=m.toJSON) as toJSON:
+        m.get_json()
+        m.get_json()
+        assert toJSON.call_count == 1
+
+
+def test_state_machine_json_changes_with_the_state(m):
+    version = m.get_json_version()
+    m.receive_message(message.message2())
+    assert m.get_json_version() != version
+    assert m.get_json()["state"]["type"] == "State2"
@@ -0,0 +1,47 @@
+from openbookscanner.states.worker_pool import WorkerPool
+from pytest import fixture, raises
+import threading
+
+
+@fixture
+def pool():
+    pool = WorkerPool(2)
+    yield pool
+    pool.shutdown()
+
+
+def test_submitted_function_returns_result(pool):
+    future = pool.submit(lambda a, b: a + b, 1, b=2)
+    assert future.result(1) == 3
+
+
+def test_errors_are_set_on_the_future(pool):
+    def fail():
+        raise RuntimeError("failed")
+    with raises(RuntimeError):
+        pool.submit(fail).result(1)
+
+
+def test_the_number_of_threads_is_bounded(pool):
+    event = threading.Event()
+    futures = [pool.submit(event.wait, 1) for i in range(5)]
+    timeout(lambda: pool.get_busy_workers() == 2, "two workers are busy")
+    assert pool.get_number_of_threads() == 2
+    assert pool.get_queue_depth() == 3
+    event.set()
+    for future in futures:
+        future.result(1)
+    timeout(lambda: pool.get_busy_workers() == 0, "all workers are done")
+    assert pool.get_queue_depth() == 0
+
+
+def test_threads_are_reused(pool):
+    for i in range(10):
+        pool.submit(lambda: None).result(1)
+    assert pool.get_number_of_threads() <= 2
+
+
+def test_can_not_submit_after_shutdown(pool):
+    pool.shutdown()
+    with raises(RuntimeError):
+        pool.submit(lambda: None)
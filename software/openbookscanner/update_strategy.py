@@ -1,5 +1,13 @@
 from parse_rest.connection import ParseBatcher
+from parse_rest.core import ParseError, ParseBatchError, ResourceRequestNotFound, ResourceRequestBadRequest, \
+    ResourceRequestLoginRequired, ResourceRequestForbidden
+from http.client import HTTPException
+from urllib.error import HTTPError
 import collections
+import collections.abc
+import threading
+import time
+import traceback
 
 class NoCallback:
 
@@ -11,6 +19,250 @@ class NoCallback:
         return self.__class__.__name__ + "()"
 
 
+class Callbacks:
+    """Call several callbacks in the order they were added."""
+
+    def __init__(self, callback):
+        """Create a list with the first callback."""
+        self.callbacks = [callback]
+
+    def add(self, callback):
+        """Also call this callback."""
+        self.callbacks.append(callback)
+
+    def __call__(self):
+        """Call all callbacks."""
+        for callback in self.callbacks:
+            callback()
+
+    def __repr__(self):
+        """String represenatation."""
+        return "{}({})".format(self.__class__.__name__, self.callbacks)
+
+
+def assert_is_list_of_objects(objects):
+    """Make sure that objects is a list of objects and not a string."""
+    # from https://stackoverflow.com/a/1952481
+    assert isinstance(objects, collections.abc.Iterable) and not isinstance(objects, str), "Please pass a list of objects."
+
+
+# http://docs.parseplatform.org/rest/guide/#error-codes
+OBJECT_NOT_FOUND = 101
+
+
+def is_object_not_found(error):
+    """Whether the error says that the object does not exist on the Parse server.
+    
+    The error is an exception or the error of an operation in a batch.
+    """
+    if isinstance(error, dict):
+        return error.get("code") == OBJECT_NOT_FOUND
+    return isinstance(error, ResourceRequestNotFound)
+
+
+# the server may accept the request later
+TOO_MANY_REQUESTS = 429
+REJECTED_REQUEST_ERRORS = (ResourceRequestBadRequest, ResourceRequestLoginRequired, ResourceRequestForbidden,
+                           ResourceRequestNotFound, ParseBatchError)
+
+
+def is_transient_error(error):
+    """Whether sending the request again may succeed.
+    
+    Connection errors and server errors are transient.
+    Requests which the Parse server rejected fail again.
+    """
+    if isinstance(error, REJECTED_REQUEST_ERRORS):
+        return False
+    if isinstance(error, HTTPError):
+        return not 400 <= error.code < 500 or error.code == TOO_MANY_REQUESTS
+    return isinstance(error, (ParseError, OSError, HTTPException))
+
+
+def get_object_key(obj):
+    """Return a key which is the same for all local copies of a parse object."""
+    object_id = getattr(obj, "objectId", None)
+    if object_id is None:
+        return id(obj)
+    return (obj.__class__.__name__, object_id)
+
+
+class ArrayOperation:
+    """Add or remove objects to or from an array of a parse object.
+    
+    This can be used with the ParseBatcher like obj.save.
+    More objects can be added to the operation until it is sent.
+    If the server rejects the operation, the error callbacks are called
+    with the error.
+    """
+    
+    ADD = "Add"
+    REMOVE = "Remove"
+    
+    def __init__(self, obj, array_name, operation):
+        """Create an empty operation on the array of the object."""
+        self.obj = obj
+        self.array_name = array_name
+        self.operation = operation
+        self.objects = []
+        self.callbacks = []
+        self.error_callbacks = []
+        self.was_applied = False
+
+    def add(self, objects, callback, error_callback=None):
+        """Include the objects in the operation."""
+        self.objects.extend(objects)
+        self.callbacks.append(callback)
+        if error_callback is not None:
+            self.error_callbacks.append(error_callback)
+
+    def discard(self, objects):
+        """Do not include the objects in this operation any more."""
+        self.objects = [o for o in self.objects if o not in objects]
+
+    def is_empty(self):
+        """Whether there is nothing to send."""
+        return not self.objects
+
+    def __call__(self, batch=False):
+        """Send the operation or return the request and callback for a batch."""
+        response = self.obj.__class__.PUT(
+            self.obj._absolute_url, batch=batch,
+            **{self.array_name: {"__op": self.operation, "objects": self.objects}})
+        if batch:
+            return response, self._update_object
+        self._update_object(response)
+
+    def _update_object(self, response=None):
+        """Change the local array of the object like the server did."""
+        self.was_applied = True
+        array = self.obj.__dict__.get(self.array_name)
+        if not isinstance(array, list):
+            return
+        if self.operation == self.ADD:
+            array.extend(self.objects)
+        else:
+            array[:] = [o for o in array if o not in self.objects]
+
+    def call_callbacks(self):
+        """The operation is done."""
+        for callback in self.callbacks:
+            callback()
+
+    def failed(self, error):
+        """The server rejected the operation.
+        
+        Return whether the error callbacks handled the error.
+        """
+        for error_callback in self.error_callbacks:
+            error_callback(error)
+        return bool(self.error_callbacks)
+
+    def __repr__(self):
+        """String representation."""
+        return "<{} {} {} to {}.{}>".format(self.__class__.__name__, self.operation,
+                                            self.objects, self.obj, self.array_name)
+
+
+class Increment:
+    """Increment a number of a parse object which exists on the server.
+    
+    This can be used with the ParseBatcher like obj.save.
+    More increments can be added to the operation until it is sent.
+    The object gets the number which the server returns.
+    Each callback is called with the number after its own increment.
+    """
+    
+    operation = "Increment"
+    
+    def __init__(self, obj, name):
+        """Create an empty increment of the named number of the object."""
+        self.obj = obj
+        self.name = name
+        self.amounts = []
+        self.callbacks = []
+        self.value = None
+    
+    def add(self, amount, callback=None):
+        """Also increment by the amount."""
+        self.amounts.append(amount)
+        self.callbacks.append(callback)
+    
+    def __call__(self, batch=False):
+        """Send the increment or return the request and callback for a batch."""
+        response = self.obj.__class__.PUT(
+            self.obj._absolute_url, batch=batch,
+            **{self.name: {"__op": "Increment", "amount": sum(self.amounts)}})
+        if batch:
+            return response, self._update_object
+        self._update_object(response)
+    
+    def _update_object(self, response):
+        """Set the number which the server returned."""
+        self.value = response[self.name]
+        setattr(self.obj, self.name, self.value)
+    
+    def call_callbacks(self):
+        """The increment is done, pass the numbers to the callbacks."""
+        if self.value is None:
+            # The server rejected the increment.
+            return
+        value = self.value - sum(self.amounts)
+        for amount, callback in zip(self.amounts, self.callbacks):
+            value += amount
+            if callback is not None:
+                callback(value)
+    
+    def __repr__(self):
+        """String representation."""
+        return "<{} {}.{} by {}>".format(self.__class__.__name__, self.obj, self.name, sum(self.amounts))
+
+
+class AttributeUpdate:
+    """Save some attributes of a parse object which exists on the server.
+    
+    This can be used with the ParseBatcher like obj.save.
+    More attributes can be added to the update until it is sent.
+    """
+    
+    def __init__(self, obj, attribute_names):
+        """Create an update of the named attributes of the object."""
+        self.obj = obj
+        self.attribute_names = list(attribute_names)
+        self.saves_all_attributes = False
+    
+    def add(self, attribute_names):
+        """Also save these attributes."""
+        for name in attribute_names:
+            if name not in self.attribute_names:
+                self.attribute_names.append(name)
+    
+    def add_all(self):
+        """Save all attributes of the object."""
+        self.saves_all_attributes = True
+    
+    def __call__(self, batch=False):
+        """Send the update or return the request and callback for a batch."""
+        if self.saves_all_attributes:
+            return self.obj.save(batch=batch)
+        response = self.obj.__class__.PUT(
+            self.obj._absolute_url, batch=batch,
+            **{name: getattr(self.obj, name) for name in self.attribute_names})
+        if batch:
+            return response, self._update_object
+        self._update_object(response)
+    
+    def _update_object(self, response):
+        """Remember when the object was updated on the server."""
+        if isinstance(response, dict) and "updatedAt" in response:
+            self.obj.updatedAt = response["updatedAt"]
+    
+    def __repr__(self):
+        """String representation."""
+        return "<{} {} of {}>".format(self.__class__.__name__,
+                                      "all" if self.saves_all_attributes else self.attribute_names, self.obj)
+
+
 class OnChangeStrategy:
     """When an object changes, it is saved asap."""
     
@@ -19,23 +271,60 @@ class OnChangeStrategy:
         obj.save()
         callback()
     
+    def saveAttributes(self, obj, attribute_names, callback=NoCallback()):
+        """Save only the named attributes of the object.
+        
+        If the object was not saved before, all attributes are saved.
+        """
+        if getattr(obj, "objectId", None) is None:
+            obj.save()
+        else:
+            AttributeUpdate(obj, attribute_names)()
+        callback()
+    
     def delete(self, obj, callback=NoCallback()):
         """Delete the object."""
         obj.delete()
         callback()
+    
+    def increment(self, obj, name, amount=1, callback=None):
+        """Increment a number of the object which exists on the server.
         
-    def addToArray(self, obj, array_name, objects, callback=NoCallback()):
-        """Add objects to a named array."""
-        # from https://stackoverflow.com/a/1952481
-        assert isinstance(objects, collections.Iterable) and not isinstance(objects, str), "Please pass a list of objects."
-        obj.addToArray(array_name, objects)
+        callback(number) is called with the number after the increment.
+        """
+        operation = Increment(obj, name)
+        operation.add(amount, callback)
+        operation()
+        operation.call_callbacks()
+        
+    def addToArray(self, obj, array_name, objects, callback=NoCallback(), error_callback=None):
+        """Add objects to a named array.
+        
+        If the server rejects the operation, error_callback(error) is called
+        instead of raising the error.
+        """
+        assert_is_list_of_objects(objects)
+        try:
+            obj.addToArray(array_name, objects)
+        except ParseError as error:
+            if error_callback is None:
+                raise
+            error_callback(error)
         callback()
     
-    def removeFromArray(self, obj, array_name, objects, callback=NoCallback()):
-        """Remove objects from a named array."""
-        # from https://stackoverflow.com/a/1952481
-        assert isinstance(objects, collections.Iterable) and not isinstance(objects, str), "Please pass a list of objects."
-        obj.removeFromArray(array_name, objects)
+    def removeFromArray(self, obj, array_name, objects, callback=NoCallback(), error_callback=None):
+        """Remove objects from a named array.
+        
+        If the server rejects the operation, error_callback(error) is called
+        instead of raising the error.
+        """
+        assert_is_list_of_objects(objects)
+        try:
+            obj.removeFromArray(array_name, objects)
+        except ParseError as error:
+            if error_callback is None:
+                raise
+            error_callback(error)
         callback()
 
     def __repr__(self):
@@ -46,42 +335,501 @@ class OnChangeStrategy:
 class BatchStrategy(OnChangeStrategy):
     """Store objects which want to be saved and save them later.
     
+    An object is saved once per batch even if save() is called several times
+    because the save sends the attributes the object has when the batch is sent.
+    
+    A batch is sent in requests of maximum_operations_per_request operations.
+    Requests which change different objects are sent in parallel.
+    
+    If a request can not be sent because the Parse server can not be reached,
+    its operations wait in the batch again.
+    
+    Call batch() to send the operations or start_flushing() to send them
+    in the background when flush_after_operations operations wait or the
+    oldest operation waited flush_after_seconds.
+    While the background flusher runs, at most maximum_pending_operations
+    can wait. More operations wait until the batch is sent.
+    
+    With a journal, the requests are written to it before they are sent.
+    If the Parse server can not be reached, the requests stay in the journal
+    and are sent again after seconds_until_first_retry, then twice as long
+    each time up to maximum_seconds_between_retries. If the server rejects
+    a whole request, it is not sent again. Meanwhile, new requests
+    are added to the journal. They are sent in order after the ones before.
+    While the request which creates an object waits in the journal,
+    the operations of the object wait in the batch so that the object
+    is not created twice. See the journal module.
+    
     https://github.com/milesrichardson/ParsePy#batch-operations
     """
     
-    def __init__(self):
+    # http://docs.parseplatform.org/rest/guide/#batch-operations
+    maximum_operations_per_request = 50
+    maximum_parallel_requests = 4
+    flush_after_operations = None
+    flush_after_seconds = None
+    maximum_pending_operations = None
+    clock = time.monotonic
+    journal = None
+    seconds_until_first_retry = 1
+    maximum_seconds_between_retries = 60
+    
+    def __init__(self, flush_after_operations=None, flush_after_seconds=None, maximum_pending_operations=None,
+                 journal=None):
         """Create a new strategy.
         
         You may want to pass this to many a ParseUpdater.
         """
         super().__init__()
-        self._batch = []
+        if journal is not None:
+            self.journal = journal
+        if flush_after_operations is not None:
+            self.flush_after_operations = flush_after_operations
+        if flush_after_seconds is not None:
+            self.flush_after_seconds = flush_after_seconds
+        if maximum_pending_operations is not None:
+            self.maximum_pending_operations = maximum_pending_operations
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._first_added_at = None
+        self._flusher = None
+        self._is_flushing = False
+        self._batch_lock = threading.Lock()
+        self._local = threading.local()
+        self._journal_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._journal_callbacks = {} # journal id -> (operations, parse callbacks, callbacks)
+        self._pending_creates = {} # object key -> journal id of the request which creates the object
+        self._retries = 0
+        self._next_replay_at = None
+        self._batch = collections.deque() # (operation, callback, object key)
+        # object key -> the operations of the object in the batch
+        self._entries = {}
+        # ids of the operations in the batch which are not sent
+        self._dropped = set()
+        # (object key, name) -> the last ArrayOperation or Increment which can take more
+        self._array_operations = {}
+        # object key -> the saves of the object in the batch
+        self._saves = {}
+        # object key -> the last save which can take more callbacks
+        self._open_saves = {}
+        self._worker_pool = None
     
     def save(self, obj, callback=NoCallback()):
-        """Save the object."""
-        self._batch.append((obj.save, callback))
+        """Save the object.
+        
+        If the object is already waiting to be saved, it is saved only once
+        and all the callbacks are called.
+        """
+        key = get_object_key(obj)
+        with self._lock:
+            self._wait_for_space()
+            self._close_array_operations(obj)
+            entry = self._open_saves.get(key)
+            if entry is None:
+                self._add_save(key, obj.save, callback)
+            else:
+                if isinstance(entry[0], AttributeUpdate):
+                    entry[0].add_all()
+                entry[1].add(callback)
+
+    def saveAttributes(self, obj, attribute_names, callback=NoCallback()):
+        """Save only the named attributes of the object.
+        
+        Updates of the same object are merged like saves.
+        If the object was not saved before, all attributes are saved.
+        """
+        if getattr(obj, "objectId", None) is None:
+            self.save(obj, callback)
+            return
+        key = get_object_key(obj)
+        with self._lock:
+            self._wait_for_space()
+            self._close_array_operations(obj)
+            entry = self._open_saves.get(key)
+            if entry is None:
+                self._add_save(key, AttributeUpdate(obj, attribute_names), callback)
+            else:
+                if isinstance(entry[0], AttributeUpdate):
+                    entry[0].add(attribute_names)
+                entry[1].add(callback)
+    
+    def _add_save(self, key, operation, callback):
+        """Add a save which can take more callbacks. The lock must be held."""
+        entry = self._open_saves[key] = (operation, Callbacks(callback), key)
+        self._saves.setdefault(key, []).append(entry)
+        self._add(entry)
 
     def delete(self, obj, callback=NoCallback()):
-        """Delete the object."""
-        self._batch.append((obj.delete, callback))
+        """Delete the object.
+        
+        The saves of the object which wait in the batch are not sent
+        and their callbacks are not called.
+        """
+        key = get_object_key(obj)
+        with self._lock:
+            self._wait_for_space()
+            self._close_array_operations(obj)
+            for entry in self._saves.pop(key, ()):
+                self._dropped.add(id(entry))
+            self._open_saves.pop(key, None)
+            self._add((obj.delete, callback, key))
+    
+    def _close_array_operations(self, obj):
+        """Array operations after this must not be merged with the ones before."""
+        key = get_object_key(obj)
+        for array_key in [array_key for array_key in self._array_operations if array_key[0] == key]:
+            del self._array_operations[array_key]
+    
+    def addToArray(self, obj, array_name, objects, callback=NoCallback(), error_callback=None):
+        """Add objects to a named array in the next batch.
+        
+        Several additions to the same array are sent as one operation.
+        If the server rejects the operation, error_callback(error) is called
+        instead of raising the error.
+        """
+        assert_is_list_of_objects(objects)
+        with self._lock:
+            self._wait_for_space()
+            self._array_operation(obj, array_name, ArrayOperation.ADD).add(list(objects), callback, error_callback)
+    
+    def removeFromArray(self, obj, array_name, objects, callback=NoCallback(), error_callback=None):
+        """Remove objects from a named array in the next batch.
+        
+        Several removals from the same array are sent as one operation.
+        Additions of these objects in the same batch are dropped
+        because the removal removes all of them.
+        """
+        assert_is_list_of_objects(objects)
+        objects = list(objects)
+        with self._lock:
+            self._wait_for_space()
+            for entry in self._entries.get(get_object_key(obj), ()):
+                operation = entry[0]
+                if isinstance(operation, ArrayOperation) and operation.operation == ArrayOperation.ADD and \
+                        operation.array_name == array_name:
+                    operation.discard(objects)
+            self._array_operation(obj, array_name, ArrayOperation.REMOVE).add(objects, callback, error_callback)
+    
+    def increment(self, obj, name, amount=1, callback=None):
+        """Increment a number of the object in the next batch.
+        
+        Several increments of the same number are sent as one operation.
+        callback(number) is called with the number after the increment.
+        """
+        with self._lock:
+            self._wait_for_space()
+            object_key = get_object_key(obj)
+            # Saves after this must not be merged with the ones before.
+            self._open_saves.pop(object_key, None)
+            key = (object_key, name)
+            operation = self._array_operations.get(key)
+            if not isinstance(operation, Increment):
+                operation = self._array_operations[key] = Increment(obj, name)
+                self._add((operation, operation.call_callbacks, object_key))
+            operation.add(amount, callback)
+    
+    def _array_operation(self, obj, array_name, operation_name):
+        """Return the operation which the objects can be merged into. The lock must be held."""
+        object_key = get_object_key(obj)
+        # Saves after this must not be merged with the ones before.
+        self._open_saves.pop(object_key, None)
+        key = (object_key, array_name)
+        operation = self._array_operations.get(key)
+        if operation is None or operation.operation != operation_name:
+            operation = self._array_operations[key] = ArrayOperation(obj, array_name, operation_name)
+            self._add((operation, operation.call_callbacks, object_key))
+        return operation
+    
+    def _add(self, entry):
+        """Add an operation to the batch. The lock must be held."""
+        was_empty = not self.get_number_of_pending_operations()
+        if was_empty:
+            self._first_added_at = self.clock()
+        self._batch.append(entry)
+        self._entries.setdefault(entry[2], []).append(entry)
+        if was_empty or self._should_flush():
+            # The flusher waits without a timeout while the batch is empty.
+            self._changed.notify_all()
+    
+    def _wait_for_space(self):
+        """Wait while too many operations are pending. The lock must be held.
+        
+        This only waits for the background flusher to send the batch
+        and not in the callbacks of the batch.
+        """
+        while self._flusher is not None and self._flusher is not threading.current_thread() and \
+                not getattr(self._local, "is_calling_back", False) and self._is_full():
+            self._changed.wait()
+    
+    def _is_full(self):
+        """Whether the maximum number of operations is pending. The lock must be held."""
+        return self.maximum_pending_operations is not None and \
+            self.get_number_of_pending_operations() >= self.maximum_pending_operations
+    
+    def get_number_of_pending_operations(self):
+        """Return the number of operations which wait to be sent."""
+        return len(self._batch) - len(self._dropped)
     
-    # TODO: implement batch requests for object add and remove.
-#    def addToArray(self, obj, key, value): 
-#        """Remove a value from the array under key."""
-#        raise NotImplementedError("If we implement this, publishing can be much faster.")
+    def _should_flush(self):
+        """Whether the operations should be sent now. The lock must be held."""
+        pending = self.get_number_of_pending_operations()
+        if not pending:
+            return False
+        if self._is_full() or self.flush_after_operations is not None and pending >= self.flush_after_operations:
+            return True
+        return self._get_seconds_until_flush() == 0
+    
+    def _get_seconds_until_flush(self):
+        """Return how long the oldest operation can still wait or None. The lock must be held."""
+        if not self.get_number_of_pending_operations() or self.flush_after_seconds is None:
+            return None
+        return max(0, self._first_added_at + self.flush_after_seconds - self.clock())
+    
+    def start_flushing(self):
+        """Send the operations in a background thread when enough of them wait or they are old enough."""
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._is_flushing = True
+            self._flusher = threading.Thread(target=self._flush_when_needed, daemon=True,
+                                             name=self.__class__.__name__ + "-flusher")
+            self._flusher.start()
+    
+    def stop_flushing(self):
+        """Stop the background thread which sends the operations."""
+        with self._lock:
+            flusher = self._flusher
+            self._is_flushing = False
+            self._changed.notify_all()
+        if flusher is not None and flusher is not threading.current_thread():
+            flusher.join()
+        with self._lock:
+            self._flusher = None
+            self._changed.notify_all()
+    
+    def _flush_when_needed(self):
+        """Send the batch when it is due until stop_flushing() is called."""
+        while True:
+            with self._lock:
+                while self._is_flushing and not self._should_flush():
+                    self._changed.wait(self._get_seconds_until_flush())
+                if not self._is_flushing:
+                    return
+            try:
+                self.batch()
+            except:
+                traceback.print_exc()
+                # Do not send the operations which were put back again right away.
+                retry_at = self.clock() + self.seconds_until_first_retry
+                with self._lock:
+                    while self._is_flushing and self.clock() < retry_at:
+                        self._changed.wait(retry_at - self.clock())
+    
+    def get_worker_pool(self):
+        """Return the pool which sends the requests in parallel."""
+        if self._worker_pool is None:
+            # The states import the brokers which import this module.
+            from .states.worker_pool import WorkerPool
+            self._worker_pool = WorkerPool(self.maximum_parallel_requests, name=self.__class__.__name__)
+        return self._worker_pool
     
     def batch(self):
-        """Perform all the stored operations."""
-        if self._batch:
-            batcher = self.new_batcher()
+        """Perform all the stored operations.
+        
+        The operations of one object are sent in the order they were added.
+        The callbacks of the operations are called when their request is done.
+        If a request fails, the requests which depend on it are not sent
+        and remain for the next batch.
+        """
+        # The operations of an object must not overtake the ones of the batch before.
+        with self._batch_lock:
+            self.replay_journal_if_due()
+            self._send_batch()
+    
+    def _send_batch(self):
+        """Send the operations of the batch."""
+        with self._lock:
+            with self._journal_lock:
+                waiting = set(self._pending_creates)
+            operations = []
+            kept = collections.deque()
             while self._batch:
-                # can send 50 operations
-                # http://docs.parseplatform.org/rest/guide/#batch-operations
-                batch, callbacks = zip(*self._batch[:50])
-                self._batch = self._batch[50:]
-                batcher.batch(list(batch))
-                for callback in callbacks:
-                    callback()
+                entry = self._batch.popleft()
+                if id(entry) not in self._dropped:
+                    (kept if entry[2] in waiting else operations).append(entry)
+            self._batch = kept
+            self._dropped = set()
+            self._entries = {}
+            for entry in kept:
+                self._entries.setdefault(entry[2], []).append(entry)
+            self._first_added_at = self.clock() if self._batch else None
+            self._array_operations = {key: operation for key, operation in self._array_operations.items()
+                                      if key[0] in waiting}
+            self._saves = {key: saves for key, saves in self._saves.items() if key in waiting}
+            self._open_saves = {key: entry for key, entry in self._open_saves.items() if key in waiting}
+            self._changed.notify_all()
+        if not operations:
+            return
+        chunks = [operations[i:i + self.maximum_operations_per_request]
+                  for i in range(0, len(operations), self.maximum_operations_per_request)]
+        if len(chunks) == 1:
+            try:
+                self._send_chunk(chunks[0])
+            except Exception as error:
+                if is_transient_error(error):
+                    self._put_back(chunks[0])
+                raise
+            return
+        pool = self.get_worker_pool()
+        futures = []
+        sent_by = {} # object key -> the future of the last request which changes the object
+        for chunk in chunks:
+            dependencies = {id(sent_by[key]): sent_by[key] for operation, callback, key in chunk if key in sent_by}
+            future = pool.submit(self._send_chunk, chunk, list(dependencies.values()))
+            futures.append(future)
+            for operation, callback, key in chunk:
+                sent_by[key] = future
+        unsent = []
+        error = None
+        for chunk, future in zip(chunks, futures):
+            try:
+                if not future.result():
+                    unsent.extend(chunk)
+            except Exception as exception:
+                if is_transient_error(exception):
+                    unsent.extend(chunk)
+                if error is None:
+                    error = exception
+        if unsent:
+            self._put_back(unsent)
+        if error is not None:
+            raise error
+    
+    def _put_back(self, operations):
+        """Send the operations in the next batch before the ones added meanwhile."""
+        with self._lock:
+            if not self.get_number_of_pending_operations():
+                self._first_added_at = self.clock()
+            self._batch.extendleft(reversed(operations))
+            entries = {}
+            for entry in operations:
+                entries.setdefault(entry[2], []).append(entry)
+            for key, operations_of_the_object in entries.items():
+                self._entries[key] = operations_of_the_object + self._entries.get(key, [])
+    
+    def _send_chunk(self, chunk, dependencies=()):
+        """Send the operations in one request after the requests they depend on.
+        
+        Return whether the request was sent.
+        """
+        for dependency in dependencies:
+            if dependency.exception() is not None or not dependency.result():
+                return False
+        entries = [(operation, key) for operation, callback, key in chunk
+                   if not (isinstance(operation, ArrayOperation) and operation.is_empty())]
+        batch = [operation for operation, key in entries]
+        callbacks = [callback for operation, callback, key in chunk]
+        if self.journal is not None:
+            self._send_with_journal(batch, callbacks, [key for operation, key in entries])
+            return True
+        if batch:
+            try:
+                self.new_batcher().batch(batch)
+            except ParseBatchError as error:
+                self._handle_rejected_operations(batch, error)
+        self._call_back(callbacks)
+        return True
+    
+    def _handle_rejected_operations(self, batch, error):
+        """Pass the errors of a batch to the error callbacks of the operations.
+        
+        The error is raised if an operation without error callbacks was rejected.
+        """
+        errors = list(error.args[0]) if error.args else []
+        # The errors are in the order of the rejected operations.
+        rejected = [operation for operation in batch
+                    if isinstance(operation, ArrayOperation) and not operation.was_applied]
+        if len(rejected) != len(errors) or not all(operation.error_callbacks for operation in rejected):
+            raise error
+        for operation, operation_error in zip(rejected, errors):
+            operation.failed(operation_error)
+    
+    def _call_back(self, callbacks):
+        """Call the callbacks of sent operations."""
+        self._local.is_calling_back = True
+        try:
+            for callback in callbacks:
+                callback()
+        finally:
+            self._local.is_calling_back = False
+    
+    def _send_with_journal(self, batch, callbacks, keys):
+        """Add the requests to the journal and send them unless we wait for a retry."""
+        requests_and_parse_callbacks = [operation(batch=True) for operation in batch]
+        with self._journal_lock:
+            id = self.journal.append([request for request, parse_callback in requests_and_parse_callbacks])
+            self._journal_callbacks[id] = (
+                batch, [parse_callback for request, parse_callback in requests_and_parse_callbacks], callbacks)
+            for key, (request, parse_callback) in zip(keys, requests_and_parse_callbacks):
+                if request.get("method") == "POST":
+                    self._pending_creates[key] = id
+        self.replay_journal_if_due()
+    
+    def replay_journal_if_due(self):
+        """Send the requests of the journal unless we wait for a retry."""
+        if self.journal is not None and len(self.journal) and \
+                (self._next_replay_at is None or self.clock() >= self._next_replay_at):
+            self.replay_journal()
+    
+    def replay_journal(self):
+        """Send the requests of the journal in order.
+        
+        Return whether all of them were sent.
+        """
+        with self._replay_lock:
+            for id, requests in self.journal.get_pending():
+                try:
+                    responses = self.send_requests(requests)
+                except Exception as error:
+                    if is_transient_error(error):
+                        self._retry_later(error)
+                        return False
+                    # Sending the same requests again is rejected again.
+                    responses = [{"error": str(error)}] * len(requests)
+                self._acknowledge(id, responses)
+            self._retries = 0
+            self._next_replay_at = None
+            return True
+    
+    def send_requests(self, requests):
+        """Send a batch of requests to the Parse server and return the responses."""
+        if not requests:
+            return []
+        return self.new_batcher().execute("", "POST", requests=requests)
+    
+    def _retry_later(self, error):
+        """The Parse server could not be reached, try again later."""
+        seconds = min(self.seconds_until_first_retry * 2 ** self._retries, self.maximum_seconds_between_retries)
+        self._retries += 1
+        self._next_replay_at = self.clock() + seconds
+        print("Could not send {} batches to the Parse server, retrying in {} seconds: {}".format(
+              len(self.journal), seconds, error))
+    
+    def _acknowledge(self, id, responses):
+        """The requests were sent, call the callbacks of their operations."""
+        with self._journal_lock:
+            self.journal.acknowledge(id)
+            operations, parse_callbacks, callbacks = self._journal_callbacks.pop(id, ((), (), ()))
+            self._pending_creates = {key: create_id for key, create_id in self._pending_creates.items()
+                                     if create_id != id}
+        failed_callbacks = [getattr(operation, "failed", None) for operation in operations]
+        for parse_callback, failed, response in zip(parse_callbacks, failed_callbacks, responses):
+            if "success" in response:
+                parse_callback(response["success"])
+            elif failed is None or not failed(response.get("error")):
+                # The server rejected the request, sending it again does not help.
+                print("The Parse server rejected a request: {}".format(response.get("error")))
+        self._call_back(callbacks)
      
     new_batcher = ParseBatcher
-
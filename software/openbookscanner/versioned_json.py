@@ -0,0 +1,90 @@
+"""This module caches the JSON representation of objects.
+
+Computing toJSON() of a state machine or the storage can be expensive.
+An object which inherits from VersionedJSON has a version number.
+It is increased with json_changed() whenever the JSON could change.
+toJSON() is only computed again if the version changed.
+
+    version, json = obj.get_json_snapshot()
+    ...
+    delta = obj.get_json_delta(version)
+
+"""
+from collections import OrderedDict
+import itertools
+import threading
+
+# Versions are unique so that changes from several threads are never lost.
+_versions = itertools.count(1)
+_snapshots_lock = threading.Lock()
+
+
+def get_json(obj):
+    """Return the JSON of an object, cached if possible."""
+    if isinstance(obj, VersionedJSON):
+        return obj.get_json()
+    return obj.toJSON()
+
+
+class VersionedJSON:
+    """Cache toJSON() until json_changed() is called.
+
+    Please do not modify the returned JSON.
+    """
+
+    _json_version = 0
+    _json_snapshots = None
+    number_of_json_snapshots_to_keep = 8
+
+    def json_changed(self):
+        """The JSON representation can be different now."""
+        object.__setattr__(self, "_json_version", next(_versions))
+
+    def get_json_version(self):
+        """Return the version of the JSON representation."""
+        return self._json_version
+
+    def get_json_snapshot(self):
+        """Return the version and the JSON representation."""
+        version = self._json_version
+        snapshots = self._get_json_snapshots()
+        json = snapshots.get(version)
+        if json is None:
+            json = self.toJSON()
+            with _snapshots_lock:
+                snapshots[version] = json
+                while len(snapshots) > self.number_of_json_snapshots_to_keep:
+                    snapshots.popitem(last=False)
+        return version, json
+
+    def _get_json_snapshots(self):
+        """Return the JSON of the last versions."""
+        snapshots = self._json_snapshots
+        if snapshots is None:
+            snapshots = OrderedDict()
+            object.__setattr__(self, "_json_snapshots", snapshots)
+        return snapshots
+
+    def get_json(self):
+        """Return the cached JSON representation."""
+        return self.get_json_snapshot()[1]
+
+    def get_json_delta(self, version=None):
+        """Return the changes of the JSON since a version.
+
+        The result is a dict with these keys:
+        - "version" is the current version.
+        - "base_version" is the version the changes refer to.
+          If it is None, the old version is unknown and "changed" contains the whole JSON.
+        - "changed" is a dict of the top level attributes which are new or differ.
+        - "removed" is a list of the top level attributes which are gone.
+        """
+        new_version, new_json = self.get_json_snapshot()
+        old_json = None if version is None else self._get_json_snapshots().get(version)
+        if old_json is None:
+            return {"version": new_version, "base_version": None,
+                    "changed": dict(new_json), "removed": []}
+        return {"version": new_version, "base_version": version,
+                "changed": {key: value for key, value in new_json.items()
+                            if key not in old_json or old_json[key] != value},
+                "removed": [key for key in old_json if key not in new_json]}